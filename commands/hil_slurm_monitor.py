@@ -7,174 +7,383 @@ Periodic Reservation Monitor
 May 2017, Tim Donahue	tdonahue@mit.edu
 """
 
-import hostlist
+import argparse
 import inspect
 import logging
+import os
+import signal
+import socket
 from os import listdir
 from os.path import realpath, dirname, isfile, join
 import sys
-from time import time, gmtime, mktime, strptime, strftime
+from time import time
 
 libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
 sys.path.append(libdir)
 
-from hil_slurm_client import hil_init, hil_reserve_nodes, hil_free_nodes
-from hil_slurm_settings import HIL_MONITOR_LOGFILE, HIL_ENDPOINT, HIL_SLURM_PROJECT
-from hil_slurm_constants import (SHOW_OBJ_TIME_FMT, HIL_RESERVE, HIL_RELEASE,
-                                 RES_CREATE_FLAGS, RES_CREATE_HIL_FEATURES,
-                                 RES_CREATE_TIME_FMT)
-from hil_slurm_helpers import (exec_scontrol_show_cmd, is_hil_reservation,
-                               parse_hil_reservation_name,
-                               create_slurm_reservation, delete_slurm_reservation,
-                               get_hil_reservations, log_hil_reservation)
+from hil_slurm_client import hil_init, hil_reserve_nodes, hil_free_nodes, node_info_cache
+from hil_slurm_settings import (HIL_MONITOR_LOGFILE, HIL_ENDPOINT, HIL_SLURM_PROJECT,
+                                HIL_RESERVATION_DEFAULT_DURATION,
+                                HIL_MONITOR_POLL_INTERVAL, HIL_MONITOR_SOCKET,
+                                HIL_MONITOR_LOCKFILE,
+                                HIL_MONITOR_MAX_CONCURRENT_RESERVATIONS,
+                                HIL_MONITOR_MAX_RESERVATIONS_PER_USER,
+                                ULSR_METRICS_ENABLE, ULSR_METRICS_HTTP_PORT,
+                                ULSR_METRICS_HTTP_ADDR,
+                                ULSR_QUEUE_ENABLE, ULSR_QUEUE_DIR, ULSR_QUEUE_MAX_ATTEMPTS,
+                                ULSR_PARTITION_SNAPSHOT_ENABLE, ULSR_PARTITION_SNAPSHOT_FILE)
+from hil_slurm_constants import (HIL_RESERVE, HIL_RELEASE,
+                                 RES_CREATE_FLAGS, RES_CREATE_HIL_FEATURES)
+from hil_slurm_helpers import (create_slurm_reservation, delete_slurm_reservation,
+                               get_hil_reservation_index, get_hil_reservations,
+                               get_partition_data,
+                               log_hil_reservation,
+                               invalidate_scontrol_cache)
+from hil_slurm_journal import (get_reservation_journal, SLURM_CREATE_RELEASE,
+                               SLURM_DELETE_RELEASE, SLURM_OP_DONE)
+from hil_slurm_metrics import (RESERVATION_NODES, RESERVATION_SECONDS, RESERVATION_FAILURES,
+                               start_http_server, write_process_metrics)
+from hil_slurm_trace import trace, span
+from hil_slurm_scheduler import ReservationScheduler, ReservationTask
+from hil_slurm_daemon import SingleInstanceLock, WakeupSocket, MonitorLockHeld
+from hil_slurm_intervals import ReservationIntervalIndex
+from hil_slurm_partitions import update_partition_snapshot
+from hil_slurm_queue import RequestQueue, QUEUE_CREATE_RESERVATION, QUEUE_DELETE_RESERVATION
+from hil_slurm_records import format_slurm_time, parse_slurm_time
 from hil_slurm_logging import log_init, log_info, log_debug, log_error
+from ulsr_ib import update_infiniband, IBLinkFailures, IB_LINK_DISABLE, IB_LINK_ENABLE
 
 
-def _process_reserve_reservations(hil_client, reserve_res_dict_list):
+def _update_ib_links(nodeset, action):
+    '''
+    Disable or enable the Infiniband links of the nodes, raising
+    IBLinkFailures if any link could not be set
+    '''
+    failures = update_infiniband(nodeset, action)
+    if failures:
+        raise IBLinkFailures(action, failures)
+
+
+def _process_reserve_reservations(hil_client, reserve_res_list, journal=None):
     '''
     Move nodes reserved in HIL reserve reservation from the HIL Slurm (loaner) project
     to the HIL free pool.
+    disable the nodes' Infiniband links.
     If successful, create the associated Slurm HIL reserve reservation
+    Progress is recorded in the journal, if any, so a failed reservation is
+    resumed by the next pass.
     '''
     n = 0
-    for reserve_res_dict in reserve_res_dict_list:
-        nodelist = hostlist.expand_hostlist(reserve_res_dict['Nodes'])
-        resname = reserve_res_dict['ReservationName']
-
-        try:
-            hil_reserve_nodes(nodelist, HIL_SLURM_PROJECT, hil_client)
-            release_resname = resname.replace(HIL_RESERVE, HIL_RELEASE, 1)
-
-            t_start_s = strftime(RES_CREATE_TIME_FMT, gmtime(time()))
-            t_end_s = reserve_res_dict['EndTime']
-            if t_start_s >= t_end_s:
-                t_end_s = strftime(RES_CREATE_TIME_FMT, 
-                                   gmtime(time() + HIL_RESERVATION_DEFAULT_DURATION))
-
-            # $$$ May want to check for pre-existing reservation with same name
-            stdout_data, stderr_data = create_slurm_reservation(release_resname,
-                                                                reserve_res_dict['Users'],
-                                                                t_start_s, t_end_s,
-                                                                nodes=reserve_res_dict['Nodes'],
-                                                                flags=RES_CREATE_FLAGS,
-                                                                features=RES_CREATE_HIL_FEATURES,
-                                                                debug=False)
-            log_hil_reservation(release_resname, stderr_data, t_start_s, t_end_s)
-            n += 1
-        except:
-            log_error('Failed to reserve nodes in HIL reservation `%s`' % resname)
+    for reserve_res in reserve_res_list:
+        resname = reserve_res.name
+        transition = journal.transition(resname) if journal else None
+        t_start = time()
+
+        with trace(resname), span('monitor.reserve', nodes=len(reserve_res.nodeset)):
+            try:
+                release_resname = resname.replace(HIL_RESERVE, HIL_RELEASE, 1)
+                if transition and (transition.slurm_op_outcome(SLURM_CREATE_RELEASE) == SLURM_OP_DONE):
+                    log_info('HIL release reservation `%s` already created' % release_resname)
+                    transition.forget()
+                    continue
+
+                hil_reserve_nodes(reserve_res.nodeset, HIL_SLURM_PROJECT, hil_client,
+                                  journal=transition)
+                _update_ib_links(reserve_res.nodeset, IB_LINK_DISABLE)
+
+                t_now = time()
+                t_end = reserve_res.t_end
+                if (t_end is None) or (t_now >= t_end):
+                    t_end = t_now + HIL_RESERVATION_DEFAULT_DURATION
+
+                t_start_s = format_slurm_time(t_now)
+                t_end_s = format_slurm_time(t_end)
+
+                # $$$ May want to check for pre-existing reservation with same name
+                stdout_data, stderr_data = create_slurm_reservation(release_resname,
+                                                                    reserve_res.users,
+                                                                    t_start_s, t_end_s,
+                                                                    nodes=reserve_res.nodes,
+                                                                    flags=RES_CREATE_FLAGS,
+                                                                    features=RES_CREATE_HIL_FEATURES,
+                                                                    debug=False)
+                if transition:
+                    transition.record_slurm_op(SLURM_CREATE_RELEASE, stderr_data)
+
+                if (len(stderr_data) == 0):
+                    log_info('Created HIL release reservation `%s`' % release_resname)
+                    if transition:
+                        transition.forget()
+                    RESERVATION_NODES.observe(len(reserve_res.nodeset), operation=HIL_RESERVE)
+                    RESERVATION_SECONDS.observe(time() - t_start, operation=HIL_RESERVE)
+                    n += 1
+                else:
+                    RESERVATION_FAILURES.inc(operation=HIL_RESERVE)
+                    log_error('Error creating HIL release reservation `%s`' % release_resname)
+                    log_error(stderr_data)
+            except:
+                RESERVATION_FAILURES.inc(operation=HIL_RESERVE)
+                log_error('Failed to reserve nodes in HIL reservation `%s`' % resname)
 
     return n
 
 
-def _process_release_reservations(hil_client, release_res_dict_list):
+def _process_release_reservations(hil_client, release_res_list, journal=None):
     '''
     Move nodes reserved in HIL release reservations back to the HIL Slurm (loaner) project,
-    then deleted the associated Slurm HIL release reservation
+    enable their Infiniband links, then deleted the associated Slurm HIL release reservation
+    Progress is recorded in the journal, if any, so a failed reservation is
+    resumed by the next pass.
     '''
     n = 0
 
-    for release_res_dict in release_res_dict_list:
-        nodelist = hostlist.expand_hostlist(release_res_dict['Nodes'])
+    for release_res in release_res_list:
+        release_resname = release_res.name
+        transition = journal.transition(release_resname) if journal else None
+        t_start = time()
+
+        with trace(release_resname), span('monitor.release', nodes=len(release_res.nodeset)):
+            # Attempt to move the node back to the Slurm loaner project
+            # If successful, delete the Slurm (HIL release) reservation
+            try:
+                if transition and (transition.slurm_op_outcome(SLURM_DELETE_RELEASE) == SLURM_OP_DONE):
+                    log_info('HIL release reservation `%s` already deleted' % release_resname)
+                    transition.forget()
+                    continue
+
+                hil_free_nodes(release_res.nodeset, HIL_SLURM_PROJECT, hil_client,
+                               journal=transition)
+                _update_ib_links(release_res.nodeset, IB_LINK_ENABLE)
+
+                stdout_data, stderr_data = delete_slurm_reservation(release_resname, debug=False)
+                if transition:
+                    transition.record_slurm_op(SLURM_DELETE_RELEASE, stderr_data)
+
+                if (len(stderr_data) == 0):
+                    log_info('Deleted HIL release reservation `%s`' % release_resname)
+                    if transition:
+                        transition.forget()
+                    RESERVATION_NODES.observe(len(release_res.nodeset), operation=HIL_RELEASE)
+                    RESERVATION_SECONDS.observe(time() - t_start, operation=HIL_RELEASE)
+                    n += 1
+                else:
+                    RESERVATION_FAILURES.inc(operation=HIL_RELEASE)
+                    log_error('Error deleting HIL release reservation `%s`' % release_resname)
+                    log_error(stderr_data)
+            except:
+                RESERVATION_FAILURES.inc(operation=HIL_RELEASE)
+                log_error('Exception deleting HIL release reservation `%s`' % release_resname)
 
-        # Attempt to move the node back to the Slurm loaner project
-        # If successful, delete the Slurm (HIL release) reservation
-        try:
-            hil_free_nodes(nodelist, HIL_SLURM_PROJECT, hil_client)
+    return n
 
-            release_resname = release_res_dict['ReservationName']
 
-            stdout_data, stderr_data = delete_slurm_reservation(release_resname, debug=False)
-            if (len(stderr_data) == 0):
-                log_info('Deleted HIL release reservation `%s`' % release_resname)
-                n += 1
-            else:
-                log_error('Error deleting HIL release reservation `%s`' % release_resname)
-                log_error(stderr_data)
-        except:
-            log_error('Exception deleting HIL release reservation `%s`' % release_resname)
+def _schedule_transitions(hil_client, release_res_list, reserve_res_list, journal=None):
+    '''
+    Process release and reserve reservations concurrently, releases first,
+    then reserves in start time order.  Reservations sharing nodes are
+    processed one after the other.
+    Returns the numbers of release and reserve reservations processed.
+    '''
+    def _task(res, priority, process_fn):
+        return ReservationTask(res.name, res.user, res.nodeset, priority,
+                               lambda: process_fn(hil_client, [res], journal))
 
-    return n
+    tasks = [_task(res, (0, res.t_start, res.name), _process_release_reservations)
+             for res in release_res_list]
+    tasks += [_task(res, (1, res.t_start, res.name), _process_reserve_reservations)
+              for res in reserve_res_list]
+
+    scheduler = ReservationScheduler(HIL_MONITOR_MAX_CONCURRENT_RESERVATIONS,
+                                     HIL_MONITOR_MAX_RESERVATIONS_PER_USER)
+    results, failures = scheduler.run(tasks)
+    for resname in sorted(failures):
+        log_error('HIL reservation `%s` not processed: %s' % (resname, failures[resname]))
+
+    release_resnames = set(res.name for res in release_res_list)
+    n_released = sum(n for resname, n in results.iteritems() if resname in release_resnames)
+    n_reserved = sum(n for resname, n in results.iteritems() if resname not in release_resnames)
+    return n_released, n_reserved
 
 
-def _find_hil_singleton_reservations(hil_reservations_dict, singleton_type):
+def _retry_queued_request(request, resname):
     '''
-    Find all reserve or release reservations which do not have a pair
-    release or reserve reservation.  These singleton reservations exist
-    during the HIL reservation creation and release processes, respectively.
+    Leave a request which scontrol rejected queued for the next pass, or
+    set it aside once it has been tried ULSR_QUEUE_MAX_ATTEMPTS times
     '''
-    singleton_reservation_dict_list = []
+    attempts = request.retry()
+    if attempts >= ULSR_QUEUE_MAX_ATTEMPTS:
+        log_error('Giving up on queued `%s` of HIL reservation `%s` after %d attempts' %
+                  (request.op, resname, attempts))
+        request.fail()
 
-    # Select the pair type based on the reservation type of interest
 
-    if (singleton_type == HIL_RESERVE):
-        pair_type = HIL_RELEASE
-    elif (singleton_type == HIL_RELEASE):
-        pair_type = HIL_RESERVE
-    else:
-        log_error('Invalid reservation type (`%s`)' % pair_type)
-        return singleton_reservation_dict_list
+def _process_queued_requests(queue):
+    '''
+    Create and delete the HIL reserve reservations requested by the prolog
+    and epilog since the last pass.  Requests are handled in arrival order,
+    against a single listing of the existing HIL reservations.
+    A request whose reservation cannot be created or deleted is left queued
+    and retried by later passes, up to ULSR_QUEUE_MAX_ATTEMPTS times.  A
+    create request whose end time has passed is set aside.
+    '''
+    requests = queue.get_all()
+    if not requests:
+        return 0
 
-    # Look for reservations which have a pair member.
-    # If any singleton reservations found, add them to the list
+    resnames = set(res.name for res in get_hil_reservations())
+    n = 0
+    for request in requests:
+        resname = request.args.get('resname')
+
+        with trace(resname), span('monitor.queue', op=request.op):
+            if request.op == QUEUE_CREATE_RESERVATION:
+                if resname in resnames:
+                    log_info('HIL reservation `%s` already exists' % resname)
+                    request.done()
+                    continue
+
+                if parse_slurm_time(request.args['t_end_s']) <= time():
+                    log_error('Queued HIL reservation `%s` ended %s before it was created' %
+                              (resname, request.args['t_end_s']))
+                    request.fail()
+                    continue
+
+                # The reservation may not start in the past
+                t_start_s = request.args['t_start_s']
+                if parse_slurm_time(t_start_s) < time():
+                    t_start_s = format_slurm_time(time())
+
+                log_info('Creating HIL reservation `%s`, ending %s' %
+                         (resname, request.args['t_end_s']))
+                stdout_data, stderr_data = create_slurm_reservation(
+                    resname, request.args['user'], t_start_s, request.args['t_end_s'],
+                    nodes=None, flags=RES_CREATE_FLAGS, features=RES_CREATE_HIL_FEATURES)
+                log_hil_reservation(resname, stderr_data)
+                if stderr_data:
+                    _retry_queued_request(request, resname)
+                    continue
+                resnames.add(resname)
+
+            elif request.op == QUEUE_DELETE_RESERVATION:
+                if resname not in resnames:
+                    log_info('HIL reservation `%s` already deleted' % resname)
+                    request.done()
+                    continue
+
+                log_info('Deleting HIL reservation `%s`' % resname)
+                stdout_data, stderr_data = delete_slurm_reservation(resname)
+                if stderr_data:
+                    log_error('Error deleting HIL reserve reservation `%s`' % resname)
+                    log_error(stderr_data)
+                    _retry_queued_request(request, resname)
+                    continue
+                log_info('Deleted  HIL reserve reservation `%s`' % resname)
+                resnames.discard(resname)
 
-    for resname, resdata_dict in hil_reservations_dict.iteritems():
-        _, restype, _, _, _ = parse_hil_reservation_name(resname)
-        if (restype == singleton_type):
-            # Check for matching reservation.
-            # If found, continue. Else add the singleton to the list.
-            if resname.replace(singleton_type, pair_type, 1) in hil_reservations_dict:
-                continue
             else:
-                singleton_reservation_dict_list.append(resdata_dict)
+                log_error('Unknown queued request `%s` for HIL reservation `%s`' %
+                          (request.op, resname))
+                request.fail()
+                continue
 
-    return singleton_reservation_dict_list
+            request.done()
+            n += 1
 
+    return n
 
-def main(argv=[]):
+
+def _hold_conflicting_reserves(hil_reservation_index, reserve_res_list):
     '''
+    Find, in one sweep over the HIL reservations, reserve reservations which
+    overlap another HIL reservation in both time and nodes, and hold them
+    back rather than move their nodes.  A reservation's own pair does not
+    conflict with it, nor does a release in progress, which the scheduler
+    completes before any reserve of its nodes.  Of two new reserve
+    reservations, the later one is held.
+    Reservations past their end time are logged.
     '''
-    log_init('hil_monitor', HIL_MONITOR_LOGFILE, logging.DEBUG)
+    pending = set(res.name for res in reserve_res_list)
+    conflicts, ended = ReservationIntervalIndex(hil_reservation_index).sweep(time())
 
-    # Look for HIL ULSR reservations.
-    # If none found, return
-    hil_reservation_dict_list = get_hil_reservations()
-    if not len(hil_reservation_dict_list):
-        return
+    for res in ended:
+        log_info('HIL reservation `%s` is past its end time' % res.name)
 
-    log_info('HIL Reservation Monitor', separator=True)
-    log_debug('')
+    def _in_progress_release(res):
+        return (res.restype == HIL_RELEASE) and (hil_reservation_index.pair(res) is None)
+
+    held = set()
+    for earlier, later in conflicts:
+        if (hil_reservation_index.pair(earlier) is later) or \
+           _in_progress_release(earlier) or _in_progress_release(later):
+            continue
+        for res, other in ((later, earlier), (earlier, later)):
+            if (res.name in pending) and (other.name not in held):
+                log_error('HIL reservation `%s` overlaps HIL reservation `%s` on nodes %s, '
+                          'not reserving' % (res.name, other.name,
+                                             res.nodeset & other.nodeset))
+                held.add(res.name)
+                break
+
+    return [res for res in reserve_res_list if res.name not in held]
+
+
+def _monitor_pass():
+    '''
+    Refresh the partition snapshot, process queued requests, then singleton
+    HIL reserve and release reservations
+    '''
+    if ULSR_PARTITION_SNAPSHOT_ENABLE:
+        partitions = get_partition_data(None)
+        if partitions:
+            update_partition_snapshot(ULSR_PARTITION_SNAPSHOT_FILE, partitions)
+
+    if ULSR_QUEUE_ENABLE:
+        n_queued = _process_queued_requests(RequestQueue(ULSR_QUEUE_DIR))
+        if n_queued:
+            log_info('HIL monitor: Processed %s queued requests' % n_queued)
+
+    # Look for HIL ULSR reservations, indexed by name components.
+    # If none found, return
 
-    # Construct a dictionary of HIL reservation data, keyed by reservation name.
-    # Values are reservation data dictionaries
+    hil_reservation_index = get_hil_reservation_index()
 
-    all_hil_reservations_dict = {}
+    # Drop journal entries of reservations deleted since they were recorded
 
-    for resdata_dict in hil_reservation_dict_list:
-        resname = resdata_dict['ReservationName']
-        all_hil_reservations_dict[resname] = resdata_dict
+    journal = get_reservation_journal()
+    if journal:
+        journal.prune(res.name for res in hil_reservation_index)
 
-    if not len(all_hil_reservations_dict):
+    if not len(hil_reservation_index):
         return
 
+    log_info('HIL Reservation Monitor', separator=True)
+    log_debug('')
+
     # Find singleton RESERVE and RELEASE reservations
     # If none found, there's nothing to do
 
-    reserve_res_dict_list = _find_hil_singleton_reservations(all_hil_reservations_dict, HIL_RESERVE)
-    release_res_dict_list = _find_hil_singleton_reservations(all_hil_reservations_dict, HIL_RELEASE)
-    if not len(reserve_res_dict_list) and not len(release_res_dict_list):
+    reserve_res_list = hil_reservation_index.singletons(HIL_RESERVE)
+    release_res_list = hil_reservation_index.singletons(HIL_RELEASE)
+    if not len(reserve_res_list) and not len(release_res_list):
         return
 
+    reserve_res_list = _hold_conflicting_reserves(hil_reservation_index, reserve_res_list)
+
     # Attempt to connect to the HIL server.
     # On failure, exit, leaving singleton reservations in place
+    # The client comes from the process-wide pool, so the daemon reuses its
+    # HIL connections from pass to pass.
 
     hil_client = hil_init()
     if not hil_client:
         log_error('Unable to connect to HIL server `%s` to process HIL reservations' % HIL_ENDPOINT)
         return
 
-    n_released = _process_release_reservations(hil_client, release_res_dict_list)
-    n_reserved = _process_reserve_reservations(hil_client, reserve_res_dict_list)
+    # HIL node information is shared by all reservations processed in this pass
+
+    with node_info_cache():
+        n_released, n_reserved = _schedule_transitions(hil_client, release_res_list,
+                                                       reserve_res_list, journal)
 
     if n_released:
         log_info('HIL monitor: Processed %s release reservations' % n_released)
@@ -183,6 +392,96 @@ def main(argv=[]):
     return
 
 
+_stop_requested = False
+
+
+def _request_stop(signum, frame):
+    global _stop_requested
+    _stop_requested = True
+
+
+def _run_daemon(poll_interval):
+    '''
+    Run monitor passes until SIGTERM or SIGINT is received.
+    A pass runs every poll_interval seconds, and as soon as the prolog or
+    epilog sends a wakeup.  A stop request received during a pass takes
+    effect once the pass is complete, so no node is left mid-transition.
+    '''
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    log_info('HIL monitor daemon started (pid %d, poll interval %s s)' %
+             (os.getpid(), poll_interval), separator=True)
+
+    metrics_httpd = None
+    if ULSR_METRICS_ENABLE and ULSR_METRICS_HTTP_PORT:
+        try:
+            metrics_httpd = start_http_server(ULSR_METRICS_HTTP_PORT, ULSR_METRICS_HTTP_ADDR)
+        except socket.error as e:
+            log_error('Unable to serve metrics on port %s: %s' % (ULSR_METRICS_HTTP_PORT, e))
+
+    with WakeupSocket(HIL_MONITOR_SOCKET) as wakeup:
+        while not _stop_requested:
+            try:
+                _monitor_pass()
+            except Exception:
+                log_error('HIL monitor pass failed')
+
+            if _stop_requested:
+                break
+
+            # Reservations changed by the prolog or epilog must be seen by
+            # the next pass, whatever the age of the cached query output
+
+            if wakeup.wait(poll_interval):
+                log_debug('HIL monitor woken by prolog / epilog')
+                invalidate_scontrol_cache('reservation')
+
+    if metrics_httpd:
+        metrics_httpd.shutdown()
+    log_info('HIL monitor daemon stopped')
+
+
+def process_args(argv):
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--daemon', action='store_true', default=False,
+                        help='Run continuously rather than once (e.g. from cron)')
+    parser.add_argument('--poll_interval', type=float, default=HIL_MONITOR_POLL_INTERVAL,
+                        help='Daemon polling interval, in seconds')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=[]):
+    '''
+    '''
+    args = process_args(argv)
+    log_init('hil_monitor', HIL_MONITOR_LOGFILE, logging.DEBUG)
+
+    # Only one monitor, daemon or cron-driven, runs at a time
+
+    try:
+        lock = SingleInstanceLock(HIL_MONITOR_LOCKFILE).acquire()
+    except MonitorLockHeld:
+        if args.daemon:
+            log_error('HIL monitor already running, lock `%s` held' % HIL_MONITOR_LOCKFILE)
+        else:
+            log_debug('HIL monitor already running, skipping this run')
+        return
+
+    try:
+        if args.daemon:
+            _run_daemon(args.poll_interval)
+        else:
+            _monitor_pass()
+            write_process_metrics('monitor')
+    finally:
+        lock.release()
+    return
+
+
 if __name__ == '__main__':
     main(sys.argv[1:])
     exit(0)
@@ -3,13 +3,15 @@
 # HIL Slurm ULSR Monitor shell script
 #
 # Runs hil_slurm_monitor.py, intended for invocation by cron(8).
+# Arguments are passed to hil_slurm_monitor.py, e.g. --daemon to run
+# the monitor continuously.
 #
 # Environment (DO NOT REMOVE THIS LINE)
 
 
 #
 source $HOME/scripts/ve/bin/activate
-python $HOME/scripts/hil_slurm_monitor.py 2>&1 >> $LOGFILE
+python $HOME/scripts/hil_slurm_monitor.py "$@" 2>&1 >> $LOGFILE
 deactivate
 
 exit 0
@@ -6,40 +6,74 @@ Slurm Control Daemon - HIL Reservation Prolog
 May 2017, Tim Donahue	tpd001@gmail.com
 """
 
-import argparse
-import hostlist
-import inspect
-import logging
 import os
 import sys
-from datetime import datetime, timedelta
-from time import strftime
 
-libdir = os.path.realpath(os.path.join(os.path.dirname(inspect.getfile(inspect.currentframe())), '../common'))
+libdir = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../common'))
 sys.path.append(libdir)
 
-from hil_slurm_helpers import (get_partition_data, get_job_data, get_object_data,
-                               exec_scontrol_cmd, exec_scontrol_show_cmd,
+from hil_slurm_constants import HIL_RESERVE, HIL_RELEASE, HIL_RESERVATION_COMMANDS
+from hil_slurm_settings import HIL_PARTITION_PREFIX
+
+# Job names acted on by the prolog and by the epilog
+
+HIL_PROLOG_COMMANDS = {'--hil_prolog': 'hil_' + HIL_RESERVE,
+                       '--hil_epilog': 'hil_' + HIL_RELEASE}
+
+
+def _is_hil_job(environ, argv):
+    '''
+    Decide from the prolog / epilog environment alone whether the job may
+    be a HIL reservation command, without running scontrol.
+    Jobs which are not are rejected before anything else is imported;
+    this runs for every job on the cluster, on slurmctld's critical path.
+    '''
+    jobname = environ.get('SLURM_JOB_NAME')
+    if jobname not in HIL_RESERVATION_COMMANDS:
+        return False
+
+    partition = environ.get('SLURM_JOB_PARTITION')
+    if not partition or not partition.startswith(HIL_PARTITION_PREFIX):
+        return False
+
+    # hil_reserve is acted on only by the prolog, hil_release by the epilog
+    for flag, command in HIL_PROLOG_COMMANDS.iteritems():
+        if flag in argv:
+            return jobname == command
+    return True
+
+
+if (__name__ == '__main__') and not _is_hil_job(os.environ, sys.argv[1:]):
+    sys.exit(0)
+
+import argparse
+import logging
+from time import time
+
+from hil_slurm_helpers import (get_partition_data, get_job_data,
+                               exec_scontrol_show_cmd, get_hil_reservation_index,
                                get_hil_reservation_name, is_hil_reservation,
-                               create_slurm_reservation, delete_slurm_reservation, 
+                               create_slurm_reservation, delete_slurm_reservation,
                                log_hil_reservation)
-from hil_slurm_constants import (SHOW_OBJ_TIME_FMT, RES_CREATE_TIME_FMT,
-                                 SHOW_PARTITION_MAXTIME_HMS_FMT,
-                                 RES_CREATE_HIL_FEATURES,
-                                 HIL_RESERVE, HIL_RELEASE,
-                                 HIL_RESERVATION_COMMANDS,
-                                 RES_CREATE_FLAGS)
+from hil_slurm_records import format_slurm_time, parse_slurm_time
+from hil_slurm_nodeset import NodeSet
+from hil_slurm_intervals import ReservationIntervalIndex
+from hil_slurm_partitions import hil_partition_problems, load_partition_snapshot
+from hil_slurm_daemon import notify_monitor
+from hil_slurm_queue import RequestQueue, QUEUE_CREATE_RESERVATION, QUEUE_DELETE_RESERVATION
+from hil_slurm_metrics import write_process_metrics
+from hil_slurm_trace import trace, span, set_trace_id
+from hil_slurm_constants import RES_CREATE_HIL_FEATURES, RES_CREATE_FLAGS
 from hil_slurm_logging import log_init, log_info, log_debug, log_error
-from hil_slurm_settings import (HIL_PARTITION_PREFIX,
-                                RES_CHECK_DEFAULT_PARTITION,
-                                RES_CHECK_EXCLUSIVE_PARTITION,
-                                RES_CHECK_SHARED_PARTITION,
-                                RES_CHECK_PARTITION_STATE,
+from hil_slurm_settings import (RES_CHECK_OVERLAP,
                                 HIL_RESERVATION_DEFAULT_DURATION,
                                 HIL_RESERVATION_GRACE_PERIOD,
                                 HIL_SLURMCTLD_PROLOG_LOGFILE,
-                                HIL_ENDPOINT,
-                                HIL_SLURM_PROJECT)
+                                HIL_MONITOR_SOCKET,
+                                ULSR_QUEUE_ENABLE, ULSR_QUEUE_DIR,
+                                ULSR_PARTITION_SNAPSHOT_ENABLE,
+                                ULSR_PARTITION_SNAPSHOT_FILE,
+                                ULSR_PARTITION_SNAPSHOT_MAX_AGE)
 
 
 def _get_prolog_environment():
@@ -58,48 +92,36 @@ def _get_prolog_environment():
     return {env_var: os.environ.get(slurm_env_var) for env_var, slurm_env_var in env_map.iteritems()}
 
 
-def _check_hil_partition(env_dict, pdata_dict):
+def _get_partition(partition_name):
     '''
-    Check if the partition exists and, if so, is properly named
-    Retrieve partition data via 'scontrol show'
+    Return the partition record and its HIL eligibility problems, from the
+    partition snapshot written by the monitor if it is current, otherwise
+    via 'scontrol show'.  Returns (None, None) if the partition is not found.
     '''
-    status = True
-
-    pname = pdata_dict['PartitionName']
-    if not pname.startswith(HIL_PARTITION_PREFIX):
-        log_info('Partition name `%s` does not match `%s*`' %
-                 (pname, HIL_PARTITION_PREFIX))
-        status = False
-
-    # Verify the partition state is UP
-
-    if RES_CHECK_PARTITION_STATE:
-        if (pdata_dict['State'] != 'UP'):
-            log_info('Partition `%s` state (`%s`) is not UP' %
-                     (pname, pdata_dict['State']))
-            status = False
-
-    # Verify the partition is not the default partition
+    if ULSR_PARTITION_SNAPSHOT_ENABLE:
+        snapshot = load_partition_snapshot(ULSR_PARTITION_SNAPSHOT_FILE,
+                                           ULSR_PARTITION_SNAPSHOT_MAX_AGE)
+        if snapshot and (partition_name in snapshot):
+            return snapshot[partition_name]
 
-    if RES_CHECK_DEFAULT_PARTITION:
-        if (pdata_dict['Default'] == 'YES'):
-            log_info('Partition `%s` is the default partition, cannot be used for HIL' % pname)
-            status = False
+    partition_list = get_partition_data(partition_name)
+    if not partition_list:
+        return None, None
+    return partition_list[0], None
 
-    # Verify the partition is not shared by checking 'Shared' and
-    # 'ExclusiveUser' attributes
 
-    if RES_CHECK_SHARED_PARTITION:
-        if (pdata_dict['Shared'] != 'NO'):
-            log_info('Partition `%s` is shared, cannot be used for HIL' % pname)
-            status = False
-
-    if RES_CHECK_EXCLUSIVE_PARTITION:
-        if (pdata_dict['ExclusiveUser'] != 'YES'):
-            log_info('Partition `%s` not exclusive to `%s`, cannot be used for HIL' % (pname, env_dict['username']))
-            status = False
+def _check_hil_partition(env_dict, partition, problems=None):
+    '''
+    Check if the partition exists and, if so, is properly named
+    Partition data is retrieved via 'scontrol show' or the partition snapshot,
+    which carries the result of the checks
+    '''
+    if problems is None:
+        problems = hil_partition_problems(partition)
 
-    return status
+    for problem in problems:
+        log_info(problem)
+    return not problems
 
 
 def _check_hil_command(env_dict):
@@ -114,7 +136,7 @@ def _check_hil_command(env_dict):
         return None
 
 
-def _get_hil_reservation_times(env_dict, pdata_dict, jobdata_dict):
+def _get_hil_reservation_times(env_dict, partition, job):
     '''
     Calculate the start time and end time of the reservation
     Start time:
@@ -127,78 +149,34 @@ def _get_hil_reservation_times(env_dict, pdata_dict, jobdata_dict):
           set the reservation end time to either the partition MaxTime,
           if defined, or the HIL default maximum time.
     '''
-    t_job_start_s = jobdata_dict['StartTime']
-    t_job_end_s = jobdata_dict['EndTime']
-#   log_debug('Job start %s  Job end %s' % (t_job_start_s, t_job_end_s))
-
-    t_start_dt = datetime.strptime(t_job_start_s, SHOW_OBJ_TIME_FMT)
+    t_start = job.t_start if job.t_start is not None else time()
 
-    if 'Unknown' not in t_job_end_s:
+    if job.t_end is not None:
         log_debug('Using job end time for reservation')
         # Job has a defined end time.  Use it.
-        t_end_dt = datetime.strptime(t_job_end_s, SHOW_OBJ_TIME_FMT)
-        t_end_dt += timedelta(seconds=HIL_RESERVATION_GRACE_PERIOD)
-
-    else:
-        # Job does not have a defined end time.  See if there's a time limit.
+        t_end = job.t_end + HIL_RESERVATION_GRACE_PERIOD
 
-        if 'UNLIMITED' in jobdata_dict['TimeLimit']:
+    elif job.time_limit is not None:
+        # Job has a time limit but no end time yet.  Use the limit.
+        log_debug('Using job time limit to calculate reservation end time')
+        t_end = t_start + job.time_limit + HIL_RESERVATION_GRACE_PERIOD
 
-            # Job does not have a time limit. See if the partition has a
-            # max time.  If so, use that. If not, use the HIL default duration.
+    elif partition.max_time is not None:
+        # Job does not have a time limit, but the partition has a max time.
+        log_debug('Using partition time limit to calculate reservation end time')
+        t_end = t_start + partition.max_time
 
-            p_max_time_s = pdata_dict['MaxTime']
-            log_debug('Partition MaxTime is %s' % p_max_time_s)
-            if 'UNLIMITED' in p_max_time_s:
-
-                # Partition does not have a max time, use HIL default.
-                log_debug('No job or partition time limit, using HIL default reservation duration')
-                t_end_dt = (t_start_dt +
-                            timedelta(seconds=HIL_RESERVATION_DEFAULT_DURATION))
-
-            else:
-
-                # Partition has a max time, parse it. Output format is [days-]H:M:S.
-                log_debug('Using partition time limit to calculate reservation end time')
-                d_hms = p_max_time_s.split('-')
-                if (len(d_hms) == 1):
-                    p_max_hms_dt = datetime.strptime(d_hms[0],
-                                                     SHOW_PARTITION_MAXTIME_HMS_FMT)
-                    p_max_timedelta = timedelta(hours=p_max_hms_dt.hour,
-                                                minutes=p_max_hms_dt.minute,
-                                                seconds=p_max_hms_dt.second)
-                elif (len(d_hms) == 2):
-                    # Days field is present
-                    p_max_days_timedelta = datetime.timedelta(days=int(d_hms[0]))
-
-                    p_max_hms_dt = datetime.strptime(d_hms[1],
-                                                     SHOW_PARTITION_MAXTIME_HMS_FMT)
-                    p_max_hms_timedelta = timedelta(hours=p_max_hms_dt.hour,
-                                                    minutes=p_max_hms_dt.minute,
-                                                    seconds=p_max_hms_dt.second)
-                    p_max_timedelta = p_max_days_timedelta + p_max_hms_timedelta
-                    log_debug(p_max_timedelta)
-                    t_end_dt = t_start_dt + p_max_timedelta
-                else:
-                    log_error('Cannot parse partition MaxTime (`%s`)' % p_max_time_s)
-        else:
-            # Job has a time limit. Use it.
-            # $$$ FIX
-            log_debug('Job has a time limit! Unsupported!')
-            pass
+    else:
+        # Neither has a time limit, use HIL default.
+        log_debug('No job or partition time limit, using HIL default reservation duration')
+        t_end = t_start + HIL_RESERVATION_DEFAULT_DURATION
 
-    # We now have a defined reservation t_start and t_end in datetime format.
+    # We now have a defined reservation t_start and t_end in epoch seconds.
     # Convert to strings and return.
-    t_start_s = t_start_dt.strftime(RES_CREATE_TIME_FMT)
-    t_end_s = t_end_dt.strftime(RES_CREATE_TIME_FMT)
-
-    # log_debug('Start time %s' % t_start_s)
-    # log_debug('End time %s' % t_end_s)
-
-    return t_start_s, t_end_s
+    return format_slurm_time(t_start), format_slurm_time(t_end)
 
 
-def _create_hil_reservation(restype_s, t_start_s, t_end_s, env_dict, pdata_dict, jobdata_dict):
+def _create_hil_reservation(restype_s, t_start_s, t_end_s, env_dict, partition, job):
     '''
     Create a HIL reservation
     '''
@@ -221,7 +199,7 @@ def _create_hil_reservation(restype_s, t_start_s, t_end_s, env_dict, pdata_dict,
     return resname, stderr_data
 
 
-def _delete_hil_reservation(env_dict, pdata_dict, jobdata_dict, resname):
+def _delete_hil_reservation(env_dict, partition, job, resname):
     '''
     Delete a HIL reservation after validating HIL name prefix and owner name
     The latter restricts 'hil_release' of a reservation to the owner
@@ -238,7 +216,48 @@ def _delete_hil_reservation(env_dict, pdata_dict, jobdata_dict, resname):
         return None, 'hil_release: error: Invalid reservation name'
 
 
-def _hil_reserve_cmd(env_dict, pdata_dict, jobdata_dict):
+def _check_hil_overlap(resname, job, t_start_s, t_end_s):
+    '''
+    Reject a reserve request overlapping, in time and nodes, an existing HIL
+    reservation other than a release in progress.  The nodes checked are
+    those allocated to the hil_reserve job, which the reservation holds.
+    '''
+    if not job.nodes:
+        return True
+
+    hil_reservation_index = get_hil_reservation_index()
+    release_resname = resname.replace(HIL_RESERVE, HIL_RELEASE, 1)
+    nodeset = NodeSet(job.nodes)
+
+    conflicts = [res for res in ReservationIntervalIndex(hil_reservation_index).conflicts(
+                     nodeset, parse_slurm_time(t_start_s), parse_slurm_time(t_end_s),
+                     ignore=(resname, release_resname))
+                 if (res.restype != HIL_RELEASE) or hil_reservation_index.pair(res)]
+
+    for res in conflicts:
+        log_error('HIL reservation `%s` would overlap HIL reservation `%s` on nodes %s' %
+                  (resname, res.name, nodeset & res.nodeset))
+    return not conflicts
+
+
+def _queue_hil_request(op, resname, **args):
+    '''
+    Queue a reservation request for the HIL monitor and wake it.
+    Returns False if the request could not be queued, in which case the
+    caller handles it synchronously.
+    '''
+    try:
+        RequestQueue(ULSR_QUEUE_DIR).put(op, resname=resname, **args)
+    except (IOError, OSError) as e:
+        log_error('Unable to queue `%s` of HIL reservation `%s`: %s' % (op, resname, e))
+        return False
+
+    log_info('Queued `%s` of HIL reservation `%s`' % (op, resname))
+    notify_monitor(HIL_MONITOR_SOCKET)
+    return True
+
+
+def _hil_reserve_cmd(env_dict, partition, job):
     '''
     Runs in Slurm control daemon prolog context
 
@@ -247,29 +266,50 @@ def _hil_reserve_cmd(env_dict, pdata_dict, jobdata_dict):
     reservation.
 
     Reservation start and end times may overlap so long as the MAINT flag is set
+
+    If the request queue is enabled, the request is queued and the HIL monitor
+    creates the reservation.
     '''
-    t_start_s, t_end_s = _get_hil_reservation_times(env_dict, pdata_dict, jobdata_dict)
+    t_start_s, t_end_s = _get_hil_reservation_times(env_dict, partition, job)
+
+    resname = get_hil_reservation_name(env_dict, HIL_RESERVE, t_start_s)
+    set_trace_id(resname)
+
+    if RES_CHECK_OVERLAP and not _check_hil_overlap(resname, job, t_start_s, t_end_s):
+        return False
+
+    if ULSR_QUEUE_ENABLE:
+        if _queue_hil_request(QUEUE_CREATE_RESERVATION, resname,
+                              user=env_dict['username'], t_start_s=t_start_s,
+                              t_end_s=t_end_s, job_id=env_dict['job_id']):
+            return
 
     resname, stderr_data = _create_hil_reservation(HIL_RESERVE, t_start_s, t_end_s,
-                                                   env_dict, pdata_dict, jobdata_dict)
+                                                   env_dict, partition, job)
+    set_trace_id(resname)
     log_hil_reservation(resname, stderr_data, t_start_s, t_end_s)
 
+    # Wake the HIL monitor daemon, if running, to reserve the nodes
+    if not stderr_data:
+        notify_monitor(HIL_MONITOR_SOCKET)
+
 
-def _hil_release_cmd(env_dict, pdata_dict, jobdata_dict):
+def _hil_release_cmd(env_dict, partition, job):
     '''
     Runs in Slurm control daemon epilog context
 
     Delete the reserve reservation in which the release job was run.
     - Verify the reservation is a HIL reserve reservation
     - Verify the reservation is owned by the user
-    - Get reserve reservation data via 'scontrol'
     - Delete the reserve reservation in which the hil_release command was run
 
     Release reservation will be deleted later by the HIL reservation monitor
+    If the request queue is enabled, the monitor also deletes the reserve reservation
     '''
-    reserve_resname = jobdata_dict['Reservation']
+    reserve_resname = job.reservation
 
     if reserve_resname:
+        set_trace_id(reserve_resname)
         if not is_hil_reservation(reserve_resname, HIL_RESERVE):
             log_error('Reservation `%s` is not a HIL reserve reservation' %
                       reserve_resname)
@@ -279,21 +319,24 @@ def _hil_release_cmd(env_dict, pdata_dict, jobdata_dict):
                       (reserve_resname, env_dict['username']))
         else:
             # Basic validation done
-            # Get reserve reservation data
-            reserve_rdata = get_object_data('reservation', reserve_resname)[0]
-
             # Delete the reserve reservation
-            stdout_data, stderr_data = _delete_hil_reservation(env_dict, pdata_dict,
-                                                               jobdata_dict, reserve_resname)
+            if ULSR_QUEUE_ENABLE and \
+               _queue_hil_request(QUEUE_DELETE_RESERVATION, reserve_resname):
+                return
+
+            stdout_data, stderr_data = _delete_hil_reservation(env_dict, partition,
+                                                               job, reserve_resname)
             if (len(stderr_data) == 0):
                 log_info('Deleted  HIL reserve reservation `%s`' % reserve_resname)
+
+                # Wake the HIL monitor daemon, if running, to release the nodes
+                notify_monitor(HIL_MONITOR_SOCKET)
             else:
                 log_error('Error deleting HIL reserve reservation `%s`' % reserve_resname)
                 log_error(stderr_data)
 
     else:
-        log_error('No reservation name specified to `%s` command' %
-                  jobdata_dict['JobName'])
+        log_error('No reservation name specified to `%s` command' % job.name)
 
 
 def process_args():
@@ -333,16 +376,18 @@ def main(argv=[]):
         log_debug('Missing Slurm control daemon prolog / epilog environment.')
         return False
 
-    pdata_dict = get_partition_data(env_dict['partition'])[0]
-    jobdata_dict = get_job_data(env_dict['job_id'])[0]
+    partition, partition_problems = _get_partition(env_dict['partition'])
+    job_list = get_job_data(env_dict['job_id'])
 
-    if not pdata_dict or not jobdata_dict:
-        log_debug('One of pdata_dict, jobdata_dict, or env_dict is empty')
-        log_debug('Job data', jobdata_dict)
-        log_debug('P   data', pdata_dict)
+    if not partition or not job_list:
+        log_debug('One of partition data, job data, or env_dict is empty')
+        log_debug('Job data %s' % job_list)
+        log_debug('P   data %s' % partition)
         return False
 
-    if not _check_hil_partition(env_dict, pdata_dict):
+    job = job_list[0]
+
+    if not _check_hil_partition(env_dict, partition, partition_problems):
         return False
 
     # Verify the command is a HIL command.  If so, process it.
@@ -357,19 +402,23 @@ def main(argv=[]):
         if (hil_cmd == 'hil_reserve'):
             log_info('HIL Slurmctld Prolog', separator=True)
             log_debug('Processing reserve request')
-            status = _hil_reserve_cmd(env_dict, pdata_dict, jobdata_dict)
+            status = _hil_reserve_cmd(env_dict, partition, job)
 
     elif args.hil_epilog:
         if (hil_cmd == 'hil_release'):
             log_info('HIL Slurmctld Epilog', separator=True)
             log_debug('Processing release request')
-            status = _hil_release_cmd(env_dict, pdata_dict, jobdata_dict)
+            status = _hil_release_cmd(env_dict, partition, job)
 
     return status
 
 
 if __name__ == '__main__':
-    main(sys.argv[1:])
+    try:
+        with trace(), span('hil_slurmctld_prolog', args=' '.join(sys.argv[1:])):
+            main(sys.argv[1:])
+    finally:
+        write_process_metrics('prolog')
     exit(0)
 
 # EOF
@@ -4,28 +4,120 @@ User Level Slurm Reservations (ULSR)
 
 Periodic Network Audit
 
+Compares the HIL reservations in Slurm with the HIL project and NIC
+networks of the nodes of the HIL partitions and of the reservations, and
+writes a JSON report of the differences.  Intended to be run from cron(8),
+by ulsr_audit.sh.
+
+Only nodes whose HIL reservations changed, or whose last observed state
+is stale, are queried in HIL, except on a full sweep, which runs every
+ULSR_AUDIT_FULL_INTERVAL seconds or when --full is given.
+
+    python ulsr_audit.py
+    python ulsr_audit.py --nodes 'server[1-64]' --report -
+    python ulsr_audit.py --full
+
+Exits with status 1 if any differences were found.
+
 November 2017, Tim Donahue	tdonahue@mit.edu
 """
 
-from hil_slurm_settings import ULSR_NET_AUDIT_LOGFILE
+import argparse
+import inspect
+import logging
+import sys
+from os.path import realpath, dirname, join
+from time import time
 
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_settings import (ULSR_NET_AUDIT_LOGFILE, ULSR_AUDIT_REPORT_FILE,
+                                ULSR_AUDIT_CONCURRENCY, ULSR_AUDIT_GRACE_PERIOD,
+                                ULSR_AUDIT_SNAPSHOT_FILE, ULSR_AUDIT_MAX_STALENESS,
+                                ULSR_AUDIT_FULL_INTERVAL, HIL_SLURM_PROJECT)
+from hil_slurm_audit import (node_state, hil_partition_nodes, audit_nodes, audit_diff,
+                             audit_report, write_audit_report, reservation_memberships,
+                             AuditSnapshot)
+from hil_slurm_client import hil_init, hil_node_states
+from hil_slurm_helpers import get_hil_reservations, get_partition_data
+from hil_slurm_nodeset import NodeSet
 from hil_slurm_logging import log_init, log_info, log_debug, log_error
 
 
+def process_args(argv):
+    parser = argparse.ArgumentParser(description='Audit HIL node state against '
+                                     'HIL reservations in Slurm')
+    parser.add_argument('--nodes', default='',
+                        help='nodes to audit in addition to those of the HIL partitions '
+                        'and reservations, in hostlist syntax')
+    parser.add_argument('--report', default=ULSR_AUDIT_REPORT_FILE,
+                        help="report file, or '-' for stdout")
+    parser.add_argument('--concurrency', type=int, default=ULSR_AUDIT_CONCURRENCY,
+                        help='number of HIL nodes queried at a time')
+    parser.add_argument('--full', action='store_true', default=False,
+                        help='query every node, rather than only changed or stale nodes')
+    parser.add_argument('--snapshot', default=ULSR_AUDIT_SNAPSHOT_FILE,
+                        help='audit snapshot file')
+    return parser.parse_args(argv)
+
+
 def main(argv=[]):
     '''
+    Run one audit and write its report
     '''
+    args = process_args(argv)
     log_init('ULSR_network_audit', ULSR_NET_AUDIT_LOGFILE, logging.DEBUG)
 
     log_info('ULSR Network Audit', separator=True)
-    log_debug('')
+    t_start = time()
 
+    reservations = get_hil_reservations()
+    nodes = audit_nodes(reservations, hil_partition_nodes(get_partition_data(None)) |
+                        NodeSet(args.nodes))
+    memberships = reservation_memberships(reservations, nodes)
 
+    snapshot = AuditSnapshot.load(args.snapshot)
+    snapshot.retain(nodes)
+    full = args.full or snapshot.full_sweep_due(t_start, ULSR_AUDIT_FULL_INTERVAL)
+    if full:
+        query_nodes = nodes
+        snapshot.t_full = t_start
+    else:
+        query_nodes = snapshot.stale_nodes(memberships, t_start, ULSR_AUDIT_MAX_STALENESS)
+    log_debug('Auditing %d nodes in %d HIL reservations, querying %d%s', len(nodes),
+              len(reservations), len(query_nodes), ' (full sweep)' if full else '')
 
-if __name__ == '__main__':
-    main(sys.argv[1:])
-    exit(0)
+    node_info, failures = hil_node_states(query_nodes, hil_init(), args.concurrency)
+    for node in sorted(failures):
+        log_error('HIL node info unavailable, node `%s`: %s', node, failures[node])
 
+    t_now = time()
+    changed = []
+    for node in query_nodes:
+        state = node_state(node_info[node]) if node in node_info else None
+        if snapshot.update(node, state, memberships[node], t_now):
+            changed.append(node)
+    snapshot.save(args.snapshot)
+
+    node_states = snapshot.node_states()
+    findings = audit_diff(reservations, node_states, HIL_SLURM_PROJECT, t_now,
+                          ULSR_AUDIT_GRACE_PERIOD)
+    for f in findings:
+        log_info('Audit: %s node=%s reservation=%s %s', f['check'], f['node'],
+                 f['reservation'], f['detail'] or '')
+
+    report = audit_report(reservations, node_states, findings, t_now, time() - t_start,
+                          queried=len(query_nodes), changed=changed, full=full)
+    write_audit_report(args.report, report)
+    log_info('ULSR Network Audit: %d nodes, %d queried, %d changed, %d findings, %.2f seconds',
+             len(node_states), len(query_nodes), len(changed), len(findings),
+             report['elapsed'])
+
+    return 1 if findings else 0
 
-# EOF
 
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+
+# EOF
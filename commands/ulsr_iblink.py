@@ -2,26 +2,85 @@
 MassOpenCloud / Hardware Isolation Layer (HIL)
 User Level Slurm Reservations (ULSR)
 
-Infiniband Link Management 
+Infiniband Link Management
+
+Disables or enables the switch ports linking nodes to the Infiniband
+fabric, as the monitor does on reserve and release, or shows their state.
+
+    python ulsr_iblink.py disable 'server[1-4]'
+    python ulsr_iblink.py enable 'server[1-4]'
+    python ulsr_iblink.py show 'server[1-4]'
+
+The 'iblinkinfo' and 'ibportstate' commands are taken from the
+IBLINKINFO_CMD and IBPORTSTATE_CMD settings, unless given as options.
 
 December 2017, Tim Donahue	tdonahue@mit.edu
 """
-import hostlist
+
+import argparse
+import inspect
 import logging
 import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_settings import (IBLINKINFO_CMD, IBPORTSTATE_CMD, IB_SWITCH_CONCURRENCY,
+                                ULSR_IB_LINKINFO_FILE, ULSR_IB_INDEX_CACHE)
+from hil_slurm_logging import log_init
+from hil_slurm_nodeset import NodeSet
+from ulsr_ib import (IBLinkEngine, load_fabric_index, update_infiniband,
+                     IB_LINK_DISABLE, IB_LINK_ENABLE)
 
 
-IBLINKINFO_CMD = iblinkinfo.sh
-IBPORTSTATE_CMD = ibportstate.sh
+def _show(engine, index, nodes):
+    found, missing = index.lookup(nodes)
+    states = engine.link_states()
+    for node, switchport in sorted(found.iteritems()):
+        up = states.get(switchport)
+        print '%-20s %s %3d  %s' % (node, switchport[0], switchport[1],
+                                    'unknown' if up is None else ('up' if up else 'down'))
+    for node in missing:
+        print '%-20s (not in fabric dump)' % node
 
 
 def main(argv=[]):
     '''
+    Disable, enable or show the Infiniband links of the nodes
     '''
-    
+    parser = argparse.ArgumentParser(description='Disable, enable or show Infiniband links')
+    parser.add_argument('action', choices=[IB_LINK_DISABLE, IB_LINK_ENABLE, 'show'])
+    parser.add_argument('nodes', help='node names, in hostlist syntax')
+    parser.add_argument('--dump', default=ULSR_IB_LINKINFO_FILE,
+                        help='fabric dump, the output of iblinkinfo -l')
+    parser.add_argument('--cache', default=ULSR_IB_INDEX_CACHE, help='fabric index cache')
+    parser.add_argument('--iblinkinfo', default=IBLINKINFO_CMD)
+    parser.add_argument('--ibportstate', default=IBPORTSTATE_CMD)
+    parser.add_argument('--concurrency', type=int, default=IB_SWITCH_CONCURRENCY,
+                        help='number of switches worked on at a time')
+    parser.add_argument('--log', help='log file')
+    args = parser.parse_args(argv)
+
+    if args.log:
+        log_init('ulsr_iblink', args.log, logging.DEBUG)
+
+    nodes = list(NodeSet(args.nodes))
+    index = load_fabric_index(args.dump, args.cache)
+    engine = IBLinkEngine(iblinkinfo_cmd=args.iblinkinfo, ibportstate_cmd=args.ibportstate,
+                          concurrency=args.concurrency)
+
+    if args.action == 'show':
+        _show(engine, index, nodes)
+        return 0
+
+    failures = update_infiniband(nodes, args.action, engine=engine, index=index)
+    for node in sorted(failures):
+        print '%s: %s' % (node, failures[node])
+    return 1 if failures else 0
+
 
 if __name__ == '__main__':
-    main(sys.argv[1:])
-    exit(0)
+    sys.exit(main(sys.argv[1:]))
 
 # EOF
@@ -0,0 +1,140 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (HIL)
+User Level Slurm Reservations (ULSR)
+
+Reservation Trace Viewer
+
+Shows the spans recorded for a HIL reservation by the prolog, epilog,
+monitor, scontrol commands and HIL client calls, and the critical path
+through them.
+
+    python ulsr_trace.py flexalloc_MOC_reserve_centos_1000_1498512332
+    python ulsr_trace.py --list
+"""
+
+import argparse
+import inspect
+import sys
+from os.path import realpath, dirname, join
+from time import localtime, strftime
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_settings import ULSR_TRACE_FILE
+from hil_slurm_trace import load_spans, critical_path
+
+
+def _span_label(s):
+    attrs = ' '.join('%s=%s' % (k, v) for k, v in sorted(s['attrs'].iteritems()))
+    label = '%s %s' % (s['name'], attrs) if attrs else s['name']
+    if s.get('error'):
+        label += '  [%s]' % s['error']
+    return label
+
+
+def _print_tree(spans, t0, max_depth):
+    by_id = dict((s['span_id'], s) for s in spans)
+    children = {}
+    for s in spans:
+        parent_id = s['parent_id'] if s['parent_id'] in by_id else None
+        children.setdefault(parent_id, []).append(s)
+
+    def _print(parent_id, depth):
+        for s in sorted(children.get(parent_id, []), key=lambda s: s['start']):
+            print '%9.3f %9.3f  %s%s' % (s['start'] - t0, s['duration'], '  ' * depth,
+                                         _span_label(s))
+            if (max_depth is None) or (depth + 1 < max_depth):
+                _print(s['span_id'], depth + 1)
+
+    print '%9s %9s  %s' % ('start(s)', 'time(s)', 'span')
+    _print(None, 0)
+
+
+def _print_critical_path(spans):
+    segments = critical_path(spans)
+    if not segments:
+        return
+    total = segments[-1][2] - segments[0][1]
+
+    # Merge consecutive segments of the same span, leaving out sub-millisecond
+    # segments, e.g. a span's own time between its children
+    merged = []
+    for s, t_start, t_end in segments:
+        if (t_end - t_start) < 0.001:
+            continue
+        if merged and merged[-1][0] is s:
+            merged[-1][2] += t_end - t_start
+        else:
+            merged.append([s, t_start, t_end - t_start])
+
+    print
+    print 'Critical path (%.3f s)' % total
+    for s, t_start, duration in merged:
+        label = _span_label(s) if s else '(no span running, e.g. waiting for the monitor)'
+        pct = (100.0 * duration / total) if total else 100.0
+        print '%9.3f %9.3f %5.1f%%  %s' % (t_start - segments[0][1], duration, pct, label)
+
+
+def _list_traces(spans):
+    traces = {}
+    for s in spans:
+        t_start, t_end = traces.get(s['trace_id'], (s['start'], s['end']))
+        traces[s['trace_id']] = (min(t_start, s['start']), max(t_end, s['end']))
+
+    for trace_id, (t_start, t_end) in sorted(traces.items(), key=lambda item: item[1]):
+        print '%s %10.3f  %s' % (strftime('%Y-%m-%d %H:%M:%S', localtime(t_start)),
+                                 t_end - t_start, trace_id)
+
+
+def process_args(argv):
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('resname', nargs='?',
+                        help='HIL reserve or release reservation name')
+    parser.add_argument('--list', action='store_true', default=False,
+                        help='List traced reservations')
+    parser.add_argument('--file', default=ULSR_TRACE_FILE,
+                        help='Trace file (default %s)' % ULSR_TRACE_FILE)
+    parser.add_argument('--depth', type=int, default=None,
+                        help='Maximum span tree depth shown')
+
+    args = parser.parse_args(argv)
+    if not args.list and not args.resname:
+        parser.error('Specify a reservation name or --list')
+    return args
+
+
+def main(argv=[]):
+
+    args = process_args(argv)
+
+    try:
+        spans = load_spans(args.file, None if args.list else args.resname)
+    except IOError as e:
+        print 'Unable to read trace file `%s`: %s' % (args.file, e)
+        return False
+
+    if args.list:
+        _list_traces(spans)
+        return True
+
+    if not spans:
+        print 'No spans recorded for reservation `%s`' % args.resname
+        return False
+
+    t0 = min(s['start'] for s in spans)
+    print 'Trace %s, started %s' % (spans[0]['trace_id'],
+                                    strftime('%Y-%m-%d %H:%M:%S', localtime(t0)))
+    print
+    _print_tree(spans, t0, args.depth)
+    _print_critical_path(spans)
+    return True
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
+    exit(0)
+
+# EOF
@@ -0,0 +1,130 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+Asynchronous HIL Client Interface
+
+Thread-pool counterparts of the HIL client functions.  Each call returns at
+once with a handle (multiprocessing.pool.AsyncResult) whose get() returns the
+result or raises the exception of the underlying synchronous call.  The
+calls are not a non-blocking transport: each one runs the synchronous HIL
+client, blocking a pool thread on its HTTP requests.
+
+Node calls are run by a fixed-size, process-wide worker pool using the
+pooled HIL clients.  Reserve and release calls are coordinated by a second
+pool of the same size, and their node phases run on the shared worker
+pool rather than on pools of their own, so a single process can keep many
+reservation transitions in flight with a fixed number of threads, and
+without a thread per node.  Coordinators only wait on node workers, and
+node workers never wait, so the two pools cannot deadlock.  Python 2.7
+has no asyncio, so the worker pools take the place of an event loop; the
+synchronous API is unchanged.
+
+Threads cannot be cancelled: a call still running when wait_all() times
+out runs to completion in the background.
+"""
+
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import hil_slurm_client
+from hil_slurm_settings import HIL_ASYNC_WORKERS
+
+
+_async_pool = None
+_coordinator_pool = None
+_async_pool_lock = threading.Lock()
+
+
+def _get_async_pool():
+    global _async_pool
+
+    with _async_pool_lock:
+        if _async_pool is None:
+            _async_pool = ThreadPool(HIL_ASYNC_WORKERS)
+    return _async_pool
+
+
+def _get_coordinator_pool():
+    global _coordinator_pool
+
+    with _async_pool_lock:
+        if _coordinator_pool is None:
+            _coordinator_pool = ThreadPool(HIL_ASYNC_WORKERS)
+    return _coordinator_pool
+
+
+def _submit(fn, *args, **kwargs):
+    return _get_async_pool().apply_async(fn, args, kwargs)
+
+
+def _coordinate(fn, *args, **kwargs):
+    '''
+    Run a multi-node call on the coordinator pool, with its node phases on
+    the shared worker pool
+    '''
+    node_pool = _get_async_pool()
+
+    def _run():
+        with hil_slurm_client.node_phase_pool(node_pool):
+            return fn(*args, **kwargs)
+
+    return _get_coordinator_pool().apply_async(_run)
+
+
+def show_node_async(hil_client, node):
+    return _submit(hil_slurm_client.show_node, hil_client, node)
+
+
+def power_off_node_async(hil_client, node):
+    return _submit(hil_slurm_client.power_off_node, hil_client, node)
+
+
+def remove_all_networks_async(hil_client, node):
+    return _submit(hil_slurm_client._remove_all_networks, hil_client, node)
+
+
+def hil_reserve_nodes_async(nodelist, from_project, hil_client=None, concurrency=None):
+    return _coordinate(hil_slurm_client.hil_reserve_nodes, nodelist, from_project,
+                       hil_client=hil_client, concurrency=concurrency)
+
+
+def hil_free_nodes_async(nodelist, to_project, hil_client=None, concurrency=None):
+    return _coordinate(hil_slurm_client.hil_free_nodes, nodelist, to_project,
+                       hil_client=hil_client, concurrency=concurrency)
+
+
+def wait_all(async_results, timeout=None):
+    '''
+    Wait for a dict of async results, keyed by e.g. node or reservation name.
+    Returns (results, failures): dicts mapping each key to its result or to
+    the exception raised.  Calls still running at the timeout are reported
+    as failures, but are not cancelled.
+    '''
+    results = {}
+    failures = {}
+    end_time = (time.time() + timeout) if timeout is not None else None
+    for key, async_result in async_results.iteritems():
+        remaining = max(end_time - time.time(), 0) if end_time is not None else None
+        try:
+            results[key] = async_result.get(remaining)
+        except Exception as e:
+            failures[key] = e
+    return results, failures
+
+
+def shutdown():
+    '''
+    Stop the worker pools once outstanding calls complete
+    '''
+    global _async_pool, _coordinator_pool
+
+    with _async_pool_lock:
+        # Coordinators first, as they submit work to the node workers
+        for pool in (_coordinator_pool, _async_pool):
+            if pool is not None:
+                pool.close()
+                pool.join()
+        _async_pool = _coordinator_pool = None
+
+# EOF
@@ -0,0 +1,303 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+HIL / Slurm Consistency Audit
+
+Compares a snapshot of the HIL reservations in Slurm with a snapshot of
+the HIL state (project and NIC networks) of the nodes of the HIL
+partitions and of the reservations, and reports the differences.  Nodes
+of the HIL partitions are audited whether or not a reservation covers
+them, so a node left in the free pool or a user project after its
+reservations were deleted is found.  The Slurm side comes from single
+'scontrol show reservation' and 'scontrol show partition' calls, and each
+node is queried in HIL once, so the cost of an audit grows with the
+number of nodes audited.
+
+A node under a HIL release reservation belongs to HIL users, and should
+not be in the Slurm project; any other node should be.  A node in the
+HIL free pool should have no networks attached.  A reserve reservation
+should be paired with a release reservation once the monitor has had
+time to process it, and a release reservation should not outlast its
+end time.
+
+Audits may be incremental.  The last observed state of each node, with a
+hash of its state and of the reservations covering it, is kept in an
+audit snapshot.  A node is queried in HIL again only if the reservations
+covering it have changed, its last query failed, or its snapshot entry is
+older than the staleness bound; every node is queried on a full sweep.
+The diff is always computed over all nodes, from the snapshot.
+"""
+
+import errno
+import hashlib
+import json
+import os
+from tempfile import NamedTemporaryFile
+
+from hil_slurm_constants import HIL_RESERVE, HIL_RELEASE
+from hil_slurm_logging import log_debug, log_error
+from hil_slurm_nodeset import NodeSet
+from hil_slurm_records import HILReservationIndex
+from hil_slurm_settings import HIL_PARTITION_PREFIX
+
+AUDIT_REPORT_VERSION = 1
+AUDIT_SNAPSHOT_VERSION = 1
+
+# Findings
+
+AUDIT_FREE_WITHOUT_RELEASE = 'free_without_release'	# In the free pool, no release reservation
+AUDIT_FREE_WITH_NETWORKS = 'free_with_networks'		# In the free pool, networks attached
+AUDIT_SLURM_UNDER_RELEASE = 'slurm_under_release'	# In the Slurm project, under a release
+AUDIT_FOREIGN_PROJECT = 'foreign_project'		# In a user project, no release reservation
+AUDIT_ORPHAN_RESERVE = 'orphan_reserve'			# Reserve reservation never paired
+AUDIT_EXPIRED_RELEASE = 'expired_release'		# Release reservation past its end time
+AUDIT_NODE_UNAVAILABLE = 'node_unavailable'		# HIL node information unavailable
+
+AUDIT_FINDINGS = [AUDIT_FREE_WITHOUT_RELEASE, AUDIT_FREE_WITH_NETWORKS,
+                  AUDIT_SLURM_UNDER_RELEASE, AUDIT_FOREIGN_PROJECT,
+                  AUDIT_ORPHAN_RESERVE, AUDIT_EXPIRED_RELEASE, AUDIT_NODE_UNAVAILABLE]
+
+
+def node_state(node_info):
+    '''
+    Return the audited part of HIL node information: the node's project,
+    and the sorted '<nic>:<channel>=<network>' attachments of its NICs.
+    HIL does not report node power state, so it is not audited.
+    '''
+    networks = []
+    for nic in node_info.get('nics', []):
+        for channel, network in nic.get('networks', {}).iteritems():
+            networks.append('%s:%s=%s' % (nic.get('label'), channel, network))
+    return {'project': node_info.get('project'), 'networks': sorted(networks)}
+
+
+def hil_partition_nodes(partitions):
+    '''
+    Return the NodeSet of the nodes of the HIL partitions
+    '''
+    nodeset = NodeSet()
+    for partition in partitions:
+        if partition.name.startswith(HIL_PARTITION_PREFIX) and partition.nodes:
+            nodeset.update(partition.nodes)
+    return nodeset
+
+
+def audit_nodes(reservations, nodes=()):
+    '''
+    Return the sorted names of the nodes covered by the reservations, and
+    of any other nodes given
+    '''
+    audited = set(nodes)
+    for res in reservations:
+        audited.update(res.nodeset)
+    return sorted(audited)
+
+
+def _finding(check, node=None, reservation=None, detail=None):
+    return {'check': check, 'node': node, 'reservation': reservation, 'detail': detail}
+
+
+def audit_diff(reservations, node_states, slurm_project, t_now, grace_period):
+    '''
+    Compare the HIL reservations with the HIL node states, a dict mapping
+    node name to node_state() output, or to None if the node could not be
+    queried.  Reserve reservations are reported as orphaned, and release
+    reservations as expired, only grace_period seconds after their start
+    and end times, respectively.
+    Returns a list of findings, sorted by check, node and reservation.
+    '''
+    index = HILReservationIndex(reservations)
+    findings = []
+
+    # Orphaned reserve and expired release reservations
+
+    for res in index.singletons(HIL_RESERVE):
+        if (res.t_start is not None) and (t_now - res.t_start > grace_period):
+            findings.append(_finding(AUDIT_ORPHAN_RESERVE, reservation=res.name,
+                                     detail='unpaired for %d seconds' % (t_now - res.t_start)))
+
+    for res in index.by_type[HIL_RELEASE]:
+        if (res.t_end is not None) and (t_now - res.t_end > grace_period):
+            findings.append(_finding(AUDIT_EXPIRED_RELEASE, reservation=res.name,
+                                     detail='ended %d seconds ago' % (t_now - res.t_end)))
+
+    # The release reservation covering each node, if any
+
+    release_by_node = {}
+    for res in index.by_type[HIL_RELEASE]:
+        for node in res.nodeset:
+            release_by_node[node] = res.name
+
+    for node in sorted(node_states):
+        state = node_states[node]
+        release = release_by_node.get(node)
+        if state is None:
+            findings.append(_finding(AUDIT_NODE_UNAVAILABLE, node, release))
+            continue
+
+        project = state['project']
+        if project is None:
+            if release is None:
+                findings.append(_finding(AUDIT_FREE_WITHOUT_RELEASE, node))
+            if state['networks']:
+                findings.append(_finding(AUDIT_FREE_WITH_NETWORKS, node, release,
+                                         ', '.join(state['networks'])))
+        elif project == slurm_project:
+            if release is not None:
+                findings.append(_finding(AUDIT_SLURM_UNDER_RELEASE, node, release))
+        elif release is None:
+            findings.append(_finding(AUDIT_FOREIGN_PROJECT, node, detail=project))
+
+    findings.sort(key=lambda f: (f['check'], f['node'], f['reservation']))
+    return findings
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True)).hexdigest()
+
+
+def reservation_memberships(reservations, nodes):
+    '''
+    Return a dict mapping each node to a hash of the names of the HIL
+    reservations covering it
+    '''
+    names = dict((node, []) for node in nodes)
+    for res in reservations:
+        for node in res.nodeset:
+            if node in names:
+                names[node].append(res.name)
+    return dict((node, _digest(sorted(resnames))) for node, resnames in names.iteritems())
+
+
+class AuditSnapshot(object):
+    '''
+    The last observed HIL state of each audited node.  Each entry holds the
+    node state, or None if the node could not be queried, a hash of the
+    state, the hash of the node's reservation membership, and the time the
+    node was last queried.
+    '''
+    def __init__(self, nodes=None, t_full=None):
+        self.nodes = nodes or {}
+        self.t_full = t_full
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Return the snapshot saved at path, or an empty snapshot
+        '''
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                log_debug('Unable to read audit snapshot `%s`: %s', path, e)
+            return cls()
+        except ValueError:
+            log_debug('Discarding corrupt audit snapshot `%s`', path)
+            return cls()
+
+        if not isinstance(snapshot, dict) or \
+           (snapshot.get('version') != AUDIT_SNAPSHOT_VERSION):
+            return cls()
+        return cls(dict((str(node), entry) for node, entry in snapshot['nodes'].iteritems()),
+                   snapshot.get('t_full'))
+
+    def save(self, path):
+        '''
+        Write the snapshot atomically.  Returns True if it was written.
+        '''
+        try:
+            with NamedTemporaryFile('w', dir=os.path.dirname(path), prefix='.audit_snapshot',
+                                    delete=False) as f:
+                json.dump({'version': AUDIT_SNAPSHOT_VERSION, 't_full': self.t_full,
+                           'nodes': self.nodes}, f, separators=(',', ':'))
+            os.rename(f.name, path)
+        except (IOError, OSError) as e:
+            log_error('Unable to write audit snapshot `%s`: %s', path, e)
+            return False
+        return True
+
+    def full_sweep_due(self, t_now, full_interval):
+        return (self.t_full is None) or (t_now - self.t_full >= full_interval)
+
+    def stale_nodes(self, memberships, t_now, max_age):
+        '''
+        Return the sorted nodes, of those in the memberships dict, which must
+        be queried: nodes not in the snapshot, nodes whose reservation
+        membership changed or whose last query failed, and nodes last
+        queried more than max_age seconds ago
+        '''
+        stale = []
+        for node, membership in memberships.iteritems():
+            entry = self.nodes.get(node)
+            if (entry is None) or (entry['membership'] != membership) or \
+               (entry['state'] is None) or (t_now - entry['t_checked'] > max_age):
+                stale.append(node)
+        return sorted(stale)
+
+    def update(self, node, state, membership, t_now):
+        '''
+        Record a node's newly queried state.  Returns True if the state
+        differs from the state last recorded for the node.
+        '''
+        digest = _digest(state)
+        entry = self.nodes.get(node)
+        self.nodes[node] = {'state': state, 'hash': digest, 'membership': membership,
+                            't_checked': t_now}
+        return (entry is None) or (entry['hash'] != digest)
+
+    def retain(self, nodes):
+        '''
+        Drop the entries of nodes no longer audited
+        '''
+        nodes = set(nodes)
+        for node in [node for node in self.nodes if node not in nodes]:
+            del self.nodes[node]
+
+    def node_states(self):
+        return dict((node, entry['state']) for node, entry in self.nodes.iteritems())
+
+
+def audit_report(reservations, node_states, findings, t_now, elapsed=None, queried=None,
+                 changed=(), full=True):
+    '''
+    Return the machine-readable audit report
+    '''
+    counts = dict((check, 0) for check in AUDIT_FINDINGS)
+    for f in findings:
+        counts[f['check']] += 1
+    return {'version': AUDIT_REPORT_VERSION,
+            'time': t_now,
+            'elapsed': elapsed,
+            'full': full,
+            'reservations': sorted(res.name for res in reservations),
+            'nodes': len(node_states),
+            'queried': len(node_states) if queried is None else queried,
+            'changed': sorted(changed),
+            'counts': counts,
+            'findings': findings}
+
+
+def write_audit_report(path, report):
+    '''
+    Write the report atomically, or to stdout if the path is '-'.
+    Returns True if the report was written.
+    '''
+    if path == '-':
+        print json.dumps(report, indent=2, sort_keys=True)
+        return True
+
+    try:
+        with NamedTemporaryFile('w', dir=os.path.dirname(path), prefix='.audit',
+                                delete=False) as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        os.chmod(f.name, 0644)
+        os.rename(f.name, path)
+    except (IOError, OSError) as e:
+        log_error('Unable to write audit report `%s`: %s', path, e)
+        return False
+
+    log_debug('Wrote audit report `%s` (%d findings)', path, len(report['findings']))
+    return True
+
+# EOF
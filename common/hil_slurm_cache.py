@@ -0,0 +1,157 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+Slurm 'scontrol show' Query Cache
+
+The prolog, epilog and monitor repeatedly ask scontrol for the same
+partition, job and reservation data within a few seconds of each other.
+The cache keeps the raw 'scontrol show' output, keyed by (entity, entity_id),
+in a small JSON file shared by all ULSR processes on the controller.
+Entries expire after a TTL and the oldest entries are evicted once the
+store is full.  Reads take a shared lock and never write the store, so a
+cache hit costs one file read; as recency is not recorded on reads, the
+eviction order only approximates LRU.
+"""
+
+import errno
+import fcntl
+import json
+import os
+from tempfile import NamedTemporaryFile
+from time import time
+
+from hil_slurm_logging import log_debug
+
+
+class ScontrolShowCache(object):
+    '''
+    TTL / size bounded store of 'scontrol show' output, shared across processes
+    through a JSON file.  Updates are serialized with an exclusive flock(2) on
+    a companion lock file, and reads share it; the store itself is replaced
+    atomically on every update.
+    Entries are segregated by namespace, e.g. the scontrol output format.
+    '''
+    def __init__(self, path, ttl, max_entries, namespace=''):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.namespace = namespace
+
+    def _key(self, entity, entity_id):
+        return '%s:%s/%s' % (self.namespace, entity, entity_id or '')
+
+    def _lock(self, operation=fcntl.LOCK_EX):
+        lock_f = open(self.lock_path, 'a')
+        fcntl.flock(lock_f, operation)
+        return lock_f
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                log_debug('Unable to read scontrol cache `%s`: %s', self.path, e)
+        except ValueError:
+            log_debug('Discarding corrupt scontrol cache `%s`', self.path)
+        return {}
+
+    def _store(self, entries):
+        dirname = os.path.dirname(self.path)
+        with NamedTemporaryFile('w', dir=dirname, delete=False) as f:
+            json.dump(entries, f)
+        os.rename(f.name, self.path)
+
+    def _update(self, update_fn):
+        '''
+        Load the store under the lock, apply update_fn to the entry dict,
+        and write the store back if update_fn returns True.
+        Returns whatever update_fn placed in its result list.
+        '''
+        result = []
+        try:
+            lock_f = self._lock()
+        except (IOError, OSError) as e:
+            log_debug('Unable to lock scontrol cache `%s`: %s', self.lock_path, e)
+            return None
+
+        try:
+            entries = self._load()
+            if update_fn(entries, result):
+                self._store(entries)
+        except (IOError, OSError) as e:
+            log_debug('Unable to update scontrol cache `%s`: %s', self.path, e)
+        finally:
+            lock_f.close()
+
+        return result[0] if result else None
+
+    def get(self, entity, entity_id):
+        '''
+        Return the cached (stdout, stderr) tuple for the entity and ID,
+        or None if there is no live entry.
+        '''
+        key = self._key(entity, entity_id)
+        try:
+            lock_f = self._lock(fcntl.LOCK_SH)
+        except (IOError, OSError) as e:
+            log_debug('Unable to lock scontrol cache `%s`: %s', self.lock_path, e)
+            return None
+
+        try:
+            entry = self._load().get(key)
+        finally:
+            lock_f.close()
+
+        # Expired entries are dropped by the next put
+        if (entry is None) or ((time() - entry['t_stored']) > self.ttl):
+            return None
+        return entry['stdout'].encode('utf-8'), entry['stderr'].encode('utf-8')
+
+    def put(self, entity, entity_id, stdout_data, stderr_data):
+        '''
+        Store 'scontrol show' output, evicting expired entries and then
+        the oldest entries to stay within max_entries
+        '''
+        key = self._key(entity, entity_id)
+
+        def _put(entries, result):
+            now = time()
+            for k in [k for k, e in entries.iteritems() if (now - e['t_stored']) > self.ttl]:
+                del entries[k]
+
+            entries[key] = {'t_stored': now, 'stdout': stdout_data, 'stderr': stderr_data}
+
+            n_excess = len(entries) - self.max_entries
+            if n_excess > 0:
+                oldest_keys = sorted(entries, key=lambda k: entries[k]['t_stored'])
+                for k in oldest_keys[:n_excess]:
+                    del entries[k]
+            return True
+
+        self._update(_put)
+
+    def invalidate(self, entity, entity_id=None):
+        '''
+        Drop the entry for the entity and ID together with the entity-wide
+        ('scontrol show <entity>') entry.  If no ID is given, drop every
+        entry for the entity.
+        '''
+        entity_prefix = self._key(entity, None)
+        stale_keys = set([entity_prefix])
+        if entity_id:
+            stale_keys.add(self._key(entity, entity_id))
+
+        def _invalidate(entries, result):
+            if entity_id:
+                keys = [k for k in entries if k in stale_keys]
+            else:
+                keys = [k for k in entries if k.startswith(entity_prefix)]
+            for k in keys:
+                del entries[k]
+            return bool(keys)
+
+        self._update(_invalidate)
+
+# EOF
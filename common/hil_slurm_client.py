@@ -8,16 +8,35 @@ August 2017, Tim Donahue	tdonahue@mit.edu
 
 import urllib
 
+import random
+import threading
 import time
+from contextlib import contextmanager
+from functools import wraps
+from multiprocessing.pool import ThreadPool
 
 from hil.client.client import Client, RequestsHTTPClient
 from hil.client.base import FailedAPICallException
+from requests.adapters import HTTPAdapter
 from hil_slurm_logging import log_info, log_debug, log_error
-from hil_slurm_settings import HIL_ENDPOINT, HIL_USER, HIL_PW
+from hil_slurm_metrics import hil_api_call, HIL_DETACH_RETRIES
+from hil_slurm_trace import span, traced, propagate
+from hil_slurm_journal import (NODE_POWERED_OFF, NODE_PORTS_REVERTED, NODE_DETACHED,
+                               NODE_CONNECTED)
+from hil_slurm_settings import (HIL_ENDPOINT, HIL_USER, HIL_PW, HIL_NODE_CONCURRENCY,
+                                HIL_CLIENT_POOL_SIZE, HIL_CLIENT_HEALTH_CHECK_INTERVAL)
 
 # timeout ensures that networking actions are completed in a resonable time.
 HIL_TIMEOUT = 20
 
+# Network removal polling: the delay between polls starts at the minimum
+# interval and grows by the backoff factor up to the maximum interval, each
+# delay randomized by +/- the jitter fraction.
+HIL_POLL_INTERVAL_MIN = 0.25
+HIL_POLL_INTERVAL_MAX = 4.0
+HIL_POLL_BACKOFF = 1.5
+HIL_POLL_JITTER = 0.25
+
 DEBUG = False
 
 class HILClientFailure(Exception):
@@ -28,16 +47,90 @@ class ProjectMismatchError(Exception):
     """Raised when projects don't match"""
 
 
-def _hil_client_connect(endpoint_ip, name, pw):
+class NodeInfoCache(object):
+    """HIL node information, valid within one node info cache scope.
+    Entries are dropped when a mutating call touches the node."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._node_info = {}
+        self.depth = 0
+
+    def get(self, node):
+        with self._lock:
+            return self._node_info.get(node)
+
+    def put(self, node, node_info):
+        with self._lock:
+            self._node_info[node] = node_info
+
+    def invalidate(self, node):
+        with self._lock:
+            self._node_info.pop(node, None)
+
+
+_node_info_cache = None
+_node_info_cache_lock = threading.Lock()
+
+
+@contextmanager
+def node_info_cache():
+    '''
+    Open a node info cache scope, e.g. for a monitor pass or a single API call.
+    Nested and concurrent scopes share the outermost cache, which is discarded
+    when the last scope closes.
+    '''
+    global _node_info_cache
+
+    with _node_info_cache_lock:
+        if _node_info_cache is None:
+            _node_info_cache = NodeInfoCache()
+        cache = _node_info_cache
+        cache.depth += 1
+    try:
+        yield cache
+    finally:
+        with _node_info_cache_lock:
+            cache.depth -= 1
+            if not cache.depth:
+                _node_info_cache = None
+
+
+def _with_node_info_cache(fn):
+    '''
+    Run the decorated API call within a node info cache scope
+    '''
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with node_info_cache():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def _invalidate_node_info(node):
+    cache = _node_info_cache
+    if cache:
+        cache.invalidate(node)
+
+
+def _hil_client_connect(endpoint_ip, name, pw, pool_maxsize=None):
     '''
     Connect to the HIL server and return a HIL Client instance
-    Note this call will succeed if the API server is running, but the network server is down           '''
+    Note this call will succeed if the API server is running, but the network server is down
+    If pool_maxsize is given, the client keeps up to that many HTTP connections alive
+    '''
     hil_http_client = RequestsHTTPClient()
     if not hil_http_client:
         log_error('Unable to create HIL HTTP Client')
         return None
 
     hil_http_client.auth = (name, pw)
+    if pool_maxsize:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        hil_http_client.mount('http://', adapter)
+        hil_http_client.mount('https://', adapter)
+        hil_http_client.headers['Connection'] = 'keep-alive'
+
     c = Client(endpoint_ip, hil_http_client)
     if not c:
         log_error('Unable to create HIL client')
@@ -45,18 +138,237 @@ def _hil_client_connect(endpoint_ip, name, pw):
     return c
 
 
+class HILClientPool(object):
+    """A fixed set of HIL clients, each with its own keep-alive HTTP session,
+    shared by all HIL calls in the process.  The sessions are thread safe, so
+    clients are handed out round-robin rather than checked out, and each
+    keeps up to HIL_NODE_CONCURRENCY connections.  Clients are health checked
+    before reuse after HIL_CLIENT_HEALTH_CHECK_INTERVAL and reconnected on failure."""
+
+    def __init__(self, endpoint_ip, name, pw, size):
+        self.endpoint_ip = endpoint_ip
+        self.name = name
+        self.pw = pw
+        self.size = max(size, 1)
+        self._lock = threading.Lock()
+        self._check_locks = [threading.Lock() for i in range(self.size)]
+        self._clients = [self._connect() for i in range(self.size)]
+        self._t_checked = [time.time()] * self.size
+        self._ok = [True] * self.size
+        self._next = 0
+
+    def _connect(self):
+        return _hil_client_connect(self.endpoint_ip, self.name, self.pw,
+                                   pool_maxsize=HIL_NODE_CONCURRENCY)
+
+    def owns(self, hil_client):
+        return any(hil_client is c for c in self._clients)
+
+    @staticmethod
+    def _healthy(hil_client):
+        try:
+            hil_client.project.list()
+            return True
+        except Exception as e:
+            log_debug('HIL client health check failed: %s' % e)
+            return False
+
+    def _checked(self, i, force=False):
+        '''
+        Return client i, first health checking it if due, and reconnecting
+        it if the check fails.  One thread at a time checks a client.
+        '''
+        with self._check_locks[i]:
+            if force or (time.time() - self._t_checked[i]) > HIL_CLIENT_HEALTH_CHECK_INTERVAL:
+                self._ok[i] = self._healthy(self._clients[i])
+                if not self._ok[i]:
+                    log_info('Reconnecting HIL client to `%s`' % self.endpoint_ip)
+                    self._clients[i] = self._connect()
+                    self._ok[i] = self._healthy(self._clients[i])
+                    if not self._ok[i]:
+                        log_error('HIL server `%s` is not responding' % self.endpoint_ip)
+                self._t_checked[i] = time.time()
+            return self._clients[i]
+
+    def client(self, check=False):
+        '''
+        Return the next client in round-robin order, for shared use
+        '''
+        with self._lock:
+            i = self._next
+            self._next = (self._next + 1) % self.size
+        return self._checked(i, force=check)
+
+    def check(self):
+        '''
+        Health check every client, reconnecting any which fail.
+        Returns True if all clients are healthy.
+        '''
+        for i in range(self.size):
+            self._checked(i, force=True)
+        return all(self._ok)
+
+
+_hil_client_pool = None
+_hil_client_pool_lock = threading.Lock()
+
+
+def _get_hil_client_pool():
+    global _hil_client_pool
+
+    with _hil_client_pool_lock:
+        if _hil_client_pool is None:
+            _hil_client_pool = HILClientPool(HIL_ENDPOINT, HIL_USER, HIL_PW, HIL_CLIENT_POOL_SIZE)
+    return _hil_client_pool
+
+
 def hil_init():
-    return _hil_client_connect(HIL_ENDPOINT, HIL_USER, HIL_PW)
+    '''
+    Return a HIL client from the process-wide client pool
+    '''
+    return _get_hil_client_pool().client()
 
 
 def check_hil_interface():
-    hil_client = hil_init()
+    '''
+    Verify the HIL server responds, reconnecting pooled clients if necessary
+    '''
+    return _get_hil_client_pool().check()
+
+
+def _node_client(hil_client):
+    '''
+    Select the client for one node operation.  Operations on pooled clients
+    are spread over the pool; an explicitly created client is used as is.
+    '''
+    pool = _hil_client_pool
+    if pool and pool.owns(hil_client):
+        return pool.client()
+    return hil_client
+
+
+def _client_phase(hil_client, fn):
+    '''
+    Wrap fn(hil_client, node) as a node phase function for _run_node_phase
+    '''
+    def phase_fn(node):
+        return fn(_node_client(hil_client), node)
+    return phase_fn
+
+
+class HILNodeFailures(HILClientFailure):
+    """Raised when a HIL operation failed on one or more nodes.
+    failures maps each failed node to the exception raised for it."""
+
+    def __init__(self, operation, failures):
+        self.operation = operation
+        self.failures = failures
+        node_errors = ['%s (%s)' % (node, str(failures[node]) or failures[node].__class__.__name__)
+                       for node in sorted(failures)]
+        super(HILNodeFailures, self).__init__('%s failed on %d node(s): %s' %
+                                              (operation, len(failures), ', '.join(node_errors)))
+
+
+_node_phase_pool = threading.local()
+
+
+@contextmanager
+def node_phase_pool(pool):
+    '''
+    Run the node phases started by this thread on the given ThreadPool,
+    shared with other threads, rather than on a pool created per phase.
+    The shared pool's size then bounds the nodes worked on at a time.
+    '''
+    saved = getattr(_node_phase_pool, 'pool', None)
+    _node_phase_pool.pool = pool
+    try:
+        yield pool
+    finally:
+        _node_phase_pool.pool = saved
+
+
+def _run_node_phase(phase_fn, nodelist, concurrency=None, name=None):
+    '''
+    Run phase_fn(node) for every node in the list, on up to <concurrency> nodes
+    at a time, or on the node phase pool of this thread, if any.
+    Returns a list of (node, result) pairs for nodes which succeeded,
+    in nodelist order, and a dict mapping failed nodes to their exception.
+    If the phase is named, it is recorded as a trace span.
+    '''
+    if name:
+        with span('hil.phase.' + name, nodes=len(nodelist)):
+            return _run_node_phase(phase_fn, nodelist, concurrency)
+
+    if concurrency is None:
+        concurrency = HIL_NODE_CONCURRENCY
+
+    @propagate
+    def _run(node):
+        try:
+            return node, phase_fn(node), None
+        except Exception as e:
+            return node, None, e
+
+    shared_pool = getattr(_node_phase_pool, 'pool', None)
+    if (concurrency <= 1) or (len(nodelist) <= 1):
+        outcomes = map(_run, nodelist)
+    elif shared_pool is not None:
+        outcomes = shared_pool.map(_run, nodelist)
+    else:
+        pool = ThreadPool(min(concurrency, len(nodelist)))
+        try:
+            outcomes = pool.map(_run, nodelist)
+        finally:
+            pool.close()
+            pool.join()
+
+    succeeded = [(node, result) for node, result, e in outcomes if e is None]
+    failures = dict((node, e) for node, result, e in outcomes if e is not None)
+    return succeeded, failures
+
+
+def _get_node_projects(hil_client, nodelist, concurrency=None):
+    '''
+    Get the project of each node, querying nodes in parallel.
+    Querying changes nothing, so the first failure, if any, is re-raised
+    unchanged after all failures have been logged.
+    '''
+    succeeded, failures = _run_node_phase(_client_phase(hil_client,
+                                                        lambda c, node: show_node(c, node)['project']),
+                                          nodelist, concurrency, name='precheck')
+    if failures:
+        for node in sorted(failures):
+            log_error('HIL node info unavailable, node `%s`: %s' % (node, failures[node]))
+        raise failures[[node for node in nodelist if node in failures][0]]
+
+    return succeeded
 
 
-def hil_reserve_nodes(nodelist, from_project, hil_client=None):
+@_with_node_info_cache
+@traced('hil.node_states')
+def hil_node_states(nodelist, hil_client=None, concurrency=None):
+    '''
+    Get the HIL node information of each node, querying nodes in parallel.
+    Returns a dict mapping each node queried to its information, and a dict
+    mapping each node which could not be queried to the exception.
+    '''
+    if not hil_client:
+        hil_client = hil_init()
+
+    succeeded, failures = _run_node_phase(_client_phase(hil_client,
+                                                        lambda c, node: show_node(c, node)),
+                                          list(nodelist), concurrency, name='show')
+    return dict(succeeded), failures
+
+
+@_with_node_info_cache
+@traced('hil.reserve_nodes', attrs=('from_project',))
+def hil_reserve_nodes(nodelist, from_project, hil_client=None, concurrency=None,
+                      journal=None):
     '''
     Cause HIL nodes to move from the 'from' project to the HIL free pool.
     Typically, the 'from' project is the Slurm loaner project.
+    The nodes may be given as a list of node names or as a NodeSet.
 
     This methods first powers off the nodes, then disconnects all networks,
     then moves the node from the 'from' project to the free pool.
@@ -64,68 +376,134 @@ def hil_reserve_nodes(nodelist, from_project, hil_client=None):
     We power off the nodes before removing the networks because the IPMI
     network is also controlled by HIL. If we removed all networks, then we will
     not be able to perform any IPMI operations on nodes.
+
+    Each phase runs on up to <concurrency> nodes at a time, and completes on all
+    nodes before the next phase starts.  Nodes which fail a phase are dropped
+    from later phases, and all failures are reported together in a single
+    HILNodeFailures exception.
+
+    If a reservation journal transition is given, the nodes completing each
+    phase are recorded, and phases already recorded for a node are skipped.
     '''
     if not hil_client:
         hil_client = hil_init()
 
+    powered_off, reverted, detached = set(), set(), set()
+    if journal:
+        powered_off = journal.done(NODE_POWERED_OFF)
+        reverted = journal.done(NODE_PORTS_REVERTED)
+        detached = journal.done(NODE_DETACHED)
+        if powered_off:
+            log_info('HIL reserve: Resuming, %d of %d nodes detached' %
+                     (len(detached), len(nodelist)))
+
     # Get information from node and ensure that the node is actually connected
-    # to <from_project> before proceeding.
-    # iterate over a copy of nodelist, otherwise we can't modify it.
-    for node in nodelist[:]:
-        node_info = show_node(hil_client, node)
-        project = node_info['project']
+    # to <from_project> before proceeding.  Nodes with journal entries were
+    # checked by an earlier attempt.
+    reserve_nodelist = [node for node in nodelist if (node in powered_off) and
+                        (node not in detached)]
+    mismatched_nodes = []
+    for node, project in _get_node_projects(hil_client,
+                                            [node for node in nodelist
+                                             if (node not in powered_off) and (node not in detached)],
+                                            concurrency):
         # if node already in the free pool, skip any processing.
         if project is None:
             log_info('HIL release: Node `%s` already in the free pool, skipping' % node)
-            nodelist.remove(node)
         elif (project != from_project):
             log_error('HIL reservation failure: Node `%s` (in project `%s`) not in `%s` project' % (node, project, from_project))
-            raise ProjectMismatchError()
+            mismatched_nodes.append(node)
+        else:
+            reserve_nodelist.append(node)
 
-    # Power off all nodes.
-    for node in nodelist:
-        power_off_node(hil_client, node)
+    if mismatched_nodes:
+        raise ProjectMismatchError()
+
+    # Power off all nodes.  If any node fails, stop before touching networks.
+    succeeded, failures = _run_node_phase(_client_phase(hil_client, power_off_node),
+                                          [node for node in reserve_nodelist
+                                           if node not in powered_off], concurrency,
+                                          name='power_off')
+    if journal:
+        journal.record([node for node, _ in succeeded], NODE_POWERED_OFF)
+    if failures:
+        raise HILNodeFailures('Power off', failures)
+
+    all_failures = {}
 
     # Remove all networks from nodes.
-    for node in nodelist:
+    def _remove_networks(c, node):
         try:
-            _remove_all_networks(hil_client, node)
+            _remove_all_networks(c, node)
         except:
-            log_error('Failed to remove networks from node %s' % node)            
-            continue
+            log_error('Failed to remove networks from node %s' % node)
+            raise
+
+    succeeded, failures = _run_node_phase(_client_phase(hil_client, _remove_networks),
+                                          [node for node in reserve_nodelist
+                                           if node not in reverted], concurrency,
+                                          name='revert')
+    if journal:
+        journal.record([node for node, _ in succeeded], NODE_PORTS_REVERTED)
+    all_failures.update(failures)
+
+    # Ensure all networks are removed, waiting on all nodes at once
+    revert_nodelist = [node for node in reserve_nodelist if node not in failures]
+    outcomes = _wait_for_no_networks(hil_client, revert_nodelist, concurrency=concurrency)
+    failures = dict((node, e) for node, e in outcomes.iteritems() if e is not None)
+    for node in sorted(failures):
+        log_error('Failed to ensure node %s is disconnected from all networks' % node)
+    all_failures.update(failures)
 
     # Finally, remove node from project.
-    for node in nodelist:
-        try:
-            _ensure_no_networks(hil_client, node)
-        except:
-            log_error('Failed to ensure node %s is disconnected from all networks' % node)
-            continue
+    detach_nodelist = [node for node in revert_nodelist if outcomes[node] is None]
+    succeeded, failures = _run_node_phase(_client_phase(hil_client,
+                                                        lambda c, node: _detach_node(c, from_project, node)),
+                                          detach_nodelist, concurrency, name='detach')
+    if journal:
+        journal.record([node for node, _ in succeeded], NODE_DETACHED)
+    all_failures.update(failures)
 
-        # tries 10 times to detach the project because there might be a pending
-        # networking action setup by revert port in the previous step.
-        counter = 10
-        while counter:
-            try:
+    if all_failures:
+        raise HILNodeFailures('HIL reserve', all_failures)
+
+
+@traced('hil.detach_node', attrs=('node',))
+def _detach_node(hil_client, from_project, node):
+    '''
+    Detach a node from a project
+    '''
+    # tries 10 times to detach the project because there might be a pending
+    # networking action setup by revert port in the previous step.
+    counter = 10
+    while counter:
+        try:
+            with hil_api_call('project.detach'):
                 hil_client.project.detach(from_project, node)
-                log_info('Node `%s` removed from project `%s`' % (node, from_project))
-                break
-            except FailedAPICallException as ex:
-                if ex.message == 'Node has pending network actions':
-                    counter -= 1
-                    time.sleep(0.5)
-                else:
-                    log_error('HIL reservation failure: Unable to detach node `%s` from project `%s`' % (node, from_project))
-                    raise HILClientFailure(ex.message)
-        if counter == 0:
-            log_error('HIL reservation failure: Unable to detach node `%s` from project `%s`' % (node, from_project))
-            raise HILClientFailure()
-
-
-def hil_free_nodes(nodelist, to_project, hil_client=None):
+            log_info('Node `%s` removed from project `%s`' % (node, from_project))
+            return
+        except FailedAPICallException as ex:
+            if ex.message == 'Node has pending network actions':
+                HIL_DETACH_RETRIES.inc()
+                counter -= 1
+                time.sleep(0.5)
+            else:
+                log_error('HIL reservation failure: Unable to detach node `%s` from project `%s`' % (node, from_project))
+                raise HILClientFailure(ex.message)
+        finally:
+            _invalidate_node_info(node)
+
+    log_error('HIL reservation failure: Unable to detach node `%s` from project `%s`' % (node, from_project))
+    raise HILClientFailure('Node has pending network actions')
+
+
+@_with_node_info_cache
+@traced('hil.free_nodes', attrs=('to_project',))
+def hil_free_nodes(nodelist, to_project, hil_client=None, concurrency=None, journal=None):
     '''
     Cause HIL nodes to move the HIL free pool to the 'to' project.
     Typically, the 'to' project is the Slurm loaner project.
+    The nodes may be given as a list of node names or as a NodeSet.
 
     This method first powers off the nodes, then disconnects all networks,
     then moves the node from the free pool to the 'to' project.
@@ -133,36 +511,62 @@ def hil_free_nodes(nodelist, to_project, hil_client=None):
     We power off the nodes before removing the networks because the IPMI
     network is also controlled by HIL. If we removed all networks, then we will
     not be able to perform any IPMI operations on nodes.
+
+    Nodes are connected on up to <concurrency> nodes at a time, and all failures
+    are reported together in a single HILNodeFailures exception.
+
+    If a reservation journal transition is given, connected nodes are
+    recorded, and nodes already recorded as connected are skipped.
     '''
     if not hil_client:
         hil_client = hil_init()
 
+    connected = journal.done(NODE_CONNECTED) if journal else set()
+
     # Get information from node and ensure that the node is actually connected
     # to <from_project> before proceeding.
-    # iterate over a copy of nodelist, otherwise we can't modify it.
-    for node in nodelist[:]:
-        node_info = show_node(hil_client, node)
-
+    free_nodelist = []
+    for node, project in _get_node_projects(hil_client,
+                                            [node for node in nodelist if node not in connected],
+                                            concurrency):
         # If the node is in the Slurm project now, skip further processing, but don't indicate
         # failure.
-        project = node_info['project']
         if (project == to_project):
             log_info('HIL release: Node `%s` already in `%s` project, skipping' % (node, to_project))
-            nodelist.remove(node)
+        else:
+            free_nodelist.append(node)
 
     # Finally, connect node to <to_project>
-    for node in nodelist:
-        try:
+    succeeded, failures = _run_node_phase(_client_phase(hil_client,
+                                                        lambda c, node: _connect_node(c, to_project, node)),
+                                          free_nodelist, concurrency, name='connect')
+    if journal:
+        journal.record([node for node, _ in succeeded], NODE_CONNECTED)
+    if failures:
+        raise HILNodeFailures('HIL release', failures)
+
+
+@traced('hil.connect_node', attrs=('node',))
+def _connect_node(hil_client, to_project, node):
+    '''
+    Connect a node to a project
+    '''
+    try:
+        with hil_api_call('project.connect'):
             hil_client.project.connect(to_project, node)
-            log_info('Node `%s` connected to project `%s`' % (node, to_project))
-        except FailedAPICallException, ConnectionError:
-            log_error('HIL reservation failure: Unable to connect node `%s` to project `%s`' % (node, to_project))
-            raise HILClientFailure()
+        log_info('Node `%s` connected to project `%s`' % (node, to_project))
+    except FailedAPICallException, ConnectionError:
+        log_error('HIL reservation failure: Unable to connect node `%s` to project `%s`' % (node, to_project))
+        raise HILClientFailure()
+    finally:
+        _invalidate_node_info(node)
 
 
+@traced('hil.remove_all_networks', attrs=('node',))
 def _remove_all_networks(hil_client, node):
     '''
-    Disconnect all networks from all of the node's NICs
+    Disconnect all networks from all of the node's NICs.  The NICs come from
+    the node information cached by the reserve pre-check, if any.
     '''
     node_info = show_node(hil_client, node)
 
@@ -173,38 +577,90 @@ def _remove_all_networks(hil_client, node):
         switch = nic['switch']
         if port and switch:
             try:
-                hil_client.port.port_revert(switch, port)
+                with hil_api_call('port_revert'):
+                    hil_client.port.port_revert(switch, port)
                 log_info('Removed all networks from node `%s`' % node)
             except FailedAPICallException, ConnectionError:
                 log_error('Failed to revert port `%s` on node `%s` switch `%s`' % (port, node, switch))
                 raise HILClientFailure()
+            finally:
+                _invalidate_node_info(node)
+
+
+def _has_networks(hil_client, node):
+    '''
+    Check, with fresh node information, if any of the node's NICs has networks
+    '''
+    node_info = show_node(hil_client, node, refresh=True)
+    return any(nic['networks'] for nic in node_info['nics'])
+
+
+@traced('hil.wait_for_no_networks')
+def _wait_for_no_networks(hil_client, nodelist, timeout=HIL_TIMEOUT, concurrency=None):
+    '''
+    Poll the nodes until none has networks attached, or until the timeout.
+    Each round polls every node still pending, and nodes drop out as their
+    networks are removed.  The delay between rounds backs off, with jitter,
+    so that slow network actions do not cause a steady stream of requests.
+
+    A single timeout covers the whole list.  Returns a dict mapping each node
+    to None, if its networks were removed, or to the exception describing why not.
+    '''
+    outcomes = {}
+    pending = list(nodelist)
+    end_time = time.time() + timeout
+    delay = HIL_POLL_INTERVAL_MIN
+
+    while pending:
+        succeeded, failures = _run_node_phase(_client_phase(hil_client, _has_networks),
+                                              pending, concurrency)
+        outcomes.update(failures)
+        for node, connected in succeeded:
+            if not connected:
+                outcomes[node] = None
+
+        pending = [node for node, connected in succeeded if connected]
+        if not pending:
+            break
+
+        remaining = end_time - time.time()
+        if remaining <= 0:
+            for node in pending:
+                outcomes[node] = HILClientFailure('Networks not removed from node in reasonable time')
+            break
+
+        # don't tight loop.
+        time.sleep(min(remaining, delay * random.uniform(1 - HIL_POLL_JITTER, 1 + HIL_POLL_JITTER)))
+        delay = min(delay * HIL_POLL_BACKOFF, HIL_POLL_INTERVAL_MAX)
+
+    return outcomes
 
 
 def _ensure_no_networks(hil_client, node):
     """Polls on the output of show node to check if networks have been removed.
     It will timeout and raise an exception if it's taking too long.
     """
-    connected_to_network = True
-    end_time = time.time() + HIL_TIMEOUT
-    while connected_to_network:
-        if time.time() > end_time:
-            raise HILClientFailure('Networks not removed from node in reasonable time')
-        node_info = show_node(hil_client, node)
-        for nic in node_info['nics']:
-            if nic['networks']:
-                connected_to_network = True
-                break
-            else:
-                connected_to_network = False
-        # don't tight loop.
-        time.sleep(0.5)
-    return
+    e = _wait_for_no_networks(hil_client, [node])[node]
+    if e is not None:
+        raise e
+
+
+@traced('hil.show_node', attrs=('node', 'refresh'))
+def show_node(hil_client, node, refresh=False):
+    """Returns node information and takes care of handling exceptions.
+    Within a node info cache scope, cached information is returned unless
+    refresh is set; pollers set refresh to see state changes."""
+    cache = _node_info_cache
+    if cache and not refresh:
+        node_info = cache.get(node)
+        if node_info is not None:
+            return node_info
 
-
-def show_node(hil_client, node):
-    """Returns node information and takes care of handling exceptions"""
     try:
-        node_info = hil_client.node.show(node)
+        with hil_api_call('node.show'):
+            node_info = hil_client.node.show(node)
+        if cache:
+            cache.put(node, node_info)
         return node_info
     except FailedAPICallException, ConnectionError:
         # log a note for the admins, and the exact exception before raising
@@ -213,9 +669,15 @@ def show_node(hil_client, node):
         raise HILClientFailure()
 
 
+@traced('hil.power_off_node', attrs=('node',))
 def power_off_node(hil_client, node):
+    '''
+    Power off a node.  Its cached node information, which has no power
+    state, stays valid.
+    '''
     try:
-        hil_client.node.power_off(node)
+        with hil_api_call('power_off'):
+            hil_client.node.power_off(node)
         log_info('Node `%s` succesfully powered off' % node)
     except FailedAPICallException, ConnectionError:
         log_error('HIL reservation failure: Unable to power off node `%s`' % node)
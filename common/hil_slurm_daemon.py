@@ -0,0 +1,140 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+HIL Reservation Monitor Daemon Support
+
+A single-instance lock, shared by the cron-driven and daemon forms of the
+monitor, and a local Unix datagram socket on which the Slurm control daemon
+prolog and epilog wake the monitor daemon when a HIL reservation changes.
+"""
+
+import errno
+import fcntl
+import os
+import select
+import socket
+
+from hil_slurm_logging import log_debug
+
+MONITOR_WAKEUP_MSG = 'wakeup'
+
+
+class MonitorLockHeld(Exception):
+    pass
+
+
+class SingleInstanceLock(object):
+    '''
+    Exclusive, non-blocking flock(2) lock on a file, holding the PID of
+    the owner.  The lock is released by the kernel if the owner exits.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lock_f = None
+
+    def acquire(self):
+        '''
+        Raises MonitorLockHeld if another process holds the lock
+        '''
+        lock_f = open(self.path, 'a+')
+        try:
+            fcntl.flock(lock_f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as e:
+            lock_f.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise MonitorLockHeld('Lock `%s` is held by another process' % self.path)
+            raise
+
+        lock_f.truncate(0)
+        lock_f.write('%d\n' % os.getpid())
+        lock_f.flush()
+        self.lock_f = lock_f
+        return self
+
+    def release(self):
+        if self.lock_f:
+            self.lock_f.close()
+            self.lock_f = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class WakeupSocket(object):
+    '''
+    Unix datagram socket on which the monitor daemon waits for wakeups.
+    Only the lock holder may bind it, so a stale socket file left by a
+    daemon which did not exit cleanly is removed.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.sock = None
+
+    def open(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(0)
+        return self
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def wait(self, timeout):
+        '''
+        Wait up to timeout seconds for a wakeup, then drain any further
+        queued wakeups.  Returns the number of wakeups received.
+        A signal interrupting the wait is treated as a timeout.
+        '''
+        try:
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return 0
+
+        n = 0
+        while readable:
+            try:
+                self.sock.recv(256)
+                n += 1
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+        return n
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def notify_monitor(path):
+    '''
+    Wake the monitor daemon, if one is running.  Never raises: without a
+    daemon, the next cron-driven monitor run picks up the change.
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.setblocking(0)
+        sock.sendto(MONITOR_WAKEUP_MSG, path)
+        return True
+    except socket.error as e:
+        log_debug('HIL monitor not notified (`%s`): %s', path, e)
+        return False
+    finally:
+        sock.close()
+
+# EOF
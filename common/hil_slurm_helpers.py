@@ -7,6 +7,7 @@ May 2017, Tim Donahue	tpd001@gmail.com
 """
 
 import os
+from collections import OrderedDict
 from pwd import getpwnam, getpwuid
 from subprocess import Popen, PIPE
 from time import time
@@ -14,13 +15,50 @@ from time import time
 from hil_slurm_constants import (HIL_RESNAME_PREFIX, HIL_RESNAME_FIELD_SEPARATOR,
                                  HIL_RESERVATION_OPERATIONS, RES_CREATE_FLAGS,
                                  HIL_RESERVE, HIL_RELEASE)
-from hil_slurm_settings import SLURM_INSTALL_DIR
+from hil_slurm_settings import (SLURM_INSTALL_DIR, SCONTROL_SHOW_BACKEND,
+                                SCONTROL_CACHE_ENABLE, SCONTROL_CACHE_FILE,
+                                SCONTROL_CACHE_TTL, SCONTROL_CACHE_MAX_ENTRIES,
+                                PASSWD_CACHE_MAX_ENTRIES)
 from hil_slurm_logging import log_debug, log_info, log_error
+from hil_slurm_cache import ScontrolShowCache
+from hil_slurm_trace import traced
+from hil_slurm_metrics import SCONTROL_CALL_SECONDS, SCONTROL_ERRORS
+from hil_slurm_json import scontrol_show_json_to_dict_list
+from hil_slurm_records import (SlurmReservation, SlurmJob, SlurmPartition,
+                               HILReservationIndex, parse_hil_reservation_name)
+
+
+_scontrol_cache = None
+
+# (user name, UID) -> passwd entries match, in LRU order
+_passwd_cache = OrderedDict()
+
+
+def _get_scontrol_cache():
+    '''
+    Return the process-wide 'scontrol show' cache, or None if disabled
+    '''
+    global _scontrol_cache
+
+    if SCONTROL_CACHE_ENABLE and (_scontrol_cache is None):
+        _scontrol_cache = ScontrolShowCache(SCONTROL_CACHE_FILE, SCONTROL_CACHE_TTL,
+                                            SCONTROL_CACHE_MAX_ENTRIES,
+                                            namespace=SCONTROL_SHOW_BACKEND)
+    return _scontrol_cache
+
+
+def invalidate_scontrol_cache(entity, entity_id=None):
+    '''
+    Drop cached 'scontrol show' output made stale by a create, update or delete
+    '''
+    cache = _get_scontrol_cache()
+    if cache:
+        cache.invalidate(entity, entity_id)
 
 
 def _output_debug_info(fname, stdout_data, stderr_data):
-    log_debug('%s: Stdout  %s' % (fname, stdout_data))
-    log_debug('%s: Stderr  %s' % (fname, stderr_data))
+    log_debug('%s: Stdout  %s', fname, stdout_data)
+    log_debug('%s: Stderr  %s', fname, stderr_data)
 
 
 def _exec_subprocess_cmd(cmd):
@@ -36,13 +74,13 @@ def _exec_subprocess_cmd(cmd):
         stdout_data = None
         stderr_data ='error: Exception on Popen or communicate'
         log_debug('Exception on Popen or communicate')
-        log_debug('Exception: %s' % e)
+        log_debug('Exception: %s', e)
 
     if debug:
         f = _exec_subprocess_cmd.__name__
-        log_debug('%s: cmd is %s' % (f, cmd))
-        log_debug('%s: stdout is %s' % (f, stdout_data))
-        log_debug('%s: stderr is %s' % (f, stderr_data))
+        log_debug('%s: cmd is %s', f, cmd)
+        log_debug('%s: stdout is %s', f, stdout_data)
+        log_debug('%s: stderr is %s', f, stderr_data)
 
     return stdout_data, stderr_data
 
@@ -71,19 +109,25 @@ def _scontrol_show_stdout_to_dict_list(stdout_data, stderr_data, debug=False):
             if (len(kv) == 2):
                 stdout_line_dict[kv[0]] = kv[1]
             elif debug:
-                log_debug('Failed to convert `$s`' % kv_pair)
+                log_debug('Failed to convert `%s`', kv_pair)
 
         stdout_dict_list.append(stdout_line_dict)
 
     return stdout_dict_list
 
 
-def exec_scontrol_cmd(action, entity, entity_id=None, debug=True, **kwargs):
+@traced('scontrol', attrs=('action', 'entity', 'entity_id'))
+def exec_scontrol_cmd(action, entity, entity_id=None, debug=True, json_output=False, **kwargs):
     '''
     Build an 'scontrol <action> <entity>' command and pass to an executor
-    Specify single-line output to support stdout postprocessing
+    Specify single-line or JSON output to support stdout postprocessing
     '''
-    cmd = [os.path.join(SLURM_INSTALL_DIR, 'scontrol'), action]
+    cmd = [os.path.join(SLURM_INSTALL_DIR, 'scontrol')]
+
+    if json_output:
+        cmd.append('--json')
+
+    cmd.append(action)
 
     if entity:
         cmd.append(entity)
@@ -91,31 +135,59 @@ def exec_scontrol_cmd(action, entity, entity_id=None, debug=True, **kwargs):
     if entity_id:
         cmd.append(entity_id)
 
-    cmd.append('-o')
+    if not json_output:
+        cmd.append('-o')
 
     if kwargs:
         for k, v in kwargs.iteritems():
             cmd.append('%s=%s' % (k,v))
 
     if debug:
-        log_debug('exec_scontrol_cmd(): Command  %s' % cmd)
+        log_debug('exec_scontrol_cmd(): Command  %s', cmd)
 
-    stdout_data, stderr_data = _exec_subprocess_cmd(cmd)
+    with SCONTROL_CALL_SECONDS.time(action=action, entity=entity):
+        stdout_data, stderr_data = _exec_subprocess_cmd(cmd)
+    if stderr_data:
+        SCONTROL_ERRORS.inc(action=action, entity=entity)
 
     if debug:
-        log_debug('exec_scontrol_cmd(): Stdout  %s' % stdout_data)
-        log_debug('exec_scontrol_cmd(): Stderr  %s' % stderr_data)
+        log_debug('exec_scontrol_cmd(): Stdout  %s', stdout_data)
+        log_debug('exec_scontrol_cmd(): Stderr  %s', stderr_data)
 
     return stdout_data, stderr_data
 
 
-def exec_scontrol_show_cmd(entity, entity_id, debug=False, **kwargs):
+def _scontrol_show_json_result(entity, entity_id, stdout_data, stderr_data, debug=False):
     '''
-    Run the 'scontrol show' command on the entity and ID
-    Convert standard output data to a list of dictionaries, one per line
+    Decode 'scontrol --json show' output.  Errors are reported in the JSON
+    document itself, so no stdout string matching is required.
     '''
-    stdout_data, stderr_data = exec_scontrol_cmd('show', entity, entity_id, debug=debug, **kwargs)
+    stdout_dict_list = []
 
+    if (len(stderr_data) == 0):
+        stdout_dict_list, stderr_data = scontrol_show_json_to_dict_list(entity, entity_id,
+                                                                        stdout_data)
+    if len(stderr_data):
+        if debug:
+            log_debug('Command `scontrol --json show %s` failed', entity)
+            log_debug('  stderr: %s', stderr_data)
+        stdout_data = None
+
+    return stdout_dict_list, stdout_data, stderr_data
+
+
+# Error strings 'scontrol show' writes to stdout rather than stderr
+
+_SCONTROL_SHOW_ERRORS = {
+    'reservation': 'not found',
+    'job': 'Invalid job id'
+    }
+
+
+def _scontrol_show_text_result(entity, stdout_data, stderr_data, debug=False):
+    '''
+    Convert 'scontrol show' text output to a list of dictionaries, one per line
+    '''
     # Check for errors.
     # If anything in stderr, return it
     # Next, check if stdout includes various error strings - 'scontrol show'
@@ -129,20 +201,15 @@ def exec_scontrol_show_cmd(entity, entity_id, debug=False, **kwargs):
 
     stdout_dict_list = []
 
-    entity_error_dict = {
-        'reservation': 'not found',
-        'job': 'Invalid job id'
-        }
-
     cmd = 'scontrol show ' + entity
     if (len(stderr_data) != 0):
-        log_debug('Command `%s` failed' % cmd)
-        log_debug('  stderr: %s' % stderr_data)
+        log_debug('Command `%s` failed', cmd)
+        log_debug('  stderr: %s', stderr_data)
 
-    elif (entity in entity_error_dict) and (entity_error_dict[entity] in stdout_data):
+    elif (entity in _SCONTROL_SHOW_ERRORS) and (_SCONTROL_SHOW_ERRORS[entity] in stdout_data):
         if debug:
-            log_debug('Command `%s` failed' % cmd)
-            log_debug('  stderr: %s' % stderr_data)
+            log_debug('Command `%s` failed', cmd)
+            log_debug('  stderr: %s', stderr_data)
         stderr_data = stdout_data
         stdout_data = None
 
@@ -152,6 +219,40 @@ def exec_scontrol_show_cmd(entity, entity_id, debug=False, **kwargs):
     return stdout_dict_list, stdout_data, stderr_data
 
 
+def exec_scontrol_show_cmd(entity, entity_id, debug=False, **kwargs):
+    '''
+    Run the 'scontrol show' command on the entity and ID
+    Convert standard output data to a list of dictionaries, one per line
+    (text backend) or one per record (JSON backend)
+    Output for plain (no kwargs) queries is served from the query cache, if fresh.
+    Only successful output is cached, so a 'not found' answer is asked again.
+    '''
+    json_backend = (SCONTROL_SHOW_BACKEND == 'json')
+
+    cache = None if kwargs else _get_scontrol_cache()
+    cached = cache.get(entity, entity_id) if cache else None
+
+    if cached:
+        stdout_data, stderr_data = cached
+        if debug:
+            log_debug('exec_scontrol_show_cmd(): Cached output for %s `%s`', entity, entity_id)
+    else:
+        stdout_data, stderr_data = exec_scontrol_cmd('show', entity, entity_id, debug=debug,
+                                                     json_output=json_backend, **kwargs)
+
+    if json_backend:
+        stdout_dict_list, show_stdout, show_stderr = _scontrol_show_json_result(
+            entity, entity_id, stdout_data, stderr_data, debug)
+    else:
+        stdout_dict_list, show_stdout, show_stderr = _scontrol_show_text_result(
+            entity, stdout_data, stderr_data, debug)
+
+    if cache and not cached and (show_stdout is not None) and not len(show_stderr):
+        cache.put(entity, entity_id, stdout_data, stderr_data)
+
+    return stdout_dict_list, show_stdout, show_stderr
+
+
 def create_slurm_reservation(name, user, t_start_s, t_end_s, nodes=None,
                              flags=RES_CREATE_FLAGS, features=None, debug=False):
     '''
@@ -162,24 +263,31 @@ def create_slurm_reservation(name, user, t_start_s, t_end_s, nodes=None,
 
     t_end_arg = {'duration': 'UNLIMITED'} if t_end_s is None else {'endtime': t_end_s}
 
-    return exec_scontrol_cmd('create', 'reservation', entity_id=None, debug=debug,
-                             ReservationName=name, starttime=t_start_s,
-                             user=user, nodes=nodes, flags=flags, features=features,
-                             **t_end_arg)
+    stdout_data, stderr_data = exec_scontrol_cmd('create', 'reservation', entity_id=None,
+                                                 debug=debug, ReservationName=name,
+                                                 starttime=t_start_s, user=user, nodes=nodes,
+                                                 flags=flags, features=features, **t_end_arg)
+    invalidate_scontrol_cache('reservation', name)
+    return stdout_data, stderr_data
 
 
 def delete_slurm_reservation(name, debug=False):
     '''
     Delete a Slurm reservation via 'scontrol delete reservation=<name>'
     '''
-    return exec_scontrol_cmd('delete', None, debug=debug, reservation=name)
+    stdout_data, stderr_data = exec_scontrol_cmd('delete', None, debug=debug, reservation=name)
+    invalidate_scontrol_cache('reservation', name)
+    return stdout_data, stderr_data
 
 
 def update_slurm_reservation(name, debug=False, **kwargs):
     '''
     Update a Slurm reservation via 'scontrol update reservation=<name> <kwargs>'
     '''
-    return exec_scontrol_cmd('update', None, reservation=name, debug=debug, **kwargs)
+    stdout_data, stderr_data = exec_scontrol_cmd('update', None, reservation=name,
+                                                 debug=debug, **kwargs)
+    invalidate_scontrol_cache('reservation', name)
+    return stdout_data, stderr_data
 
 
 def get_hil_reservation_name(env_dict, restype_s, t_start_s):
@@ -197,42 +305,32 @@ def get_hil_reservation_name(env_dict, restype_s, t_start_s):
     return resname
 
 
-def parse_hil_reservation_name(resname):
+def _passwd_user_uid_match(uname, uid):
     '''
-    Attempt to split a reservation name into HIL reservation name components:
-    HIL reservation prefix, reservation type, user name, uid, and time
-
-    This looks like overkill, except for the presence of other reservations in the
-    system, with semi-arbitrary names.
+    Check that the user name and UID refer to the same passwd entry.
+    Results are memoized in a bounded LRU cache, as the same few users own
+    the HIL reservations seen on every monitor pass.
     '''
-    prefix = None
-    restype = None
-    user = None
-    uid = None
-    time_s = None
-
-    if resname.startswith(HIL_RESNAME_PREFIX):
-        resname_partitions = resname.partition(HIL_RESNAME_PREFIX)
-        prefix = resname_partitions[1]
-
+    key = (uname, uid)
+    try:
+        match = _passwd_cache.pop(key)
+    except KeyError:
         try:
-            restype, user, uid, time_s = resname_partitions[2].split(HIL_RESNAME_FIELD_SEPARATOR)
-        except:
-            pass
+            match = (getpwnam(uname) == getpwuid(int(uid)))
+        except (KeyError, TypeError, ValueError):
+            match = False
 
-    return prefix, restype, user, uid, time_s
+        if len(_passwd_cache) >= PASSWD_CACHE_MAX_ENTRIES:
+            _passwd_cache.popitem(last=False)
 
+    _passwd_cache[key] = match
+    return match
 
-def is_hil_reservation(resname, restype_in):
+
+def _is_hil_reservation_name(prefix, restype, uname, uid, restype_in):
     '''
-    Check if the passed reservation name:
-    - Starts with the HIL reservation prefix
-    - Is a HIL reserve or release reservation
-    - Contains a valid user name and UID
-    - Optionally, is specifically a reserve or release reservation
-    - $$$ Could verify nodes have HIL property set
+    Validate parsed HIL reservation name components
     '''
-    prefix, restype, uname, uid, _ = parse_hil_reservation_name(resname)
     if (prefix != HIL_RESNAME_PREFIX):
 #       log_error('No HIL reservation prefix')
         return False
@@ -245,20 +343,26 @@ def is_hil_reservation(resname, restype_in):
         log_error('Unknown reservation type')
         return False
 
-    try:
-        pwdbe1 = getpwnam(uname)
-        pwdbe2 = getpwuid(int(uid))
-        if pwdbe1 != pwdbe2:
-#           log_error('Reservation `%s`: User and UID inconsistent' % resname)
-            return False
-
-    except KeyError:
-#       log_error('Key error')
+    if not _passwd_user_uid_match(uname, uid):
+#       log_error('Reservation `%s`: User and UID inconsistent' % resname)
         return False
 
     return True
 
 
+def is_hil_reservation(resname, restype_in):
+    '''
+    Check if the passed reservation name:
+    - Starts with the HIL reservation prefix
+    - Is a HIL reserve or release reservation
+    - Contains a valid user name and UID
+    - Optionally, is specifically a reserve or release reservation
+    - $$$ Could verify nodes have HIL property set
+    '''
+    prefix, restype, uname, uid, _ = parse_hil_reservation_name(resname)
+    return _is_hil_reservation_name(prefix, restype, uname, uid, restype_in)
+
+
 def get_object_data(what_obj, obj_id, debug=False):
     '''
     Get a list of dictionaries of information on the object, via
@@ -268,43 +372,66 @@ def get_object_data(what_obj, obj_id, debug=False):
                                                                          obj_id, debug=False)
     if (len(stderr_data) != 0):
         if debug:
-            log_debug('Failed to retrieve data for %s `%s`' % (what_obj, obj_id))
-            log_debug('  %s' % stderr_data)
+            log_debug('Failed to retrieve data for %s `%s`', what_obj, obj_id)
+            log_debug('  %s', stderr_data)
 
     return objdata_dict_list
 
 
 def get_partition_data(partition_id):
     '''
-    Get a list of dictionaries of information on the partition(s),
+    Get a list of partition records for the partition(s),
     via 'scontrol show partition'
     '''
-    return get_object_data('partition', partition_id, debug=False)
+    return [SlurmPartition.from_scontrol(d)
+            for d in get_object_data('partition', partition_id, debug=False) if d]
 
 
 def get_job_data(job_id):
     '''
-    Get a list of dictionaries of information on the job(s),
+    Get a list of job records for the job(s),
     via 'scontrol show job'
     '''
-    return get_object_data('job', job_id, debug=False)
+    return [SlurmJob.from_scontrol(d)
+            for d in get_object_data('job', job_id, debug=False) if d]
 
 
-def get_hil_reservations():
+def get_reservation_data(resname):
     '''
-    Get a list of all Slurm reservations, return that subset which are HIL reservations
+    Get a list of reservation records for the reservation(s),
+    via 'scontrol show reservation'
     '''
-    resdata_dict_list = []
+    return [SlurmReservation.from_scontrol(d)
+            for d in get_object_data('reservation', resname, debug=False) if d]
+
 
+def get_hil_reservations():
+    '''
+    Get a list of all Slurm reservations, return records for that subset which
+    are HIL reservations
+    Non-HIL reservations are dropped on name prefix alone, before a record is built.
+    '''
     resdata_dict_list, stdout_data, stderr_data = exec_scontrol_show_cmd('reservation', None)
 
+    hil_reservation_list = []
     for resdata_dict in resdata_dict_list:
-        if resdata_dict and is_hil_reservation(resdata_dict['ReservationName'], None):
+        if not resdata_dict:
+            continue
+        if not resdata_dict.get('ReservationName', '').startswith(HIL_RESNAME_PREFIX):
             continue
-        else:
-            resdata_dict_list.remove(resdata_dict)
 
-    return resdata_dict_list
+        res = SlurmReservation.from_scontrol(resdata_dict)
+        if _is_hil_reservation_name(res.prefix, res.restype, res.user, res.uid, None):
+            hil_reservation_list.append(res)
+
+    return hil_reservation_list
+
+
+def get_hil_reservation_index():
+    '''
+    Get an index of all HIL reservations, keyed by name components
+    '''
+    return HILReservationIndex(get_hil_reservations())
 
 
 def log_hil_reservation(resname, stderr_data, t_start_s=None, t_end_s=None):
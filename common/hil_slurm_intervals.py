@@ -0,0 +1,131 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+Reservation Interval Index
+
+Answers 'which reservations hold node X at time T' and 'which
+reservations overlap these nodes between T1 and T2' without scanning
+every reservation.  Reservations are sorted by start time, with a tree
+of maximum end times over them, so a time window query visits only the
+reservations which overlap it plus O(log n) tree nodes.  Node overlap is
+then checked on the candidates' NodeSets.  A sweep for conflicts between
+all the reservations goes node by node.
+
+Reservation times are half-open intervals [t_start, t_end); a missing
+start or end time is taken as unbounded.
+"""
+
+from bisect import bisect_left, bisect_right
+
+from hil_slurm_nodeset import NodeSet
+
+_INF = float('inf')
+
+
+def _interval(res):
+    t_start = res.t_start if res.t_start is not None else -_INF
+    t_end = res.t_end if res.t_end is not None else _INF
+    return t_start, t_end
+
+
+class ReservationIntervalIndex(object):
+    '''
+    Reservation records indexed by time, for overlap queries
+    '''
+    def __init__(self, reservations=()):
+        items = sorted(((_interval(res), res) for res in reservations),
+                       key=lambda item: item[0][0])
+        self._starts = [t_start for (t_start, t_end), res in items]
+        self._ends = [t_end for (t_start, t_end), res in items]
+        self._res = [res for interval, res in items]
+
+        # Maximum end time of each subtree, over the reservations in start order
+        self._size = 1
+        while self._size < len(items):
+            self._size *= 2
+        self._max_end = [-_INF] * (2 * self._size)
+        self._max_end[self._size:self._size + len(items)] = self._ends
+        for i in xrange(self._size - 1, 0, -1):
+            self._max_end[i] = max(self._max_end[2 * i], self._max_end[2 * i + 1])
+
+    def __len__(self):
+        return len(self._res)
+
+    def __iter__(self):
+        return iter(self._res)
+
+    def _ending_after(self, n, t):
+        '''
+        Return the indexes of the first n reservations, in start order,
+        which end after t
+        '''
+        found = []
+        stack = [(1, 0, self._size)]
+        while stack:
+            i, lo, hi = stack.pop()
+            if (lo >= n) or (self._max_end[i] <= t):
+                continue
+            if hi - lo == 1:
+                found.append(lo)
+            else:
+                mid = (lo + hi) // 2
+                stack.append((2 * i + 1, mid, hi))
+                stack.append((2 * i, lo, mid))
+        return found
+
+    def overlapping(self, t_start, t_end):
+        '''
+        Return the reservations overlapping the time window [t_start, t_end)
+        '''
+        n = bisect_left(self._starts, t_end)
+        return [self._res[i] for i in self._ending_after(n, t_start)]
+
+    def active(self, t):
+        '''
+        Return the reservations active at time t
+        '''
+        n = bisect_right(self._starts, t)
+        return [self._res[i] for i in self._ending_after(n, t)]
+
+    def covering(self, node, t):
+        '''
+        Return the reservations holding the node at time t
+        '''
+        return [res for res in self.active(t) if node in res.nodeset]
+
+    def conflicts(self, nodes, t_start, t_end, ignore=()):
+        '''
+        Return the reservations, other than those named in ignore, holding
+        any of the nodes at any time in [t_start, t_end)
+        '''
+        nodeset = nodes if isinstance(nodes, NodeSet) else NodeSet(nodes)
+        return [res for res in self.overlapping(t_start, t_end)
+                if (res.name not in ignore) and not nodeset.isdisjoint(res.nodeset)]
+
+    def sweep(self, t_now):
+        '''
+        Sweep through the reservations in start order once.  Returns
+        (conflicts, ended): the pairs of reservations overlapping in both
+        time and nodes, each as (earlier, later) by start time, and the
+        reservations which ended before t_now.
+        Each node keeps the reservations holding it which are still running,
+        so a reservation is compared only with those sharing one of its
+        nodes, rather than with every reservation running at its start.
+        '''
+        conflicts = []
+        ended = []
+        running = {}
+        for i, res in enumerate(self._res):
+            t_start, t_end = self._starts[i], self._ends[i]
+            if t_end <= t_now:
+                ended.append(res)
+            earlier = set()
+            for node in res.nodeset:
+                node_running = [(t, j) for t, j in running.get(node, ()) if t > t_start]
+                earlier.update(j for t, j in node_running)
+                node_running.append((t_end, i))
+                running[node] = node_running
+            conflicts.extend((self._res[j], res) for j in sorted(earlier))
+        return conflicts, ended
+
+# EOF
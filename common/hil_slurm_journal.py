@@ -0,0 +1,163 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+HIL Reservation Transition Journal
+
+A local SQLite journal of the progress of each HIL reservation transition:
+the HIL phases completed on each node (powered off, ports reverted,
+detached, connected) and the outcome of each Slurm reservation create or
+delete.  If the monitor fails part way through a transition, the next
+monitor pass resumes from the last completed step instead of repeating
+HIL operations already done.
+
+Entries for a reservation are dropped once its transition completes, or
+once the reservation no longer exists.
+"""
+
+import sqlite3
+import threading
+from time import time
+
+from hil_slurm_logging import log_debug, log_error
+from hil_slurm_settings import ULSR_JOURNAL_ENABLE, ULSR_JOURNAL_FILE
+
+# Node phases
+
+NODE_POWERED_OFF = 'powered_off'
+NODE_PORTS_REVERTED = 'ports_reverted'
+NODE_DETACHED = 'detached'
+NODE_CONNECTED = 'connected'
+
+# Slurm reservation operations and their outcomes
+
+SLURM_CREATE_RELEASE = 'create_release_reservation'
+SLURM_DELETE_RELEASE = 'delete_release_reservation'
+
+SLURM_OP_DONE = 'done'
+SLURM_OP_FAILED = 'failed'
+
+_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS node_phase (
+           resname TEXT NOT NULL, node TEXT NOT NULL, phase TEXT NOT NULL,
+           t_updated REAL NOT NULL, PRIMARY KEY (resname, node, phase))''',
+    '''CREATE TABLE IF NOT EXISTS slurm_op (
+           resname TEXT NOT NULL, op TEXT NOT NULL, outcome TEXT NOT NULL,
+           detail TEXT, t_updated REAL NOT NULL, PRIMARY KEY (resname, op))'''
+    ]
+
+
+class ReservationJournal(object):
+    '''
+    Journal store shared by the threads of a process.  SQLite serializes
+    writers from different processes; the lock serializes the threads.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self.lock, self.db:
+            for statement in _SCHEMA:
+                self.db.execute(statement)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def transition(self, resname):
+        return ReservationTransition(self, resname)
+
+    def record_node_phase(self, resname, nodes, phase):
+        now = time()
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO node_phase VALUES (?, ?, ?, ?)',
+                                [(resname, node, phase, now) for node in nodes])
+
+    def nodes_in_phase(self, resname, phase):
+        with self.lock:
+            rows = self.db.execute('SELECT node FROM node_phase WHERE resname = ? AND phase = ?',
+                                   (resname, phase)).fetchall()
+        return set(row[0] for row in rows)
+
+    def record_slurm_op(self, resname, op, outcome, detail=None):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO slurm_op VALUES (?, ?, ?, ?, ?)',
+                            (resname, op, outcome, detail, time()))
+
+    def slurm_op_outcome(self, resname, op):
+        with self.lock:
+            row = self.db.execute('SELECT outcome FROM slurm_op WHERE resname = ? AND op = ?',
+                                  (resname, op)).fetchone()
+        return row[0] if row else None
+
+    def reservations(self):
+        with self.lock:
+            rows = self.db.execute('SELECT resname FROM node_phase UNION '
+                                   'SELECT resname FROM slurm_op').fetchall()
+        return set(row[0] for row in rows)
+
+    def forget(self, resname):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM node_phase WHERE resname = ?', (resname,))
+            self.db.execute('DELETE FROM slurm_op WHERE resname = ?', (resname,))
+
+    def prune(self, live_resnames):
+        '''
+        Drop the entries of reservations which no longer exist
+        '''
+        stale = self.reservations() - set(live_resnames)
+        for resname in stale:
+            log_debug('Dropping journal entries of reservation `%s`', resname)
+            self.forget(resname)
+        return stale
+
+
+class ReservationTransition(object):
+    '''
+    The journal entries of a single reservation, passed to the HIL node
+    operations
+    '''
+    def __init__(self, journal, resname):
+        self.journal = journal
+        self.resname = resname
+
+    def done(self, phase):
+        return self.journal.nodes_in_phase(self.resname, phase)
+
+    def record(self, nodes, phase):
+        if nodes:
+            self.journal.record_node_phase(self.resname, nodes, phase)
+
+    def slurm_op_outcome(self, op):
+        return self.journal.slurm_op_outcome(self.resname, op)
+
+    def record_slurm_op(self, op, stderr_data):
+        outcome = SLURM_OP_FAILED if stderr_data else SLURM_OP_DONE
+        self.journal.record_slurm_op(self.resname, op, outcome, stderr_data or None)
+
+    def forget(self):
+        self.journal.forget(self.resname)
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_reservation_journal():
+    '''
+    Return the process-wide journal, or None if disabled or unavailable.
+    Without a journal, transitions restart from the beginning after failures.
+    '''
+    global _journal
+
+    if not ULSR_JOURNAL_ENABLE:
+        return None
+
+    with _journal_lock:
+        if _journal is None:
+            try:
+                _journal = ReservationJournal(ULSR_JOURNAL_FILE)
+            except sqlite3.Error as e:
+                log_error('Unable to open reservation journal `%s`: %s', ULSR_JOURNAL_FILE, e)
+    return _journal
+
+# EOF
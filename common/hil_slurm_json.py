@@ -0,0 +1,220 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+Slurm 'scontrol --json show' Output Decoder
+
+Converts the JSON documents emitted by 'scontrol --json show reservation|job|partition'
+into the same keyword / value dictionaries produced from 'scontrol show -o'
+output, so callers are independent of the selected scontrol backend.
+Values containing spaces or '=' survive intact, unlike the line-split parser.
+
+Times and limits are not formatted as scontrol would print them: times are
+given as seconds since the epoch and limits in seconds, or None if unset or
+unlimited, which the Slurm records take as is.
+
+Both the flat (v0.0.38) and the {set, infinite, number} (v0.0.39+) forms of
+numeric fields are accepted.
+"""
+
+import json
+
+# Slurm 'infinite' and 'not set' sentinels for 32-bit numeric fields
+
+SLURM_INFINITE = 0xffffffff
+SLURM_NO_VAL = 0xfffffffe
+
+# Top-level document key holding the records for each entity
+
+JSON_ENTITY_KEYS = {
+    'reservation': 'reservations',
+    'job': 'jobs',
+    'partition': 'partitions'
+    }
+
+# Error strings matching those written by 'scontrol show -o', used when a
+# specific entity is requested but not returned
+
+JSON_NOT_FOUND_FMTS = {
+    'reservation': 'Reservation %s not found',
+    'job': 'slurm_load_jobs error: Invalid job id specified (%s)',
+    'partition': 'Partition %s not found'
+    }
+
+
+def _str(value):
+    if value is None:
+        return '(null)'
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def _get(record, path, default=None):
+    '''
+    Look up a dotted path in a nested record
+    '''
+    value = record
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return default
+        value = value[key]
+    return value
+
+
+def _first(record, *paths):
+    '''
+    Return the first value found among alternative paths, for fields which
+    moved between Slurm JSON schema versions
+    '''
+    for path in paths:
+        value = _get(record, path)
+        if value is not None:
+            return value
+    return None
+
+
+def _number(value):
+    '''
+    Returns (number, infinite) for plain and {set, infinite, number} values
+    Unset values are returned as (None, False)
+    '''
+    if isinstance(value, dict):
+        if value.get('infinite'):
+            return None, True
+        if not value.get('set', True):
+            return None, False
+        value = value.get('number')
+
+    if value is None or value == SLURM_NO_VAL:
+        return None, False
+    if value == SLURM_INFINITE:
+        return None, True
+    return int(value), False
+
+
+def _time(value):
+    '''
+    Return an epoch time, or None if not set
+    '''
+    t, infinite = _number(value)
+    if infinite or not t:
+        return None
+    return t
+
+
+def _minutes(value):
+    '''
+    Return a limit in minutes as seconds, or None if unlimited or not set
+    '''
+    minutes, infinite = _number(value)
+    if infinite or minutes is None:
+        return None
+    return minutes * 60
+
+
+def _list_s(value):
+    if isinstance(value, list):
+        return ','.join(_str(v) for v in value) if value else '(null)'
+    return _str(value)
+
+
+def _flags(record, path='flags'):
+    return set(_str(f).upper() for f in (_get(record, path) or []))
+
+
+def _reservation_dict(r):
+    return {
+        'ReservationName': _str(r.get('name')),
+        'StartTime': _time(r.get('start_time')),
+        'EndTime': _time(r.get('end_time')),
+        'Nodes': _str(r.get('node_list') or '(null)'),
+        'NodeCnt': _str(_number(r.get('node_count'))[0]),
+        'Features': _str(r.get('features') or '(null)'),
+        'PartitionName': _str(r.get('partition') or '(null)'),
+        'Flags': _list_s(r.get('flags')),
+        'Users': _str(r.get('users') or '(null)'),
+        'Accounts': _str(r.get('accounts') or '(null)'),
+        }
+
+
+def _job_dict(j):
+    job_state = j.get('job_state')
+    if isinstance(job_state, list):
+        job_state = job_state[0] if job_state else None
+
+    return {
+        'JobId': _str(_number(j.get('job_id'))[0]),
+        'JobName': _str(j.get('name')),
+        'UserId': '%s(%s)' % (_str(j.get('user_name')), _str(_number(j.get('user_id'))[0])),
+        'JobState': _str(job_state),
+        'Partition': _str(j.get('partition')),
+        'Reservation': _str(j.get('resv_name') or '(null)'),
+        'TimeLimit': _minutes(j.get('time_limit')),
+        'StartTime': _time(j.get('start_time')),
+        'EndTime': _time(j.get('end_time')),
+        'NodeList': _str(j.get('nodes') or '(null)'),
+        }
+
+
+def _partition_dict(p):
+    nodes = _first(p, 'nodes.configured', 'nodes')
+    state = _first(p, 'partition.state', 'state')
+    if isinstance(state, list):
+        state = state[0] if state else None
+
+    flags = _flags(p) | _flags(p, 'partition.flags')
+    oversubscribe_flags = _flags(p, 'maximums.oversubscribe.flags')
+    if 'FORCE' in oversubscribe_flags:
+        shared = 'FORCE'
+    elif 'EXCLUSIVE' in oversubscribe_flags:
+        shared = 'EXCLUSIVE'
+    elif (_number(_get(p, 'maximums.oversubscribe.jobs'))[0] or 0) > 1:
+        shared = 'YES'
+    else:
+        shared = 'NO'
+
+    return {
+        'PartitionName': _str(p.get('name')),
+        'Nodes': _str(nodes or '(null)'),
+        'State': _str(state),
+        'Default': 'YES' if 'DEFAULT' in flags else 'NO',
+        'ExclusiveUser': 'YES' if 'EXCLUSIVE_USER' in flags else 'NO',
+        'Shared': shared,
+        'OverSubscribe': shared,
+        'MaxTime': _minutes(_first(p, 'maximums.time', 'maximum_time', 'max_time')),
+        }
+
+
+JSON_RECORD_CONVERTERS = {
+    'reservation': _reservation_dict,
+    'job': _job_dict,
+    'partition': _partition_dict
+    }
+
+
+def scontrol_show_json_to_dict_list(entity, entity_id, stdout_data):
+    '''
+    Decode 'scontrol --json show <entity> [<entity_id>]' output into a list of dicts
+    Returns (dict_list, error_s); error_s is empty on success.
+    '''
+    try:
+        document = json.loads(stdout_data)
+    except (TypeError, ValueError) as e:
+        return [], 'error: Unable to decode scontrol JSON output: %s' % e
+
+    errors = [_str(err.get('description') or err.get('error'))
+              for err in (document.get('errors') or []) if isinstance(err, dict)]
+
+    records = document.get(JSON_ENTITY_KEYS[entity]) or []
+    convert = JSON_RECORD_CONVERTERS[entity]
+    dict_list = [convert(record) for record in records]
+
+    if errors and not dict_list:
+        return [], '; '.join(errors)
+
+    if entity_id and not dict_list:
+        return [], JSON_NOT_FOUND_FMTS[entity] % entity_id
+
+    return dict_list, ''
+
+# EOF
@@ -3,55 +3,202 @@ MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
 
 HIL Slurm Logging support
 
+Messages take logging-style arguments, log_debug('Command %s', cmd), and
+are formatted only if their level is enabled.  Once log_init() has run,
+records are handed to a queue and written to the log file by a listener
+thread, so callers do not wait on file I/O.  The queue is drained when
+the process exits, or on log_shutdown().
+
+Log files are written as text, or as JSON lines if ULSR_LOG_FORMAT is 'json'.
+
 June 2017, Tim Donahue	tpd001@gmail.com
 """
 
+import atexit
+import json
 import logging
-from sys import exc_info
+import os
+import threading
 import traceback
+from Queue import Queue
+from sys import exc_info
+
+from hil_slurm_settings import ULSR_LOG_QUEUE, ULSR_LOG_FORMAT
 
 info_debug_sep = '=============================================================='
 warn_error_sep = '--------------------------------------------------------------'
 
-
-app_logger = None
+LOG_DATE_FMT = '%Y-%m-%d %H:%M:%S'
 
 
-def log_init(name, file, level):
-    logging.basicConfig(filename=file, level=level,
-                        format='%(asctime)s %(levelname)-7s %(message)s',
-                        datefmt='%Y-%m-%d %H:%M:%S')
-
+app_logger = None
 
-def _log_common(logger_fn, message=None, separator_s=None, print_exception=False):
+_handler = None
+_listener = None
+
+
+class _Deferred(object):
+    '''
+    A log argument formatted by the listener thread, not the caller
+    '''
+    __slots__ = ('fn', 'args')
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self):
+        return self.fn(*self.args)
+
+
+def _format_traceback(tb):
+    return repr(traceback.extract_tb(tb))
+
+
+class JSONLinesFormatter(logging.Formatter):
+    '''
+    Format each record as a single line JSON object
+    '''
+    def format(self, record):
+        d = {'time': self.formatTime(record, LOG_DATE_FMT),
+             'level': record.levelname,
+             'logger': record.name,
+             'pid': record.process,
+             'thread': record.threadName,
+             'message': record.getMessage()}
+        return json.dumps(d)
+
+
+class _QueueHandler(logging.Handler):
+    '''
+    Hand records to the listener thread.  The message is merged with its
+    arguments here, unless deferred, so later changes to the arguments do
+    not show in the log.
+    '''
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            if record.args and not any(isinstance(arg, _Deferred) for arg in record.args):
+                record.msg = record.getMessage()
+                record.args = None
+            record.exc_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class _QueueListener(object):
+    '''
+    Thread writing queued records to the target handler
+    '''
+    _stop = object()
+
+    def __init__(self, queue, handler):
+        self.queue = queue
+        self.handler = handler
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, name='ulsr-log-listener')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is self._stop:
+                break
+            self.handler.handle(record)
+        self.handler.flush()
+
+    def stop(self):
+        # A forked child shares the queue object but not the thread
+        if (os.getpid() == self.pid) and self.thread.is_alive():
+            self.queue.put(self._stop)
+            self.thread.join()
+        self.handler.close()
+
+
+def _make_formatter(log_format):
+    if log_format == 'json':
+        return JSONLinesFormatter()
+    return logging.Formatter('%(asctime)s %(levelname)-7s %(message)s', datefmt=LOG_DATE_FMT)
+
+
+def log_init(name, file, level, log_format=ULSR_LOG_FORMAT, queued=ULSR_LOG_QUEUE):
+    '''
+    Log to the file, at and above the level
+    '''
+    global _handler, _listener
+
+    if _handler:
+        return
+
+    file_handler = logging.FileHandler(file)
+    file_handler.setFormatter(_make_formatter(log_format))
+
+    if queued:
+        queue = Queue()
+        _listener = _QueueListener(queue, file_handler)
+        _handler = _QueueHandler(queue)
+    else:
+        _handler = file_handler
+
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+
+def log_shutdown():
+    '''
+    Write any queued records and close the log file
+    '''
+    global _handler, _listener
+
+    if _handler:
+        logging.getLogger().removeHandler(_handler)
+        _handler.close()
+        _handler = None
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(log_shutdown)
+
+
+def _log_common(level, message, args, separator_s=None, print_exception=False):
+    if not logging.root.isEnabledFor(level):
+        return
     if separator_s:
-        logger_fn(separator_s)
+        logging.log(level, separator_s)
     if message:
-        logger_fn(message)
+        logging.log(level, message, *args)
     if print_exception:
-        exc_type, exc_value_s, exc_traceback_obj = exc_info()
-        exc_traceback_s = repr(traceback.extract_tb(exc_traceback_obj))
-        if exc_value_s:
-            logger_fn(' Exception: %s' % exc_value_s)
-            logger_fn(' Traceback: %s' % exc_traceback_s)
+        exc_type, exc_value, exc_traceback_obj = exc_info()
+        if exc_type is not None:
+            logging.log(level, ' Exception: %s', exc_value)
+            logging.log(level, ' Traceback: %s', _Deferred(_format_traceback, exc_traceback_obj))
 
 
-def log_error(message=None, separator=True):
-    s = warn_error_sep if separator else None
-    _log_common(logging.error, message, separator_s=s, print_exception=True)
+def log_error(message=None, *args, **kwargs):
+    s = warn_error_sep if kwargs.get('separator', True) else None
+    _log_common(logging.ERROR, message, args, separator_s=s, print_exception=True)
 
 
-def log_warning(message=None):
-    _log_common(logging.warning, message, separator_s=warn_error_sep, print_exception=True)
+def log_warning(message=None, *args):
+    _log_common(logging.WARNING, message, args, separator_s=warn_error_sep,
+                print_exception=True)
 
 
-def log_info(message, separator=False):
-    s = info_debug_sep if separator else None
-    _log_common(logging.info, message, separator_s=s, print_exception=False)
+def log_info(message, *args, **kwargs):
+    s = info_debug_sep if kwargs.get('separator', False) else None
+    _log_common(logging.INFO, message, args, separator_s=s, print_exception=False)
 
 
-def log_debug(message, separator=False):
-    s = info_debug_sep if separator else None
-    _log_common(logging.debug, message, separator_s=s, print_exception=False)
+def log_debug(message, *args, **kwargs):
+    s = info_debug_sep if kwargs.get('separator', False) else None
+    _log_common(logging.DEBUG, message, args, separator_s=s, print_exception=False)
 
 # EOF
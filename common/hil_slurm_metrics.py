@@ -0,0 +1,301 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+ULSR Metrics
+
+Counters and histograms in the Prometheus text exposition format.
+
+Short-lived processes (the prolog, epilog and cron-driven monitor) add
+their counts to a file read by the node exporter textfile collector, one
+file per process type.  The monitor daemon serves its metrics over HTTP
+at /metrics.
+"""
+
+import fcntl
+import os
+import re
+import tempfile
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from contextlib import contextmanager
+from time import time
+
+from hil_slurm_logging import log_debug, log_error
+from hil_slurm_settings import ULSR_METRICS_ENABLE, ULSR_METRICS_TEXTFILE_DIR
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*(?:\{.*\})?)\s+(\S+)$')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return '%d' % value
+    return repr(float(value))
+
+
+def _sample_key(name, labels):
+    if not labels:
+        return name
+    return '%s{%s}' % (name, ','.join('%s="%s"' % (k, _escape(v)) for k, v in labels))
+
+
+class _Metric(object):
+
+    metric_type = None
+
+    def __init__(self, name, help_s, labelnames=()):
+        self.name = name
+        self.help_s = help_s
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _label_values(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('Metric `%s` takes labels %s' % (self.name, self.labelnames))
+        return tuple(str(labels[k]) for k in self.labelnames)
+
+    def header(self):
+        return ['# HELP %s %s' % (self.name, self.help_s),
+                '# TYPE %s %s' % (self.name, self.metric_type)]
+
+    def samples(self):
+        '''
+        Return (sample key, value) pairs, in exposition order
+        '''
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(_sample_key(self.name, zip(self.labelnames, key)), value)
+                for key, value in items]
+
+
+class Histogram(_Metric):
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, help_s, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help_s, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        '''
+        Observe the duration of the enclosed block, whether or not it raises
+        '''
+        t_start = time()
+        try:
+            yield
+        finally:
+            self.observe(time() - t_start, **labels)
+
+    def count(self, **labels):
+        counts, total = self._values.get(self._label_values(labels), ([0], 0))
+        return counts[-1]
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total))
+                           for key, (counts, total) in self._values.iteritems())
+        samples = []
+        for key, (counts, total) in items:
+            labels = zip(self.labelnames, key)
+            for bound, count in zip(self.buckets, counts):
+                samples.append((_sample_key(self.name + '_bucket',
+                                            labels + [('le', _format_value(bound))]), count))
+            samples.append((_sample_key(self.name + '_sum', labels), total))
+            samples.append((_sample_key(self.name + '_count', labels), counts[-1]))
+        return samples
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_s, labelnames=()):
+        return self.register(Counter(name, help_s, labelnames))
+
+    def histogram(self, name, help_s, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_s, labelnames, buckets))
+
+    def render(self, prior_samples=None):
+        '''
+        Render all metrics in the text exposition format.  If given, prior
+        sample values (e.g. from an earlier process) are added to this
+        process's values; all metrics are cumulative.
+        '''
+        prior_samples = dict(prior_samples or {})
+        lines = []
+        for metric in self.metrics:
+            own = metric.samples()
+            own_keys = set(key for key, value in own)
+            prefix = re.compile(r'^%s(_bucket|_sum|_count)?(\{|$)' % re.escape(metric.name))
+            earlier = sorted((key, value) for key, value in prior_samples.iteritems()
+                             if prefix.match(key) and key not in own_keys)
+            if not own and not earlier:
+                continue
+            lines += metric.header()
+            for key, value in earlier:
+                lines.append('%s %s' % (key, _format_value(value)))
+            for key, value in own:
+                lines.append('%s %s' % (key, _format_value(value + prior_samples.get(key, 0))))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def parse_samples(text):
+    '''
+    Parse text exposition format into a dict of sample key -> value
+    '''
+    samples = {}
+    for line in text.splitlines():
+        m = _SAMPLE_RE.match(line.strip())
+        if m and not line.startswith('#'):
+            value = m.group(2)
+            samples[m.group(1)] = float('inf') if value == '+Inf' else float(value)
+    return samples
+
+
+REGISTRY = MetricsRegistry()
+
+# ULSR metrics
+
+SCONTROL_CALL_SECONDS = REGISTRY.histogram(
+    'ulsr_scontrol_call_seconds', 'scontrol command latency', ('action', 'entity'))
+SCONTROL_ERRORS = REGISTRY.counter(
+    'ulsr_scontrol_errors_total', 'scontrol commands writing to stderr', ('action', 'entity'))
+HIL_API_CALL_SECONDS = REGISTRY.histogram(
+    'ulsr_hil_api_call_seconds', 'HIL API call latency', ('endpoint',))
+HIL_API_ERRORS = REGISTRY.counter(
+    'ulsr_hil_api_errors_total', 'Failed HIL API calls', ('endpoint',))
+HIL_DETACH_RETRIES = REGISTRY.counter(
+    'ulsr_hil_detach_retries_total', 'Project detach retries due to pending network actions')
+RESERVATION_NODES = REGISTRY.histogram(
+    'ulsr_reservation_nodes', 'Nodes per HIL reservation processed', ('operation',),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+RESERVATION_SECONDS = REGISTRY.histogram(
+    'ulsr_reservation_seconds', 'HIL reserve and release time, including Slurm reservation update',
+    ('operation',))
+RESERVATION_FAILURES = REGISTRY.counter(
+    'ulsr_reservation_failures_total', 'HIL reserve and release failures', ('operation',))
+
+
+@contextmanager
+def hil_api_call(endpoint):
+    '''
+    Time a HIL API call, counting it as failed if it raises
+    '''
+    try:
+        with HIL_API_CALL_SECONDS.time(endpoint=endpoint):
+            yield
+    except:
+        HIL_API_ERRORS.inc(endpoint=endpoint)
+        raise
+
+
+def write_textfile(path, registry=REGISTRY):
+    '''
+    Add this process's metrics to the textfile collector file.
+    Processes writing the same file are serialized by a lock file, and the
+    file is replaced atomically, so the collector never reads a partial file.
+    '''
+    with open(path + '.lock', 'a') as lock_f:
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                prior_samples = parse_samples(f.read())
+        except IOError:
+            prior_samples = {}
+
+        text = registry.render(prior_samples)
+        f = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.metrics',
+                                        delete=False)
+        try:
+            f.write(text)
+            f.close()
+            os.chmod(f.name, 0644)
+            os.rename(f.name, path)
+        except:
+            os.unlink(f.name)
+            raise
+
+
+def write_process_metrics(process_name):
+    '''
+    Write the metrics of a short-lived process, e.g. at exit.  Never raises.
+    '''
+    if not ULSR_METRICS_ENABLE:
+        return
+    path = os.path.join(ULSR_METRICS_TEXTFILE_DIR, 'ulsr_%s.prom' % process_name)
+    try:
+        write_textfile(path)
+    except (IOError, OSError) as e:
+        log_error('Unable to write metrics file `%s`: %s', path, e)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        data = self.server.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_http_server(port, addr='127.0.0.1', registry=REGISTRY):
+    '''
+    Serve /metrics from a background thread.  Returns the server, whose
+    shutdown() stops it.
+    '''
+    httpd = HTTPServer((addr, port), _MetricsRequestHandler)
+    httpd.registry = registry
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    log_debug('Serving metrics at http://%s:%d/metrics', *httpd.server_address)
+    return httpd
+
+# EOF
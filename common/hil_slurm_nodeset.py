@@ -0,0 +1,295 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+Compact Node Sets
+
+A set of node names held as integer ranges per name pattern, e.g.
+'server[1-1000]' is one (prefix, suffix, width) pattern with the single
+range (1, 1000), instead of a thousand strings.  Union, intersection and
+difference work range by range, and membership is a binary search, so
+overlap checks between reservations cost little however many nodes they
+hold.  Node names are produced only when the set is iterated.
+
+A NodeSet is built from Slurm hostlist syntax, another NodeSet, or an
+iterable of node names, and str() converts it back to hostlist syntax.
+"""
+
+import re
+from bisect import bisect_right
+
+import hostlist
+
+_NAME_RE = re.compile(r'^(.*?)(\d+)(\D*)$')
+_BRACKET_RE = re.compile(r'^([^\[\]]*)\[([^\[\]]+)\]([^\[\]]*)$')
+
+
+def _parse_name(name):
+    '''
+    Split a node name into its pattern key (prefix, suffix, width) and number.
+    The number is the last run of digits in the name; width is the number of
+    digits if zero padded, otherwise 0.  Names without digits have width None.
+    '''
+    m = _NAME_RE.match(name)
+    if not m:
+        return (name, '', None), 0
+    prefix, digits, suffix = m.groups()
+    width = len(digits) if (len(digits) > 1) and digits.startswith('0') else 0
+    return (prefix, suffix, width), int(digits)
+
+
+def _format_number(n, width):
+    return '%0*d' % (width, n) if width else str(n)
+
+
+def _normalize(ranges):
+    '''
+    Sort ranges and merge those which overlap or are adjacent
+    '''
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def _intersect(a, b):
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        lo = max(a[i][0], b[j][0])
+        hi = min(a[i][1], b[j][1])
+        if lo <= hi:
+            result.append((lo, hi))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _subtract(a, b):
+    result = []
+    j = 0
+    for lo, hi in a:
+        while j < len(b) and b[j][1] < lo:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] <= hi:
+            if b[k][0] > lo:
+                result.append((lo, b[k][0] - 1))
+            lo = max(lo, b[k][1] + 1)
+            k += 1
+        if lo <= hi:
+            result.append((lo, hi))
+    return result
+
+
+def _contains(ranges, n):
+    i = bisect_right(ranges, (n, float('inf'))) - 1
+    return (i >= 0) and (ranges[i][0] <= n <= ranges[i][1])
+
+
+def _split_items(hostlist_s):
+    '''
+    Split hostlist syntax at the commas outside brackets
+    '''
+    items = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(hostlist_s):
+        if c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif (c == ',') and not depth:
+            items.append(hostlist_s[start:i])
+            start = i + 1
+    items.append(hostlist_s[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+class NodeSet(object):
+    '''
+    A set of node names, stored as sorted, disjoint integer ranges per
+    (prefix, suffix, width) pattern
+    '''
+    __slots__ = ('_ranges',)
+
+    def __init__(self, nodes=None):
+        self._ranges = {}
+        if nodes is None:
+            return
+        if isinstance(nodes, NodeSet):
+            self._ranges = dict(nodes._ranges)
+        elif isinstance(nodes, basestring):
+            self._parse(nodes)
+        else:
+            self._add_names(nodes)
+
+    @classmethod
+    def _from_ranges(cls, ranges):
+        nodeset = cls()
+        nodeset._ranges = dict((key, r) for key, r in ranges.iteritems() if r)
+        return nodeset
+
+    def _add_ranges(self, key, ranges):
+        self._ranges[key] = _normalize(self._ranges.get(key, []) + ranges)
+
+    def _add_names(self, names):
+        numbers = {}
+        for name in names:
+            key, n = _parse_name(name)
+            numbers.setdefault(key, []).append((n, n))
+        for key, ranges in numbers.iteritems():
+            self._add_ranges(key, ranges)
+
+    def _parse(self, hostlist_s):
+        for item in _split_items(hostlist_s):
+            m = _BRACKET_RE.match(item)
+            if '[' not in item:
+                self._add_names([item])
+            elif m and not m.group(1)[-1:].isdigit() and not re.search(r'\d', m.group(3)):
+                self._parse_bracket(*m.groups())
+            else:
+                # Several bracket expressions, or digits next to the brackets
+                self._add_names(hostlist.expand_hostlist(item))
+
+    def _parse_bracket(self, prefix, body, suffix):
+        for part in body.split(','):
+            lo_s, sep, hi_s = part.strip().partition('-')
+            lo = int(lo_s)
+            hi = int(hi_s) if sep else lo
+            if hi < lo:
+                raise ValueError('Invalid hostlist range `%s`' % part)
+            width = len(lo_s) if (len(lo_s) > 1) and lo_s.startswith('0') else 0
+            if width:
+                # Numbers too large to need zero padding are not padded names
+                padded_max = 10 ** (width - 1) - 1
+                if lo <= padded_max:
+                    self._add_ranges((prefix, suffix, width), [(lo, min(hi, padded_max))])
+                lo = max(lo, padded_max + 1)
+            if lo <= hi:
+                self._add_ranges((prefix, suffix, 0), [(lo, hi)])
+
+    # Set operations
+
+    def __len__(self):
+        return sum(hi - lo + 1 for ranges in self._ranges.itervalues() for lo, hi in ranges)
+
+    def __nonzero__(self):
+        return bool(self._ranges)
+
+    def __contains__(self, name):
+        key, n = _parse_name(name)
+        ranges = self._ranges.get(key)
+        return bool(ranges) and _contains(ranges, n)
+
+    @staticmethod
+    def _key_order(key):
+        prefix, suffix, width = key
+        return (prefix, suffix, -1 if width is None else width)
+
+    def __iter__(self):
+        for key in sorted(self._ranges, key=self._key_order):
+            prefix, suffix, width = key
+            if width is None:
+                yield prefix
+                continue
+            for lo, hi in self._ranges[key]:
+                for n in xrange(lo, hi + 1):
+                    yield prefix + _format_number(n, width) + suffix
+
+    def __eq__(self, other):
+        if not isinstance(other, NodeSet):
+            return NotImplemented
+        return self._ranges == other._ranges
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    @staticmethod
+    def _coerce(other):
+        return other if isinstance(other, NodeSet) else NodeSet(other)
+
+    def union(self, other):
+        other = self._coerce(other)
+        ranges = dict(self._ranges)
+        for key, r in other._ranges.iteritems():
+            ranges[key] = _normalize(ranges.get(key, []) + r)
+        return NodeSet._from_ranges(ranges)
+
+    def intersection(self, other):
+        other = self._coerce(other)
+        return NodeSet._from_ranges(dict((key, _intersect(r, other._ranges[key]))
+                                         for key, r in self._ranges.iteritems()
+                                         if key in other._ranges))
+
+    def difference(self, other):
+        other = self._coerce(other)
+        return NodeSet._from_ranges(dict((key, _subtract(r, other._ranges[key])
+                                          if key in other._ranges else r)
+                                         for key, r in self._ranges.iteritems()))
+
+    def isdisjoint(self, other):
+        return not self.intersection(other)
+
+    def issubset(self, other):
+        return not self.difference(other)
+
+    def update(self, other):
+        self._ranges = self.union(other)._ranges
+
+    def difference_update(self, other):
+        self._ranges = self.difference(other)._ranges
+
+    def add(self, name):
+        key, n = _parse_name(name)
+        self._add_ranges(key, [(n, n)])
+
+    def discard(self, name):
+        key, n = _parse_name(name)
+        if key in self._ranges:
+            self._ranges[key] = _subtract(self._ranges[key], [(n, n)])
+            if not self._ranges[key]:
+                del self._ranges[key]
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    # Hostlist syntax
+
+    def __str__(self):
+        items = []
+        for key in sorted(self._ranges, key=self._key_order):
+            prefix, suffix, width = key
+            ranges = self._ranges[key]
+            if width is None:
+                items.append(prefix)
+            elif (len(ranges) == 1) and (ranges[0][0] == ranges[0][1]):
+                items.append(prefix + _format_number(ranges[0][0], width) + suffix)
+            else:
+                items.append('%s[%s]%s' % (prefix, ','.join(
+                    _format_number(lo, width) if lo == hi else
+                    '%s-%s' % (_format_number(lo, width), _format_number(hi, width))
+                    for lo, hi in ranges), suffix))
+        return ','.join(items)
+
+    def __repr__(self):
+        return '<NodeSet %s>' % self
+
+# EOF
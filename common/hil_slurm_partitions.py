@@ -0,0 +1,161 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+Partition Snapshot
+
+The monitor writes the HIL-relevant attributes of every Slurm partition
+to a small JSON file, with each partition's HIL eligibility already
+checked and its MaxTime already converted to seconds.  The prolog reads
+the snapshot rather than running 'scontrol show partition' and
+re-validating the partition for every hil_reserve and hil_release job.
+
+The snapshot is rewritten, atomically, only when the partition data
+changes; otherwise its modification time is updated, so readers can tell
+how recently it was verified.  A snapshot older than its maximum age is
+ignored and the prolog asks scontrol directly.
+"""
+
+import errno
+import hashlib
+import json
+import os
+from tempfile import NamedTemporaryFile
+from time import time
+
+from hil_slurm_logging import log_debug, log_error
+from hil_slurm_records import SlurmPartition
+from hil_slurm_settings import (HIL_PARTITION_PREFIX,
+                                RES_CHECK_DEFAULT_PARTITION,
+                                RES_CHECK_EXCLUSIVE_PARTITION,
+                                RES_CHECK_SHARED_PARTITION,
+                                RES_CHECK_PARTITION_STATE)
+
+PARTITION_SNAPSHOT_VERSION = 1
+
+_PARTITION_FIELDS = ('state', 'default', 'shared', 'exclusive_user', 'max_time', 'nodes')
+
+
+def hil_partition_problems(partition):
+    '''
+    Return the reasons, if any, the partition cannot be used for HIL
+    reservations, as log messages
+    '''
+    pname = partition.name
+    problems = []
+
+    if not pname.startswith(HIL_PARTITION_PREFIX):
+        problems.append('Partition name `%s` does not match `%s*`' %
+                        (pname, HIL_PARTITION_PREFIX))
+
+    # Verify the partition state is UP
+
+    if RES_CHECK_PARTITION_STATE and (partition.state != 'UP'):
+        problems.append('Partition `%s` state (`%s`) is not UP' % (pname, partition.state))
+
+    # Verify the partition is not the default partition
+
+    if RES_CHECK_DEFAULT_PARTITION and partition.default:
+        problems.append('Partition `%s` is the default partition, cannot be used for HIL' %
+                        pname)
+
+    # Verify the partition is not shared by checking 'Shared' and
+    # 'ExclusiveUser' attributes
+
+    if RES_CHECK_SHARED_PARTITION and (partition.shared != 'NO'):
+        problems.append('Partition `%s` is shared, cannot be used for HIL' % pname)
+
+    if RES_CHECK_EXCLUSIVE_PARTITION and not partition.exclusive_user:
+        problems.append('Partition `%s` not exclusive to a single user, cannot be used for HIL' %
+                        pname)
+
+    return problems
+
+
+def _snapshot_partitions(partitions):
+    snapshot = {}
+    for partition in partitions:
+        d = dict((field, getattr(partition, field)) for field in _PARTITION_FIELDS)
+        d['hil_problems'] = hil_partition_problems(partition)
+        snapshot[partition.name] = d
+    return snapshot
+
+
+def _digest(snapshot_partitions):
+    return hashlib.sha1(json.dumps(snapshot_partitions, sort_keys=True)).hexdigest()
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            log_debug('Unable to read partition snapshot `%s`: %s', path, e)
+        return None
+    except ValueError:
+        log_debug('Discarding corrupt partition snapshot `%s`', path)
+        return None
+
+    if not isinstance(snapshot, dict) or \
+       (snapshot.get('version') != PARTITION_SNAPSHOT_VERSION):
+        return None
+    return snapshot
+
+
+def update_partition_snapshot(path, partitions):
+    '''
+    Write the snapshot of the partitions if it has changed, otherwise mark
+    the existing snapshot as current.  Returns True if the snapshot was
+    rewritten.  Never raises.
+    '''
+    snapshot_partitions = _snapshot_partitions(partitions)
+    digest = _digest(snapshot_partitions)
+
+    try:
+        snapshot = _read(path)
+        if snapshot and (snapshot.get('digest') == digest):
+            os.utime(path, None)
+            return False
+
+        with NamedTemporaryFile('w', dir=os.path.dirname(path), prefix='.partitions',
+                                delete=False) as f:
+            json.dump({'version': PARTITION_SNAPSHOT_VERSION, 'digest': digest,
+                       't_written': time(), 'partitions': snapshot_partitions}, f)
+        os.chmod(f.name, 0644)
+        os.rename(f.name, path)
+    except (IOError, OSError) as e:
+        log_error('Unable to write partition snapshot `%s`: %s', path, e)
+        return False
+
+    log_debug('Updated partition snapshot `%s` (%d partitions)', path, len(partitions))
+    return True
+
+
+def load_partition_snapshot(path, max_age):
+    '''
+    Return a dict mapping partition name to (SlurmPartition, HIL problems),
+    or None if there is no snapshot verified within the last max_age seconds
+    '''
+    try:
+        if (time() - os.stat(path).st_mtime) > max_age:
+            log_debug('Partition snapshot `%s` is stale', path)
+            return None
+    except OSError:
+        return None
+
+    snapshot = _read(path)
+    if not snapshot:
+        return None
+
+    partitions = {}
+    for name, d in snapshot['partitions'].iteritems():
+        name = name.encode('utf-8')
+        kwargs = dict((field, d.get(field)) for field in _PARTITION_FIELDS)
+        for field in ('state', 'shared', 'nodes'):
+            if isinstance(kwargs[field], unicode):
+                kwargs[field] = kwargs[field].encode('utf-8')
+        partitions[name] = (SlurmPartition(name, **kwargs),
+                            [p.encode('utf-8') for p in d.get('hil_problems', [])])
+    return partitions
+
+# EOF
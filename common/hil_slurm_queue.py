@@ -0,0 +1,163 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+HIL Reservation Request Queue
+
+A durable spool directory queue from the slurmctld prolog and epilog to
+the HIL reservation monitor.  The prolog and epilog validate a hil_reserve
+or hil_release request, enqueue it with its computed reservation name and
+times, and return without running 'scontrol create' or 'scontrol delete'.
+The monitor drains the queue at the start of each pass, handling all
+requests which have arrived together against a single reservation listing.
+
+Each request is a JSON file, written to tmp/ and renamed into new/ once
+complete, so the monitor never sees a partial request.  A request is
+removed only once processed; requests which cannot be decoded, or which
+the monitor gives up on, are moved to failed/ for inspection.  A request
+which is retried records its number of attempts.
+"""
+
+import json
+import os
+import random
+from time import time
+
+from hil_slurm_logging import log_error
+
+QUEUE_SUBDIRS = ('tmp', 'new', 'failed')
+
+# Request operations
+
+QUEUE_CREATE_RESERVATION = 'create_reservation'
+QUEUE_DELETE_RESERVATION = 'delete_reservation'
+
+
+def _str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class QueuedRequest(object):
+    '''
+    A request read from the queue; done() removes it, fail() sets it aside,
+    retry() leaves it queued for another attempt
+    '''
+    __slots__ = ('queue', 'filename', 'op', 'args', 't_queued', 'attempts')
+
+    def __init__(self, queue, filename, op, args, t_queued=None, attempts=0):
+        self.queue = queue
+        self.filename = filename
+        self.op = op
+        self.args = args
+        self.t_queued = t_queued
+        self.attempts = attempts
+
+    def done(self):
+        self.queue._remove(self.filename)
+
+    def fail(self):
+        self.queue._fail(self.filename)
+
+    def retry(self):
+        '''
+        Count a failed attempt, and leave the request queued.
+        Returns the number of attempts.
+        '''
+        self.attempts += 1
+        self.queue._rewrite(self.filename, {'op': self.op, 't_queued': self.t_queued,
+                                            'attempts': self.attempts, 'args': self.args})
+        return self.attempts
+
+    def __repr__(self):
+        return '<QueuedRequest %s %s>' % (self.op, self.args.get('resname'))
+
+
+class RequestQueue(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def _dir(self, subdir):
+        return os.path.join(self.path, subdir)
+
+    def _ensure_dirs(self):
+        for subdir in QUEUE_SUBDIRS:
+            d = self._dir(subdir)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+
+    def _write(self, filename, d):
+        tmp_path = os.path.join(self._dir('tmp'), filename)
+        with open(tmp_path, 'w') as f:
+            json.dump(d, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, os.path.join(self._dir('new'), filename))
+
+    def put(self, op, **args):
+        '''
+        Durably enqueue a request.  Raises IOError / OSError on failure.
+        '''
+        self._ensure_dirs()
+        t_now = time()
+        filename = '%017.6f_%d_%08x.json' % (t_now, os.getpid(), random.getrandbits(32))
+        self._write(filename, {'op': op, 't_queued': t_now, 'args': args})
+        return filename
+
+    def __len__(self):
+        try:
+            return len([f for f in os.listdir(self._dir('new')) if f.endswith('.json')])
+        except OSError:
+            return 0
+
+    def get_all(self):
+        '''
+        Return the queued requests in arrival order.  Requests remain queued
+        until marked done.
+        '''
+        try:
+            filenames = sorted(f for f in os.listdir(self._dir('new')) if f.endswith('.json'))
+        except OSError:
+            return []
+
+        requests = []
+        for filename in filenames:
+            path = os.path.join(self._dir('new'), filename)
+            try:
+                with open(path) as f:
+                    d = json.load(f)
+                requests.append(QueuedRequest(self, filename, d['op'],
+                                              dict((str(k), _str(v))
+                                                   for k, v in d['args'].iteritems()),
+                                              t_queued=d.get('t_queued'),
+                                              attempts=d.get('attempts', 0)))
+            except (IOError, OSError):
+                # Removed by a concurrent reader
+                continue
+            except (ValueError, KeyError, AttributeError) as e:
+                log_error('Undecodable queued request `%s`: %s', filename, e)
+                self._fail(filename)
+        return requests
+
+    def _remove(self, filename):
+        try:
+            os.unlink(os.path.join(self._dir('new'), filename))
+        except OSError:
+            pass
+
+    def _rewrite(self, filename, d):
+        try:
+            self._write(filename, d)
+        except (IOError, OSError) as e:
+            log_error('Unable to update queued request `%s`: %s', filename, e)
+
+    def _fail(self, filename):
+        try:
+            self._ensure_dirs()
+            os.rename(os.path.join(self._dir('new'), filename),
+                      os.path.join(self._dir('failed'), filename))
+        except OSError:
+            pass
+
+# EOF
@@ -0,0 +1,282 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+Slurm Reservation, Job, and Partition Records
+
+Compact records built once from 'scontrol show' keyword / value data.
+Times, durations, node sets and HIL reservation name components are
+parsed when the record is built, rather than at every use.
+"""
+
+from time import localtime, mktime, strftime, strptime
+
+from hil_slurm_constants import (SHOW_OBJ_TIME_FMT, RES_CREATE_TIME_FMT,
+                                 HIL_RESNAME_PREFIX, HIL_RESNAME_FIELD_SEPARATOR,
+                                 HIL_RESERVE, HIL_RELEASE, HIL_RESERVATION_OPERATIONS)
+from hil_slurm_nodeset import NodeSet
+
+# Values scontrol uses for 'not set'
+
+SLURM_NULL_VALUES = ('', '(null)', 'None', 'n/a')
+SLURM_UNKNOWN_TIMES = ('Unknown', 'None', 'N/A', '(null)', '')
+SLURM_UNLIMITED_DURATIONS = ('UNLIMITED', 'INFINITE', 'Partition_Limit', 'NONE')
+
+
+def _value(d, key):
+    '''
+    Return the value of a keyword, or None if missing or not set
+    '''
+    v = d.get(key)
+    return None if v in SLURM_NULL_VALUES else v
+
+
+def parse_slurm_time(time_s):
+    '''
+    Convert an 'scontrol show' time (local time, SHOW_OBJ_TIME_FMT) to
+    seconds since the epoch.  Returns None for unknown / unset times.
+    Epoch times, as decoded from 'scontrol --json show', are returned as is.
+    '''
+    if isinstance(time_s, (int, long, float)):
+        return time_s
+    if (time_s is None) or (time_s in SLURM_UNKNOWN_TIMES):
+        return None
+    return mktime(strptime(time_s, SHOW_OBJ_TIME_FMT))
+
+
+def format_slurm_time(t):
+    '''
+    Convert seconds since the epoch to the 'scontrol create' time format
+    '''
+    return strftime(RES_CREATE_TIME_FMT, localtime(t))
+
+
+def parse_slurm_duration(duration_s):
+    '''
+    Convert a Slurm duration (MaxTime, TimeLimit, ...) to seconds.
+    Accepted forms, as documented in sbatch(1):
+        minutes, minutes:seconds, hours:minutes:seconds,
+        days-hours, days-hours:minutes, days-hours:minutes:seconds
+    Returns None for UNLIMITED / unset durations.
+    Durations in seconds, as decoded from 'scontrol --json show', are
+    returned as is.
+    Raises ValueError if the duration cannot be parsed.
+    '''
+    if isinstance(duration_s, (int, long)):
+        return duration_s
+    if (duration_s is None) or (duration_s in SLURM_NULL_VALUES) or \
+       (duration_s in SLURM_UNLIMITED_DURATIONS):
+        return None
+
+    days_s, sep, hms_s = duration_s.partition('-')
+    if not sep:
+        days_s, hms_s = None, duration_s
+
+    fields = [int(f) for f in hms_s.split(':')]
+    if (len(fields) > 3) or any(f < 0 for f in fields):
+        raise ValueError('Invalid Slurm duration `%s`' % duration_s)
+
+    if days_s is not None:
+        # days-hours[:minutes[:seconds]]
+        fields += [0] * (3 - len(fields))
+        hours, minutes, seconds = fields
+        days = int(days_s)
+    else:
+        days = 0
+        if (len(fields) == 3):
+            hours, minutes, seconds = fields
+        elif (len(fields) == 2):
+            hours, minutes, seconds = 0, fields[0], fields[1]
+        else:
+            hours, minutes, seconds = 0, fields[0], 0
+
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def _duration(d, key):
+    '''
+    Return a duration keyword value in seconds, or None if unset or unparseable
+    '''
+    try:
+        return parse_slurm_duration(d.get(key))
+    except ValueError:
+        return None
+
+
+def parse_hil_reservation_name(resname):
+    '''
+    Attempt to split a reservation name into HIL reservation name components:
+    HIL reservation prefix, reservation type, user name, uid, and time
+
+    This looks like overkill, except for the presence of other reservations in the
+    system, with semi-arbitrary names.
+    '''
+    prefix = None
+    restype = None
+    user = None
+    uid = None
+    time_s = None
+
+    if resname.startswith(HIL_RESNAME_PREFIX):
+        resname_partitions = resname.partition(HIL_RESNAME_PREFIX)
+        prefix = resname_partitions[1]
+
+        try:
+            restype, user, uid, time_s = resname_partitions[2].split(HIL_RESNAME_FIELD_SEPARATOR)
+        except:
+            pass
+
+    return prefix, restype, user, uid, time_s
+
+
+class SlurmReservation(object):
+    '''
+    A Slurm reservation, with HIL reservation name components, if any
+    '''
+    __slots__ = ('name', 'users', 'nodes', 'nodeset', 't_start', 't_end',
+                 'flags', 'features', 'prefix', 'restype', 'user', 'uid', 'time_s')
+
+    def __init__(self, name, users=None, nodes=None, t_start=None, t_end=None,
+                 flags=None, features=None):
+        self.name = name
+        self.users = users
+        self.nodes = nodes
+        self.nodeset = NodeSet(nodes)
+        self.t_start = t_start
+        self.t_end = t_end
+        self.flags = flags
+        self.features = features
+        (self.prefix, self.restype, self.user,
+         self.uid, self.time_s) = parse_hil_reservation_name(name)
+
+    @classmethod
+    def from_scontrol(cls, d):
+        return cls(d['ReservationName'], users=_value(d, 'Users'),
+                   nodes=_value(d, 'Nodes'),
+                   t_start=parse_slurm_time(d.get('StartTime')),
+                   t_end=parse_slurm_time(d.get('EndTime')),
+                   flags=_value(d, 'Flags'), features=_value(d, 'Features'))
+
+    def __repr__(self):
+        return '<SlurmReservation %s nodes=%s>' % (self.name, self.nodes)
+
+
+class SlurmJob(object):
+    '''
+    A Slurm job, as seen by the Slurm control daemon prolog and epilog
+    '''
+    __slots__ = ('job_id', 'name', 'user', 'state', 'partition', 'reservation',
+                 'nodes', 't_start', 't_end', 'time_limit')
+
+    def __init__(self, job_id, name=None, user=None, state=None, partition=None,
+                 reservation=None, nodes=None, t_start=None, t_end=None, time_limit=None):
+        self.job_id = job_id
+        self.name = name
+        self.user = user
+        self.state = state
+        self.partition = partition
+        self.reservation = reservation
+        self.nodes = nodes
+        self.t_start = t_start
+        self.t_end = t_end
+        self.time_limit = time_limit
+
+    @classmethod
+    def from_scontrol(cls, d):
+        # UserId is of the form 'uname(uid)'
+        user = _value(d, 'UserId')
+        if user:
+            user = user.partition('(')[0]
+
+        return cls(d['JobId'], name=_value(d, 'JobName'), user=user,
+                   state=_value(d, 'JobState'), partition=_value(d, 'Partition'),
+                   reservation=_value(d, 'Reservation'), nodes=_value(d, 'NodeList'),
+                   t_start=parse_slurm_time(d.get('StartTime')),
+                   t_end=parse_slurm_time(d.get('EndTime')),
+                   time_limit=_duration(d, 'TimeLimit'))
+
+    def __repr__(self):
+        return '<SlurmJob %s %s>' % (self.job_id, self.name)
+
+
+class SlurmPartition(object):
+    '''
+    A Slurm partition, with the attributes checked for HIL eligibility
+    '''
+    __slots__ = ('name', 'state', 'default', 'shared', 'exclusive_user',
+                 'max_time', 'nodes')
+
+    def __init__(self, name, state=None, default=False, shared=None,
+                 exclusive_user=False, max_time=None, nodes=None):
+        self.name = name
+        self.state = state
+        self.default = default
+        self.shared = shared
+        self.exclusive_user = exclusive_user
+        self.max_time = max_time
+        self.nodes = nodes
+
+    @classmethod
+    def from_scontrol(cls, d):
+        # Older Slurm versions report 'Shared', newer versions 'OverSubscribe'
+        shared = _value(d, 'Shared') or _value(d, 'OverSubscribe')
+
+        return cls(d['PartitionName'], state=_value(d, 'State'),
+                   default=(d.get('Default') == 'YES'), shared=shared,
+                   exclusive_user=(d.get('ExclusiveUser') == 'YES'),
+                   max_time=_duration(d, 'MaxTime'),
+                   nodes=_value(d, 'Nodes'))
+
+    def __repr__(self):
+        return '<SlurmPartition %s>' % self.name
+
+
+class HILReservationIndex(object):
+    '''
+    HIL reservations keyed by name components (restype, user, uid, time).
+    A reserve reservation and its release reservation share user, uid and
+    time, so each reservation's pair is found with a single lookup.
+    '''
+    PAIR_TYPES = {HIL_RESERVE: HIL_RELEASE, HIL_RELEASE: HIL_RESERVE}
+
+    def __init__(self, reservations=()):
+        self.by_key = {}
+        self.by_name = {}
+        self.by_type = dict((restype, []) for restype in HIL_RESERVATION_OPERATIONS)
+
+        for res in reservations:
+            self.add(res)
+
+    @staticmethod
+    def _key(restype, res):
+        return (restype, res.user, res.uid, res.time_s)
+
+    def add(self, res):
+        self.by_key[self._key(res.restype, res)] = res
+        self.by_name[res.name] = res
+        self.by_type[res.restype].append(res)
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def __iter__(self):
+        return self.by_name.itervalues()
+
+    def get(self, resname):
+        return self.by_name.get(resname)
+
+    def pair(self, res):
+        '''
+        Return the release reservation of a reserve reservation, or vice
+        versa, or None if there is none
+        '''
+        return self.by_key.get(self._key(self.PAIR_TYPES[res.restype], res))
+
+    def singletons(self, restype):
+        '''
+        Return the reserve or release reservations which have no pair.
+        These exist during the HIL reservation creation and release
+        processes, respectively.
+        '''
+        return [res for res in self.by_type[restype] if self.pair(res) is None]
+
+# EOF
@@ -0,0 +1,125 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+HIL Reservation Scheduler
+
+Runs the transitions of independent HIL reservations at the same time, so
+that a slow reservation does not hold up every other user's.
+
+  - At most max_concurrent transitions run at once, and at most
+    max_per_user for any one user.
+  - Transitions are started in priority order.  The monitor runs releases
+    first, returning loaner capacity to Slurm, then reserves by start time.
+  - Two transitions sharing a node never run at once.  A transition also
+    waits for any higher priority transition sharing one of its nodes, so
+    a release of a node always completes before a later reserve of it.
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+from hil_slurm_logging import log_debug
+from hil_slurm_nodeset import NodeSet
+from hil_slurm_trace import propagate
+
+
+class ReservationTask(object):
+    '''
+    One reservation transition: fn() run for the named reservation
+    '''
+    __slots__ = ('name', 'user', 'nodes', 'priority', 'fn')
+
+    def __init__(self, name, user, nodes, priority, fn):
+        self.name = name
+        self.user = user
+        self.nodes = NodeSet(nodes)
+        self.priority = priority
+        self.fn = fn
+
+    def __repr__(self):
+        return '<ReservationTask %s>' % self.name
+
+
+class ReservationScheduler(object):
+
+    def __init__(self, max_concurrent, max_per_user=None):
+        self.max_concurrent = max(max_concurrent, 1)
+        self.max_per_user = max_per_user
+
+    def _dispatchable(self, pending, running_users, busy_nodes, n_running):
+        '''
+        Select the pending tasks which may start now, in priority order.
+        Nodes of tasks passed over are claimed, so lower priority tasks
+        sharing them wait too.
+        '''
+        selected = []
+        claimed = NodeSet(busy_nodes)
+        users = dict(running_users)
+
+        for task in pending:
+            if (n_running + len(selected)) >= self.max_concurrent:
+                break
+            if (task.nodes & claimed) or \
+               (self.max_per_user and users.get(task.user, 0) >= self.max_per_user):
+                claimed |= task.nodes
+                continue
+            selected.append(task)
+            claimed |= task.nodes
+            users[task.user] = users.get(task.user, 0) + 1
+        return selected
+
+    def run(self, tasks):
+        '''
+        Run the tasks to completion.  Returns (results, failures): dicts
+        mapping each task name to fn's result or to the exception it raised.
+        '''
+        pending = sorted(tasks, key=lambda task: task.priority)
+        results = {}
+        failures = {}
+        if not pending:
+            return results, failures
+
+        cond = threading.Condition()
+        running_users = {}
+        busy_nodes = NodeSet()
+        state = {'n_running': 0}
+
+        def _run(task):
+            try:
+                return task, task.fn(), None
+            except Exception as e:
+                return task, None, e
+
+        def _done(outcome):
+            task, result, e = outcome
+            with cond:
+                if e is None:
+                    results[task.name] = result
+                else:
+                    failures[task.name] = e
+                state['n_running'] -= 1
+                running_users[task.user] -= 1
+                busy_nodes.difference_update(task.nodes)
+                cond.notify()
+
+        pool = ThreadPool(min(self.max_concurrent, len(pending)))
+        try:
+            with cond:
+                while pending or state['n_running']:
+                    for task in self._dispatchable(pending, running_users, busy_nodes,
+                                                   state['n_running']):
+                        log_debug('Starting transition of HIL reservation `%s`', task.name)
+                        pending.remove(task)
+                        state['n_running'] += 1
+                        running_users[task.user] = running_users.get(task.user, 0) + 1
+                        busy_nodes.update(task.nodes)
+                        pool.apply_async(propagate(_run), (task,), callback=_done)
+                    if state['n_running']:
+                        cond.wait()
+        finally:
+            pool.close()
+            pool.join()
+
+        return results, failures
+
+# EOF
@@ -12,14 +12,85 @@ SLURM_INSTALL_DIR = '/usr/bin/'
 
 HIL_SLURMCTLD_PROLOG_LOGFILE = '/var/log/ulsr/ulsr_prolog.log'
 HIL_MONITOR_LOGFILE = '/var/log/ulsr/ulsr_monitor.log'
+ULSR_NET_AUDIT_LOGFILE = '/var/log/ulsr/ulsr_audit.log'
+
+# Log records are written to the log file by a background thread, unless
+# ULSR_LOG_QUEUE is False.  ULSR_LOG_FORMAT is 'text', or 'json' for JSON lines.
+
+ULSR_LOG_QUEUE = True
+ULSR_LOG_FORMAT = 'text'
+
+# Local state shared by the prolog, epilog and monitor
+
+ULSR_STATE_DIR = '/var/lib/ulsr'
+
+# Reservation transition journal (SQLite)
+# Records the progress of HIL reservation transitions, so the monitor resumes
+# a partly completed transition rather than starting over
+
+ULSR_JOURNAL_ENABLE = True
+ULSR_JOURNAL_FILE = ULSR_STATE_DIR + '/ulsr_journal.db'
+
+# Reservation request queue
+# The prolog and epilog queue hil_reserve and hil_release requests for the
+# monitor, rather than creating or deleting Slurm reservations themselves.
+# Setting ULSR_QUEUE_ENABLE to False restores the synchronous behavior.
+# A request which Slurm rejects is retried by later monitor passes, up to
+# ULSR_QUEUE_MAX_ATTEMPTS times, then moved to the queue's failed/ directory.
+
+ULSR_QUEUE_ENABLE = True
+ULSR_QUEUE_DIR = ULSR_STATE_DIR + '/queue'
+ULSR_QUEUE_MAX_ATTEMPTS = 5
+
+# Partition snapshot
+# The monitor writes the attributes and HIL eligibility of each partition to
+# the snapshot file, which the prolog and epilog read instead of running
+# 'scontrol show partition'.  A snapshot not verified by the monitor within
+# the maximum age (seconds) is ignored.
+
+ULSR_PARTITION_SNAPSHOT_ENABLE = True
+ULSR_PARTITION_SNAPSHOT_FILE = ULSR_STATE_DIR + '/partitions.json'
+ULSR_PARTITION_SNAPSHOT_MAX_AGE = 300
+
+# HIL reservation monitor daemon (hil_slurm_monitor.py --daemon)
+# The daemon runs a monitor pass every poll interval, and at once when woken
+# by the prolog or epilog through the wakeup socket.  The lock file keeps the
+# daemon and cron-driven monitor runs from running at the same time.
+
+HIL_MONITOR_POLL_INTERVAL = 10				# Seconds
+HIL_MONITOR_SOCKET = ULSR_STATE_DIR + '/ulsr_monitor.sock'
+HIL_MONITOR_LOCKFILE = ULSR_STATE_DIR + '/ulsr_monitor.lock'
+
+# Maximum number of HIL reservations the monitor processes at the same time,
+# in total and for any one user.  Set both to 1 for serial processing.
+
+HIL_MONITOR_MAX_CONCURRENT_RESERVATIONS = 4
+HIL_MONITOR_MAX_RESERVATIONS_PER_USER = 2
 
 HIL_ENDPOINT = "http://10.0.0.16:80"
 HIL_USER = 'admin'
 HIL_PW = 'NavedIsSleepy'
 HIL_SLURM_PROJECT = 'slurm'
 
+# HIL client pool, shared by all HIL calls in a process.  Each client keeps its
+# HTTP connections alive, and is health checked before reuse once this many
+# seconds have passed since its last check.
+
+HIL_CLIENT_POOL_SIZE = 4
+HIL_CLIENT_HEALTH_CHECK_INTERVAL = 60			# Seconds
+
 HIL_PARTITION_PREFIX = 'HIL_partition'
 
+# Maximum number of nodes on which a HIL operation (power off, port revert,
+# project detach / connect) runs at the same time.  Set to 1 for serial operation.
+
+HIL_NODE_CONCURRENCY = 8
+
+# Number of workers running asynchronous HIL client calls (hil_slurm_async),
+# and of reserve / release calls coordinated at a time
+
+HIL_ASYNC_WORKERS = 16
+
 HIL_RESERVATION_DEFAULT_DURATION = 24 * 60 * 60		# Seconds
 HIL_RESERVATION_GRACE_PERIOD = 4 * 60 * 60		# Seconds
 
@@ -30,9 +101,82 @@ RES_CHECK_EXCLUSIVE_PARTITION = False
 RES_CHECK_SHARED_PARTITION = False
 RES_CHECK_PARTITION_STATE = True
 
+# Reject hil_reserve requests overlapping, in time and nodes, an existing
+# HIL reservation
+
+RES_CHECK_OVERLAP = True
+
+# 'scontrol show' output backend
+# 'text' parses 'scontrol show -o' output, 'json' decodes 'scontrol --json show'
+# output (Slurm 21.08 or later)
+
+SCONTROL_SHOW_BACKEND = 'text'
+
+# 'scontrol show' query cache
+# Setting SCONTROL_CACHE_ENABLE to False causes every query to run scontrol
+
+SCONTROL_CACHE_ENABLE = True
+SCONTROL_CACHE_FILE = ULSR_STATE_DIR + '/scontrol_cache.json'
+SCONTROL_CACHE_TTL = 5					# Seconds
+SCONTROL_CACHE_MAX_ENTRIES = 128
+
+# Metrics
+# Short-lived processes (prolog, epilog, cron-driven monitor) add their metrics
+# to files in the textfile directory, for the node exporter textfile collector.
+# The monitor daemon serves its metrics at http://<addr>:<port>/metrics;
+# setting the port to 0 disables the HTTP server.
+
+ULSR_METRICS_ENABLE = True
+ULSR_METRICS_TEXTFILE_DIR = ULSR_STATE_DIR + '/metrics'
+ULSR_METRICS_HTTP_ADDR = '127.0.0.1'
+ULSR_METRICS_HTTP_PORT = 9477
+
+# Reservation tracing
+# Spans of the prolog, epilog, monitor, scontrol and HIL client steps of each
+# HIL reservation are appended to the trace file as JSON lines.
+# Show a reservation's critical path with 'ulsr_trace.py <reservation name>'.
+
+ULSR_TRACE_ENABLE = True
+ULSR_TRACE_FILE = '/var/log/ulsr/ulsr_trace.jsonl'
+
+# HIL / Slurm consistency audit (ulsr_audit.py)
+# HIL node information is queried on up to ULSR_AUDIT_CONCURRENCY nodes at a
+# time.  Reserve reservations not paired, and release reservations not deleted,
+# within the grace period are reported.
+
+ULSR_AUDIT_REPORT_FILE = ULSR_STATE_DIR + '/audit_report.json'
+ULSR_AUDIT_CONCURRENCY = 16
+ULSR_AUDIT_GRACE_PERIOD = 300				# Seconds
+
+# Incremental audits
+# Between full sweeps, a node is queried only if its HIL reservations have
+# changed or its last observed state is older than ULSR_AUDIT_MAX_STALENESS.
+
+ULSR_AUDIT_SNAPSHOT_FILE = ULSR_STATE_DIR + '/audit_snapshot.json'
+ULSR_AUDIT_MAX_STALENESS = 60 * 60			# Seconds
+ULSR_AUDIT_FULL_INTERVAL = 24 * 60 * 60			# Seconds
+
+# Maximum number of (user name, UID) passwd lookups remembered per process
+
+PASSWD_CACHE_MAX_ENTRIES = 1024
+
 # Infiniband control
 # Setting to False will cause Infiniband connections, if any, to be ignored and unchanged
 
 DISABLE_IB_LINKS = True
 
+# Infiniband fabric dump ('iblinkinfo -l' output) and the node -> switch port
+# index built from it, rebuilt only when the dump changes
+
+ULSR_IB_LINKINFO_FILE = ULSR_STATE_DIR + '/iblinkinfo.out'
+ULSR_IB_INDEX_CACHE = ULSR_STATE_DIR + '/ib_fabric_index.json'
+
+# Infiniband link commands, and the number of switches whose ports are set at
+# the same time.  Link states are verified for up to IB_LINK_VERIFY_TIMEOUT seconds.
+
+IBLINKINFO_CMD = 'iblinkinfo'
+IBPORTSTATE_CMD = 'ibportstate'
+IB_SWITCH_CONCURRENCY = 8
+IB_LINK_VERIFY_TIMEOUT = 30
+
 # EOF
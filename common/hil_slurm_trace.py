@@ -0,0 +1,272 @@
+"""
+MassOpenCloud / Hardware Isolation Layer (MOC/HIL)
+
+Reservation Tracing
+
+Lightweight spans tying together the steps of a HIL reservation: the
+slurmctld prolog and epilog, monitor passes, scontrol commands and HIL
+client calls.  Each span records its start and end times, parent span
+and attributes.
+
+The trace ID of a span is the name of the HIL reserve reservation, so the
+reserve and release steps of a reservation, made by different processes,
+form a single trace.  Spans are collected while a trace is open and
+appended to the trace file, as JSON lines, when it closes.  Outside an
+open trace, spans cost almost nothing and are not recorded.
+
+Work handed to worker threads joins the submitting thread's trace and
+span when wrapped with propagate().
+"""
+
+import json
+import os
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from inspect import getcallargs
+from time import time
+
+from hil_slurm_constants import (HIL_RESNAME_PREFIX, HIL_RESNAME_FIELD_SEPARATOR,
+                                 HIL_RESERVE, HIL_RELEASE)
+from hil_slurm_logging import log_error
+from hil_slurm_settings import ULSR_TRACE_ENABLE, ULSR_TRACE_FILE
+
+_local = threading.local()
+
+_export_lock = threading.Lock()
+
+
+def reservation_trace_id(resname):
+    '''
+    Return the trace ID of a HIL reservation: the reserve reservation name,
+    for both the reserve and the release reservation
+    '''
+    release_prefix = HIL_RESNAME_PREFIX + HIL_RELEASE + HIL_RESNAME_FIELD_SEPARATOR
+    if resname and resname.startswith(release_prefix):
+        return resname.replace(HIL_RELEASE, HIL_RESERVE, 1)
+    return resname
+
+
+class Span(object):
+    __slots__ = ('span_id', 'parent_id', 'name', 't_start', 't_end', 'attrs', 'error')
+
+    def __init__(self, name, parent_id, attrs):
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.t_start = time()
+        self.t_end = None
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, trace_id):
+        return {'trace_id': trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+                'name': self.name, 'start': self.t_start, 'end': self.t_end,
+                'duration': self.t_end - self.t_start, 'pid': os.getpid(),
+                'thread': threading.current_thread().name, 'attrs': self.attrs,
+                'error': self.error}
+
+
+class _Trace(object):
+    '''
+    The spans of an open trace, shared by the threads working on it
+    '''
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+
+class _NullSpan(object):
+
+    def set(self, **attrs):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+def _current():
+    return getattr(_local, 'trace', None), getattr(_local, 'stack', None)
+
+
+def _export(trace):
+    if not trace.trace_id or not trace.spans:
+        return
+    lines = ''.join(json.dumps(span.to_dict(trace.trace_id)) + '\n' for span in trace.spans)
+    try:
+        with _export_lock:
+            with open(ULSR_TRACE_FILE, 'a') as f:
+                f.write(lines)
+    except (IOError, OSError) as e:
+        log_error('Unable to write trace file `%s`: %s', ULSR_TRACE_FILE, e)
+
+
+@contextmanager
+def trace(trace_id=None):
+    '''
+    Open a trace for the enclosed block, with a fresh span stack.  The trace
+    ID may be given later with set_trace_id(), e.g. once the prolog has
+    named the reservation.  Spans are exported when the block exits.
+    '''
+    if not ULSR_TRACE_ENABLE:
+        yield
+        return
+
+    saved = _current()
+    t = _Trace(reservation_trace_id(trace_id))
+    _local.trace, _local.stack = t, []
+    try:
+        yield
+    finally:
+        _local.trace, _local.stack = saved
+        _export(t)
+
+
+def set_trace_id(trace_id):
+    t, stack = _current()
+    if t:
+        t.trace_id = reservation_trace_id(trace_id)
+
+
+@contextmanager
+def span(name, **attrs):
+    '''
+    Record a span for the enclosed block, within the open trace, if any.
+    Yields the span, whose set() adds attributes.
+    '''
+    t, stack = _current()
+    if t is None:
+        yield _null_span
+        return
+
+    s = Span(name, stack[-1].span_id if stack else None, attrs)
+    stack.append(s)
+    try:
+        yield s
+    except Exception as e:
+        s.error = '%s: %s' % (e.__class__.__name__, e)
+        raise
+    finally:
+        s.t_end = time()
+        stack.pop()
+        t.add(s)
+
+
+def traced(name=None, attrs=()):
+    '''
+    Decorator recording a span for each call of the function.  The named
+    arguments listed in attrs are recorded as span attributes.
+    '''
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, 'trace', None) is None:
+                return fn(*args, **kwargs)
+            span_attrs = {}
+            if attrs:
+                callargs = getcallargs(fn, *args, **kwargs)
+                span_attrs = dict((k, callargs[k]) for k in attrs if k in callargs)
+            with span(span_name, **span_attrs):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(fn):
+    '''
+    Wrap fn to run in the trace and under the span current where propagate()
+    is called, e.g. for work submitted to a thread pool
+    '''
+    t, stack = _current()
+    if t is None:
+        return fn
+    parent = stack[-1] if stack else None
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        saved = _current()
+        _local.trace, _local.stack = t, [parent] if parent else []
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace, _local.stack = saved
+    return wrapper
+
+
+def load_spans(path, trace_id=None):
+    '''
+    Read exported spans, optionally only those of one trace
+    '''
+    trace_id = reservation_trace_id(trace_id)
+    spans = []
+    with open(path) as f:
+        for line in f:
+            try:
+                s = json.loads(line)
+            except ValueError:
+                continue
+            if (trace_id is None) or (s.get('trace_id') == trace_id):
+                spans.append(s)
+    return spans
+
+
+def critical_path(spans):
+    '''
+    Return the critical path through a trace's spans, as a list of
+    (span, t_start, t_end) segments in time order.  The span is None for
+    gaps in which no span of the trace ran, e.g. while waiting for the
+    monitor.  Within a span, time covered by its child spans is attributed
+    to the child which ends last before each point, recursively; time not
+    covered by any child is attributed to the span itself.
+    '''
+    by_id = dict((s['span_id'], s) for s in spans)
+    children = {}
+    roots = []
+    for s in spans:
+        if s.get('parent_id') in by_id:
+            children.setdefault(s['parent_id'], []).append(s)
+        else:
+            roots.append(s)
+
+    def _walk(s, t_start, t_end):
+        # Walk backwards from the end, following the last-ending child
+        segments = []
+        t = t_end
+        kids = sorted(children.get(s['span_id'], []), key=lambda c: c['end'], reverse=True)
+        for kid in kids:
+            if kid['end'] > t or kid['end'] <= t_start:
+                continue
+            if kid['end'] < t:
+                segments.append((s, kid['end'], t))
+            kid_start = max(kid['start'], t_start)
+            segments += reversed(_walk(kid, kid_start, kid['end']))
+            t = kid_start
+            if t <= t_start:
+                break
+        if t > t_start:
+            segments.append((s, t_start, t))
+        segments.reverse()
+        return segments
+
+    # Roots, e.g. the prolog and each monitor pass, are treated as the
+    # children of a virtual span covering the whole trace
+    if not roots:
+        return []
+    virtual = {'span_id': None, 'start': min(s['start'] for s in roots),
+               'end': max(s['end'] for s in roots)}
+    children[None] = roots
+    return [(None if s is virtual else s, t_start, t_end)
+            for s, t_start, t_end in _walk(virtual, virtual['start'], virtual['end'])]
+
+# EOF
@@ -1,17 +1,64 @@
 """
 MassOpenCloud (MOC) / Hardware Isolation Layer (HIL)
 
-User Level Slurm Reservations 
+User Level Slurm Reservations
 
 Infiniband support routines
 
+The fabric dump is the output of 'iblinkinfo -l', in which every switch
+port is listed on one line, with the switch on the left and the port's
+peer on the right:
+
+  0xf4521403007cbfd0 "SwitchIB Mellanox" 3 11[  ] ==( 4X 25.78125 Gbps Active/  LinkUp)==>  0xf4521403007cc001 14 1[  ] "node065 HCA-1" ( )
+
+Lines may carry a 'host: ' prefix, as written by clush.  The dump is read
+one line at a time into an index from node name (the first word of the
+peer's description) to the (switch GUID, port) it is linked to.  Links
+between switches are left out.
+
+The index is kept in a compact JSON cache next to the dump.  It is reused
+while the dump's size and modification time are unchanged, and after a
+change to either, reused as long as the dump's content hash is unchanged.
+Only a changed dump is parsed again.
+
+Links are disabled when nodes are reserved for HIL, and enabled when they
+are released, by the IBLinkEngine.
+
 November 2017, Tim Donahue  tdonahue@mit.edu
 """
-from sys import _getframe
 
-from hil_slurm_helpers import _exec_subprocess_cmd, _output_debug_info
-from hil_slurm_settings import DISABLE_IB_LINKS
+import errno
+import hashlib
+import json
+import os
+import re
+import shlex
+from multiprocessing.pool import ThreadPool
+from tempfile import NamedTemporaryFile
+from time import sleep, time
+
+from hil_slurm_helpers import _exec_subprocess_cmd
+from hil_slurm_settings import (DISABLE_IB_LINKS, ULSR_IB_LINKINFO_FILE, ULSR_IB_INDEX_CACHE,
+                                IBLINKINFO_CMD, IBPORTSTATE_CMD, IB_SWITCH_CONCURRENCY,
+                                IB_LINK_VERIFY_TIMEOUT)
 from hil_slurm_logging import log_debug, log_info, log_error
+from hil_slurm_trace import span, propagate
+
+IB_INDEX_VERSION = 1
+
+# ibportstate operations
+
+IB_LINK_DISABLE = 'disable'
+IB_LINK_ENABLE = 'enable'
+
+_LINK_RE = re.compile(r'^(?:\S+:\s+)?'
+                      r'(?P<guid>0x[0-9a-fA-F]+)\s+"[^"]*"\s+\d+\s+(?P<port>\d+)\[[^\]]*\]\s+'
+                      r'==\((?P<link>[^)]*)\)==>\s+'
+                      r'(?P<peer_guid>0x[0-9a-fA-F]+)\s+\d+\s+\d+\[[^\]]*\]\s+'
+                      r'"(?P<peer_desc>[^"]*)"')
+_PORT_RE = re.compile(r'^(?:\S+:\s+)?'
+                      r'(?P<guid>0x[0-9a-fA-F]+)\s+"[^"]*"\s+\d+\s+(?P<port>\d+)\[[^\]]*\]\s+'
+                      r'==\((?P<link>[^)]*)\)==>')
 
 
 def exec_subprocess_cmd(cmd):
@@ -21,91 +68,306 @@ def exec_subprocess_cmd(cmd):
     return _exec_subprocess_cmd(cmd)
 
 
-def _parse_iblinkinfo_line():
-    peer_switch_id = ''
-    port_number = ''
+def parse_iblinkinfo_line(line):
+    '''
+    Return (switch GUID, port, peer GUID, peer name) for a line describing
+    an active link, or None
+    '''
+    if 'LinkUp' not in line:
+        return None
+    m = _LINK_RE.match(line.strip())
+    if not m or ('LinkUp' not in m.group('link')):
+        return None
 
-    return peer_switch_id, port_number
+    peer_name = m.group('peer_desc').split(None, 1)
+    return (m.group('guid').lower(), int(m.group('port')), m.group('peer_guid').lower(),
+            peer_name[0] if peer_name else None)
 
 
-def _get_peer_ib_switchports():
+class IBFabricIndex(object):
+    '''
+    Node name -> (switch GUID, port) index of the links in a fabric dump
     '''
+    __slots__ = ('ports',)
+
+    def __init__(self, ports=None):
+        self.ports = ports or {}
+
+    @classmethod
+    def from_lines(cls, lines):
+        '''
+        Build the index from iblinkinfo output, read one line at a time
+        '''
+        switch_guids = set()
+        links = {}
+        for line in lines:
+            link = parse_iblinkinfo_line(line)
+            if not link:
+                continue
+            guid, port, peer_guid, peer_name = link
+            switch_guids.add(guid)
+            if peer_name:
+                links[peer_name] = (guid, port, peer_guid)
+
+        # Every switch appears on the left of its own ports' lines
+        return cls(dict((node, (guid, port)) for node, (guid, port, peer_guid)
+                        in links.iteritems() if peer_guid not in switch_guids))
+
+    def __len__(self):
+        return len(self.ports)
+
+    def lookup(self, nodelist):
+        '''
+        Return a dict mapping each node found to its (switch GUID, port),
+        and a list of the nodes not found
+        '''
+        found = {}
+        missing = []
+        for node in nodelist:
+            switchport = self.ports.get(node)
+            if switchport:
+                found[node] = switchport
+            else:
+                missing.append(node)
+        return found, missing
+
+    def by_switch(self, nodelist):
+        '''
+        Return a dict mapping switch GUID to the sorted ports linked to the nodes
+        '''
+        switches = {}
+        for node in nodelist:
+            switchport = self.ports.get(node)
+            if switchport:
+                switches.setdefault(switchport[0], []).append(switchport[1])
+        for ports in switches.itervalues():
+            ports.sort()
+        return switches
+
+
+def _file_digest(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), ''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _read_cache(cache_path):
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            log_debug('Unable to read IB fabric index `%s`: %s', cache_path, e)
+        return None
+    except ValueError:
+        log_debug('Discarding corrupt IB fabric index `%s`', cache_path)
+        return None
+    if not isinstance(cache, dict) or (cache.get('version') != IB_INDEX_VERSION):
+        return None
+    return cache
+
+
+def _write_cache(cache_path, cache):
+    try:
+        with NamedTemporaryFile('w', dir=os.path.dirname(cache_path), prefix='.ib_index',
+                                delete=False) as f:
+            json.dump(cache, f, separators=(',', ':'))
+        os.rename(f.name, cache_path)
+    except (IOError, OSError) as e:
+        log_error('Unable to write IB fabric index `%s`: %s', cache_path, e)
+
+
+def load_fabric_index(dump_path=ULSR_IB_LINKINFO_FILE, cache_path=ULSR_IB_INDEX_CACHE):
     '''
-    iblinkinfo_cmd = 'iblinkinfo -l -D 1'
-    iblinkinfo_cmd = 'cat iblinkinfo.out'
-    stdout_data, stderr_data = exec_subprocess_cmd(iblinkinfo_cmd)
-    if debug:
-        _output_debug_info(sys._getframe().f_code.co_name, stdout_data, stderr_data)
+    Return the fabric index of the dump, from the cache if the dump is unchanged.
+    Raises IOError / OSError if the dump cannot be read.
+    '''
+    st = os.stat(dump_path)
+    cache = _read_cache(cache_path)
+
+    if cache and (cache['mtime'] == st.st_mtime) and (cache['size'] == st.st_size):
+        return IBFabricIndex(dict((str(node), (str(guid), port))
+                                  for node, (guid, port) in cache['ports'].iteritems()))
+
+    digest = _file_digest(dump_path)
+    if cache and (cache['digest'] == digest):
+        log_debug('IB fabric dump `%s` touched but unchanged', dump_path)
+        index = IBFabricIndex(dict((str(node), (str(guid), port))
+                                   for node, (guid, port) in cache['ports'].iteritems()))
+    else:
+        log_debug('Indexing IB fabric dump `%s`', dump_path)
+        with open(dump_path) as f:
+            index = IBFabricIndex.from_lines(f)
 
-    switchport_list = []
+    _write_cache(cache_path, {'version': IB_INDEX_VERSION, 'mtime': st.st_mtime,
+                              'size': st.st_size, 'digest': digest, 'ports': index.ports})
+    return index
 
-    switch_id, port_number = _parse_iblinkinfo_line()
 
-    return switchport_list
+class IBLinkFailures(Exception):
+    """Raised when Infiniband links could not be set for one or more nodes.
+    failures maps each failed node to the reason."""
 
+    def __init__(self, action, failures):
+        self.action = action
+        self.failures = failures
+        super(IBLinkFailures, self).__init__('IB link %s failed on %d node(s): %s' %
+                                             (action, len(failures), ', '.join(
+                                                 '%s (%s)' % (node, failures[node])
+                                                 for node in sorted(failures))))
 
-def _disable_one_ib_link(switch_guid, port_number):
+
+def _port_states(lines):
     '''
+    Return a dict mapping (switch GUID, port) to True if the port's link is
+    up, for every switch port in iblinkinfo output
     '''
-    ibportstate_cmd = 'ibportstate -G {} {} disable'.format(switch_guid, port_number)
-    ibportstate_cmd = 'ls'
-
-    stdout_data, stderr_data = exec_subprocess_cmd(ibportstate_cmd)
-    if debug:
-        _output_debug_info(sys._getframe().f_code.co_name, stdout_data, stderr_data)
-
-
-# ibportstate -G 0xf4521403007cbfd0 11 disable # node065
+    states = {}
+    for line in lines:
+        m = _PORT_RE.match(line.strip())
+        if m:
+            states[(m.group('guid').lower(), int(m.group('port')))] = \
+                'LinkUp' in m.group('link')
+    return states
 
 
-def update_infiniband(nodelist):
+class IBLinkEngine(object):
     '''
+    Disable or enable the switch ports of a set of nodes.  Ports are grouped
+    by switch; the switches are worked on in parallel, up to <concurrency>
+    at a time, and the ports of one switch one after another.  The final
+    link states are verified with a single 'iblinkinfo' pass over the
+    fabric, repeated until the links settle or the timeout expires.
+    The commands may be replaced, e.g. by stand-in scripts for testing.
+    '''
+    def __init__(self, iblinkinfo_cmd=IBLINKINFO_CMD, ibportstate_cmd=IBPORTSTATE_CMD,
+                 concurrency=IB_SWITCH_CONCURRENCY, verify_timeout=IB_LINK_VERIFY_TIMEOUT,
+                 verify_interval=2):
+        self.iblinkinfo_cmd = shlex.split(iblinkinfo_cmd)
+        self.ibportstate_cmd = shlex.split(ibportstate_cmd)
+        self.concurrency = max(concurrency, 1)
+        self.verify_timeout = verify_timeout
+        self.verify_interval = verify_interval
+
+    def _set_switch_ports(self, switch_guid, ports, action):
+        '''
+        Run 'ibportstate' on each port of one switch.  Returns a dict mapping
+        the ports which failed to the error output.
+        '''
+        failures = {}
+        with span('ib.switch', switch=switch_guid, ports=len(ports), action=action):
+            for port in ports:
+                stdout_data, stderr_data = exec_subprocess_cmd(
+                    self.ibportstate_cmd + ['-G', switch_guid, str(port), action])
+                if stderr_data:
+                    failures[port] = stderr_data.strip()
+        return failures
+
+    def link_states(self):
+        '''
+        Return the link state of every switch port, from one 'iblinkinfo' pass
+        '''
+        stdout_data, stderr_data = exec_subprocess_cmd(self.iblinkinfo_cmd + ['-l'])
+        if stdout_data is None:
+            raise IOError('Unable to run `%s`: %s' % (' '.join(self.iblinkinfo_cmd),
+                                                     stderr_data))
+        return _port_states(stdout_data.splitlines())
+
+    def set_links(self, switches, action):
+        '''
+        Disable or enable the ports of each switch GUID in the switches dict,
+        and verify their final state.  Returns a dict mapping each port that
+        failed, as (switch GUID, port), to the reason.
+        '''
+        if not switches:
+            return {}
+
+        def _run(item):
+            switch_guid, ports = item
+            return switch_guid, self._set_switch_ports(switch_guid, ports, action)
+
+        items = sorted(switches.iteritems())
+        pool = ThreadPool(min(self.concurrency, len(items)))
+        try:
+            outcomes = pool.map(propagate(_run), items)
+        finally:
+            pool.close()
+            pool.join()
+
+        failures = {}
+        for switch_guid, port_failures in outcomes:
+            for port, error in port_failures.iteritems():
+                failures[(switch_guid, port)] = error
+
+        # Verify the ports which were set, all in one pass over the fabric
+        want_up = (action == IB_LINK_ENABLE)
+        pending = set((switch_guid, port) for switch_guid, ports in items for port in ports
+                      if (switch_guid, port) not in failures)
+        t_end = time() + self.verify_timeout
+        with span('ib.verify', ports=len(pending)):
+            while True:
+                states = self.link_states()
+                pending = set(switchport for switchport in pending
+                              if states.get(switchport, False) != want_up)
+                if not pending or (time() >= t_end):
+                    break
+                sleep(self.verify_interval)
+
+        for switchport in pending:
+            failures[switchport] = 'link not %s' % ('up' if want_up else 'down')
+        return failures
+
+
+def update_infiniband(nodelist, action=IB_LINK_DISABLE, engine=None, index=None):
+    '''
+    Disable, or enable, the switch ports linking the nodes to the Infiniband
+    fabric.  Returns a dict mapping each node whose link could not be set to
+    the reason.
+    Without a fabric dump, links are not managed and nothing is returned.
     '''
     if not DISABLE_IB_LINKS:
         log_info('Infiniband connections will not be modified')
-        return
-
-    log_info('Infiniband connections will be shut down')
-
-    for node in nodelist:
-        
-
-IBINFO_FILE = '/home/tdonahue/Documents/clush.out'
-IBINFO_FILE = '/home/tdonahue/Documents/ibl_all.out'
-
-lines = [line.strip('\n') for line in open(IBINFO_FILE)]
-
-switches = {}
-
-# Read each line in the IB link info output file
-
-for line in lines:
-    if line[:1] is '>':
-        print 'Skipping comment line'
-        continue
-
-    print line
-    lhs, _, switch_id_token = line.partition('==>')
-    if 'LinkUp' not in lhs:
-        continue
-
-    switch_id = switch_id_token.lstrip()[:18]
-
-    port_number_token, _, _ = switch_id_token.rpartition('[')
-    port_number = port_number_token.split()[2].strip()
-
-#    print 'Line %s' % line
-#    print '  Switch ID %s' % switch_id
-#    print '  Port number %s' % port_number
-
-    if switch_id in switches:
-        switches[switch_id].append(port_number)
-    else:
-        switches[switch_id] = [port_number]
-
-
-for switch_id, port_list in switches.iteritems():
-    print 'Switch ID  %s:  %s ports' % (switch_id, len(port_list))
-    for port_number in sorted(port_list, key=lambda(n): int(n)):
-        print '  Port ID %s' % port_number
-
+        return {}
+
+    if index is None:
+        try:
+            index = load_fabric_index(ULSR_IB_LINKINFO_FILE, ULSR_IB_INDEX_CACHE)
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                log_info('No IB fabric dump `%s`, Infiniband links not managed',
+                         ULSR_IB_LINKINFO_FILE)
+            else:
+                log_error('Unable to read IB fabric dump `%s`, Infiniband links not '
+                          'managed: %s', ULSR_IB_LINKINFO_FILE, e)
+            return {}
+
+    found, missing = index.lookup(nodelist)
+    for node in missing:
+        log_info('Node `%s` has no Infiniband link, skipping', node)
+    if not found:
+        return {}
+
+    log_info('Infiniband links of %d nodes will be %sd', len(found), action)
+
+    switches = index.by_switch(found)
+    engine = engine or IBLinkEngine()
+    try:
+        port_failures = engine.set_links(switches, action)
+    except (IOError, OSError) as e:
+        log_error('Unable to verify Infiniband links: %s', e)
+        return dict((node, str(e)) for node in found)
+
+    failures = {}
+    for node, switchport in sorted(found.iteritems()):
+        if switchport in port_failures:
+            failures[node] = port_failures[switchport]
+            log_error('Unable to %s IB link of node `%s` (%s port %s): %s',
+                      action, node, switchport[0], switchport[1], failures[node])
+        else:
+            log_info('IB link of node `%s` (%s port %s) %sd',
+                     node, switchport[0], switchport[1], action)
+    return failures
+
+# EOF
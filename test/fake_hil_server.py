@@ -0,0 +1,234 @@
+"""
+Fake HIL API server for client tests and throughput measurement
+
+Implements the subset of the HIL v0 REST API used by hil_slurm_client:
+node show and power off, port revert, project detach / connect and project
+list.  Port reverts leave the node with pending network actions for a short
+time, as on a real HIL server, so the detach retry and network polling paths
+are exercised.  An optional per-request latency stands in for a remote server.
+
+Use from a test:
+
+    server = FakeHILServer(['slurm-compute1', 'slurm-compute2'])
+    server.start()
+    hil_client = hil_slurm_client._hil_client_connect(server.url, 'admin', 'admin')
+    ...
+    server.stop()
+
+or run standalone to serve a synthetic cluster:
+
+    python fake_hil_server.py --nodes 256 --port 8080 --latency 0.02
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import urllib
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class FakeHILState(object):
+    """Projects, nodes and NIC networks of the fake HIL installation"""
+
+    def __init__(self, nodes, project='slurm', network='slurm-net', revert_delay=0.2):
+        self.lock = threading.Lock()
+        self.revert_delay = revert_delay
+        self.projects = set([project])
+        self.nodes = {}
+        self.n_requests = 0
+        self.n_calls = {}
+        for i, node in enumerate(nodes):
+            self.nodes[node] = {
+                'project': project,
+                'powered': True,
+                'pending_until': 0,
+                'nics': [{'label': 'eth0', 'macaddr': '00:00:00:00:%02x:%02x' % (i / 256, i % 256),
+                          'port': 'gi1/0/%d' % (i + 1), 'switch': 'switch0',
+                          'networks': {'vlan/native': network}}]
+                }
+
+    def _settle(self, node):
+        # Complete pending network actions whose time has come
+        n = self.nodes[node]
+        if n['pending_until'] and (time.time() >= n['pending_until']):
+            for nic in n['nics']:
+                nic['networks'] = {}
+            n['pending_until'] = 0
+
+    def show(self, node):
+        self._settle(node)
+        n = self.nodes[node]
+        return {'name': node, 'project': n['project'], 'metadata': {},
+                'nics': [dict(nic) for nic in n['nics']]}
+
+    def power_off(self, node):
+        self.nodes[node]['powered'] = False
+
+    def port_revert(self, switch, port):
+        for name, n in self.nodes.iteritems():
+            for nic in n['nics']:
+                if (nic['switch'] == switch) and (nic['port'] == port):
+                    n['pending_until'] = time.time() + self.revert_delay
+                    return True
+        return False
+
+    def detach(self, project, node):
+        self._settle(node)
+        n = self.nodes[node]
+        if n['project'] != project:
+            return 409, 'ProjectMismatchError', 'Node not in project `%s`' % project
+        if n['pending_until']:
+            return 409, 'BlockedError', 'Node has pending network actions'
+        if any(nic['networks'] for nic in n['nics']):
+            return 409, 'BlockedError', 'Node attached to a network'
+        n['project'] = None
+        return 200, None, None
+
+    def connect(self, project, node):
+        n = self.nodes[node]
+        if n['project'] is not None:
+            return 409, 'BlockedError', 'Node is already owned by a project.'
+        n['project'] = project
+        return 200, None, None
+
+
+class FakeHILRequestHandler(BaseHTTPRequestHandler):
+    """Routes HIL API requests, with or without the /v0 prefix"""
+
+    routes = [
+        ('GET', r'/node/(?P<node>[^/]+)$', 'node_show'),
+        ('POST', r'/node/(?P<node>[^/]+)/power_off$', 'node_power_off'),
+        ('POST', r'/switch/(?P<switch>[^/]+)/port/(?P<port>.+)/revert$', 'port_revert'),
+        ('POST', r'/project/(?P<project>[^/]+)/detach_node$', 'project_detach'),
+        ('POST', r'/project/(?P<project>[^/]+)/connect_node$', 'project_connect'),
+        ('GET', r'/projects$', 'project_list'),
+        ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body) if body is not None else ''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, error_type, msg):
+        self._reply(status, {'type': error_type, 'msg': msg})
+
+    def _body(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _dispatch(self, method):
+        state = self.server.state
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        path = re.sub(r'^/v0', '', self.path.split('?')[0])
+        for route_method, pattern, handler in self.routes:
+            m = re.match(pattern, path)
+            if m and (route_method == method):
+                with state.lock:
+                    state.n_requests += 1
+                    state.n_calls[handler] = state.n_calls.get(handler, 0) + 1
+                    params = dict((k, urllib.unquote(v)) for k, v in m.groupdict().iteritems())
+                    getattr(self, handler)(state, **params)
+                return
+        self._error(404, 'NotFoundError', 'No such API call `%s %s`' % (method, path))
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def node_show(self, state, node):
+        if node not in state.nodes:
+            return self._error(404, 'NotFoundError', 'Node `%s` does not exist' % node)
+        self._reply(200, state.show(node))
+
+    def node_power_off(self, state, node):
+        if node not in state.nodes:
+            return self._error(404, 'NotFoundError', 'Node `%s` does not exist' % node)
+        state.power_off(node)
+        self._reply(200)
+
+    def port_revert(self, state, switch, port):
+        if not state.port_revert(switch, port):
+            return self._error(404, 'NotFoundError', 'Port `%s` does not exist' % port)
+        self._reply(202)
+
+    def project_detach(self, state, project):
+        node = self._body().get('node')
+        if node not in state.nodes:
+            return self._error(404, 'NotFoundError', 'Node `%s` does not exist' % node)
+        status, error_type, msg = state.detach(project, node)
+        if error_type:
+            return self._error(status, error_type, msg)
+        self._reply(200)
+
+    def project_connect(self, state, project):
+        node = self._body().get('node')
+        if node not in state.nodes:
+            return self._error(404, 'NotFoundError', 'Node `%s` does not exist' % node)
+        if project not in state.projects:
+            return self._error(404, 'NotFoundError', 'Project `%s` does not exist' % project)
+        status, error_type, msg = state.connect(project, node)
+        if error_type:
+            return self._error(status, error_type, msg)
+        self._reply(200)
+
+    def project_list(self, state):
+        self._reply(200, sorted(state.projects))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeHILServer(object):
+    """A fake HIL server running in a background thread"""
+
+    def __init__(self, nodes, project='slurm', port=0, latency=0, revert_delay=0.2):
+        self.state = FakeHILState(nodes, project=project, revert_delay=revert_delay)
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', port), FakeHILRequestHandler)
+        self.httpd.state = self.state
+        self.httpd.latency = latency
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=16, help='Number of nodes')
+    parser.add_argument('--port', type=int, default=8080, help='Listen port')
+    parser.add_argument('--latency', type=float, default=0, help='Per-request latency (s)')
+    args = parser.parse_args()
+
+    server = FakeHILServer(['slurm-compute%d' % (i + 1) for i in range(args.nodes)],
+                           port=args.port, latency=args.latency)
+    print 'Fake HIL server at %s' % server.url
+    server.httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
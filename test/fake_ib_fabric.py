@@ -0,0 +1,120 @@
+"""
+Stand-in 'iblinkinfo' and 'ibportstate' commands for Infiniband link tests
+
+The fabric is kept in a JSON state file, so that concurrent 'ibportstate'
+runs, each a separate process, see each other's changes.  Each switch port
+linked to a node may be marked as failing, so 'ibportstate' reports an
+error, or as stuck, so the command succeeds but the link stays up.
+
+Use from a test:
+
+    state = write_fabric(str(tmpdir.join('fabric.json')),
+                         {'0xf452...bfd0': {11: 'node065', 12: 'node066'}})
+    engine = IBLinkEngine(iblinkinfo_cmd=command(state, 'iblinkinfo'),
+                          ibportstate_cmd=command(state, 'ibportstate'))
+
+or run as a command:
+
+    python fake_ib_fabric.py --state fabric.json iblinkinfo -l
+    python fake_ib_fabric.py --state fabric.json ibportstate -G 0xf452...bfd0 11 disable
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+_PORT_UP = '==( 4X 25.78125 Gbps Active/  LinkUp)==>'
+_PORT_DOWN = '==(                Down/ Disabled)==>'
+
+
+def write_fabric(path, switches, failing=(), stuck=()):
+    '''
+    Write a fabric state file.  switches maps switch GUID to {port: node}.
+    failing and stuck are lists of (switch GUID, port).
+    '''
+    state = {}
+    for switch_guid, ports in switches.iteritems():
+        state[switch_guid] = dict((str(port), {'node': node, 'enabled': True,
+                                               'failing': (switch_guid, port) in failing,
+                                               'stuck': (switch_guid, port) in stuck})
+                                  for port, node in ports.iteritems())
+    with open(path, 'w') as f:
+        json.dump(state, f)
+    return path
+
+
+def read_fabric(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def command(path, name):
+    '''
+    Return the command line running this script as the named command
+    '''
+    return '%s %s --state %s %s' % (sys.executable, os.path.abspath(__file__.rstrip('c')),
+                                    path, name)
+
+
+@contextmanager
+def _locked(path):
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _iblinkinfo(path, args):
+    state = read_fabric(path)
+    for lid, switch_guid in enumerate(sorted(state), 1):
+        ports = state[switch_guid]
+        for port in sorted(ports, key=int):
+            p = ports[port]
+            if p['enabled']:
+                print '%s "SwitchIB Fake" %d %s[  ] %s  0x%016x %d 1[  ] "%s HCA-1" ( )' % (
+                    switch_guid, lid, port, _PORT_UP, hash(p['node']) & 0xffffffff,
+                    100 + int(port), p['node'])
+            else:
+                print '%s "SwitchIB Fake" %d %s[  ] %s             [  ] "" ( )' % (
+                    switch_guid, lid, port, _PORT_DOWN)
+    return 0
+
+
+def _ibportstate(path, args):
+    parser = argparse.ArgumentParser(prog='ibportstate')
+    parser.add_argument('-G', dest='guid', required=True)
+    parser.add_argument('port')
+    parser.add_argument('op', choices=['enable', 'disable', 'query'])
+    args = parser.parse_args(args)
+
+    with _locked(path):
+        state = read_fabric(path)
+        port = state.get(args.guid, {}).get(args.port)
+        if port is None or port['failing']:
+            sys.stderr.write('ibwarn: [%d] smp_query_via: query failed\n' % os.getpid())
+            return 1
+        if (args.op != 'query') and not port['stuck']:
+            port['enabled'] = (args.op == 'enable')
+            with open(path, 'w') as f:
+                json.dump(state, f)
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Stand-in Infiniband commands')
+    parser.add_argument('--state', required=True, help='fabric state file')
+    parser.add_argument('cmd', choices=['iblinkinfo', 'ibportstate'])
+    args, rest = parser.parse_known_args(argv)
+    fn = _iblinkinfo if args.cmd == 'iblinkinfo' else _ibportstate
+    return fn(args.state, rest)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+
+# EOF
@@ -0,0 +1,601 @@
+"""
+Fake scontrol for prolog, monitor and helper tests and benchmarks
+
+Implements the subset of scontrol used by hil_slurm_helpers against a
+simulated cluster kept in a JSON state file:
+
+    scontrol [--json] show reservation|job|partition [<id>] [-o]
+    scontrol create reservation -o ReservationName=... StartTime=... ...
+    scontrol update -o Reservation=<name> <keyword>=<value> ...
+    scontrol delete -o Reservation=<name>
+
+Output is in the one-line-per-record format of 'scontrol show -o', or the
+v0.0.38 JSON format of 'scontrol --json show', with the success messages
+and error strings written by scontrol.  The state file is locked while it
+is read or changed, so concurrent fake scontrol processes behave as a
+single controller.
+
+Use from a test, either in-process:
+
+    state = FakeSlurmState.generate(nodes=1024, reservations=500)
+    scontrol = FakeScontrol(str(tmpdir.join('slurm.json')), state)
+    monkeypatch.setattr(hil_slurm_helpers, '_exec_subprocess_cmd',
+                        scontrol.exec_subprocess_cmd)
+
+or as an executable, run by the helpers in a subprocess:
+
+    monkeypatch.setattr(hil_slurm_helpers, 'SLURM_INSTALL_DIR',
+                        scontrol.install(str(tmpdir)))
+
+or from the command line, to generate a synthetic cluster and query it:
+
+    python fake_scontrol.py generate --state slurm.json --nodes 4096 --reservations 2000
+    python fake_scontrol.py --state slurm.json show reservation -o
+"""
+
+import argparse
+import errno
+import fcntl
+import inspect
+import json
+import os
+import pwd
+import random
+import stat
+import sys
+from contextlib import contextmanager
+from os.path import realpath, dirname, join
+from tempfile import NamedTemporaryFile
+from time import localtime, mktime, strftime, strptime, time
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_nodeset import NodeSet
+from hil_slurm_records import parse_slurm_duration
+
+TIME_FMT = '%Y-%m-%dT%H:%M:%S'
+
+# Slurm gives reservations of UNLIMITED duration an end time a year away
+
+UNLIMITED_SECONDS = 365 * 24 * 60 * 60
+
+# Reservation flags which allow a reservation to share nodes with another
+
+OVERLAP_FLAGS = set(['MAINT', 'OVERLAP'])
+
+HIL_FEATURE = 'HIL'
+HIL_PARTITION = 'HIL_partition'
+
+ENTITY_NAMES = {'reservation': 'reservation', 'reservations': 'reservation',
+                'res': 'reservation', 'job': 'job', 'jobs': 'job',
+                'partition': 'partition', 'partitions': 'partition'}
+
+
+class ScontrolError(Exception):
+    """An scontrol error, written to stderr or, for some 'show' errors, to stdout"""
+
+    def __init__(self, message, stdout=False):
+        super(ScontrolError, self).__init__(message)
+        self.stdout = stdout
+
+
+def _time_s(t):
+    return strftime(TIME_FMT, localtime(t)) if t is not None else 'Unknown'
+
+
+def _parse_time(time_s, t_now):
+    if time_s.lower() == 'now':
+        return t_now
+    try:
+        return mktime(strptime(time_s, TIME_FMT))
+    except ValueError:
+        raise ScontrolError('Invalid time specification: %s' % time_s)
+
+
+def _duration_s(seconds):
+    '''
+    Format a duration in seconds as scontrol does: [days-]HH:MM:SS or UNLIMITED
+    '''
+    if seconds is None:
+        return 'UNLIMITED'
+    days, seconds = divmod(int(seconds), 24 * 60 * 60)
+    hms = '%02d:%02d:%02d' % (seconds / 3600, (seconds / 60) % 60, seconds % 60)
+    return '%d-%s' % (days, hms) if days else hms
+
+
+def _null(value):
+    return value if value else '(null)'
+
+
+def _unset(value):
+    # Helpers pass unset keyword values through as 'None'
+    return value in (None, '', 'None', '(null)')
+
+
+class FakeSlurmState(object):
+    """Nodes, partitions, jobs and reservations of the fake Slurm cluster"""
+
+    def __init__(self, nodes=None, partitions=None, jobs=None, reservations=None):
+        self.nodes = nodes or {}                # node -> [feature, ...]
+        self.partitions = partitions or {}      # name -> attributes
+        self.jobs = jobs or {}                  # job ID -> attributes
+        self.reservations = reservations or {}  # name -> attributes
+
+    def to_dict(self):
+        return {'nodes': self.nodes, 'partitions': self.partitions, 'jobs': self.jobs,
+                'reservations': self.reservations}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d.get('nodes'), d.get('partitions'), d.get('jobs'), d.get('reservations'))
+
+    def add_nodes(self, nodes, features=()):
+        for node in NodeSet(nodes):
+            self.nodes[node] = list(features)
+
+    def add_partition(self, name, nodes, state='UP', default=False, shared='NO',
+                      exclusive_user=False, max_time=24 * 60 * 60,
+                      default_time=60 * 60):
+        self.partitions[name] = {'nodes': str(NodeSet(nodes)), 'state': state,
+                                 'default': default, 'shared': shared,
+                                 'exclusive_user': exclusive_user, 'max_time': max_time,
+                                 'default_time': default_time}
+
+    def add_job(self, job_id, name, user, partition, nodes=None, state='RUNNING',
+                t_start=None, time_limit=60 * 60, reservation=None):
+        t_start = time() if t_start is None else t_start
+        self.jobs[str(job_id)] = {'name': name, 'user': user, 'uid': _uid(user),
+                                  'partition': partition,
+                                  'nodes': str(NodeSet(nodes)) if nodes else None,
+                                  'state': state, 't_start': t_start,
+                                  't_end': (t_start + time_limit) if time_limit else None,
+                                  'time_limit': time_limit, 'reservation': reservation}
+
+    def add_reservation(self, name, users, nodes, t_start, t_end, flags=(), features=None):
+        self.reservations[name] = {'nodes': str(NodeSet(nodes)), 'users': users,
+                                   't_start': t_start, 't_end': t_end,
+                                   'flags': sorted(flags), 'features': features}
+
+    @classmethod
+    def generate(cls, nodes=1024, reservations=0, jobs=0, hil_fraction=0.5, seed=0,
+                 t_now=None):
+        '''
+        Generate a synthetic cluster.  The first hil_fraction of the nodes have
+        the HIL feature and form the HIL partition; all nodes are in the default
+        'batch' partition.  About half the reservations are HIL reserve / release
+        pairs of the current user, the others maintenance reservations.
+        '''
+        rng = random.Random(seed)
+        t_now = int(time() if t_now is None else t_now)
+        width = len(str(nodes))
+        names = ['node%0*d' % (width, i) for i in range(1, nodes + 1)]
+        n_hil = int(nodes * hil_fraction)
+
+        state = cls()
+        state.add_nodes(names[:n_hil], [HIL_FEATURE])
+        state.add_nodes(names[n_hil:])
+        state.add_partition('batch', names, default=True)
+        if n_hil:
+            state.add_partition(HIL_PARTITION, names[:n_hil], exclusive_user=True)
+
+        user = pwd.getpwuid(os.getuid())
+        for i in range(reservations):
+            hil = n_hil and (rng.random() < 0.5)
+            lo = rng.randint(0, (n_hil if hil else nodes) - 1)
+            res_nodes = names[lo:min(lo + rng.randint(1, 16), n_hil if hil else nodes)]
+            t_start = t_now + rng.randint(-86400, 86400)
+            t_end = t_start + rng.randint(600, 86400)
+            if hil:
+                suffix = '%s_%d_%d' % (user.pw_name, user.pw_uid, t_now - i)
+                state.add_reservation('flexalloc_MOC_reserve_' + suffix, user.pw_name,
+                                      res_nodes, t_start, t_end, ['IGNORE_JOBS', 'MAINT'],
+                                      HIL_FEATURE)
+                if rng.random() < 0.8:
+                    state.add_reservation('flexalloc_MOC_release_' + suffix, user.pw_name,
+                                          res_nodes, t_start, t_end,
+                                          ['IGNORE_JOBS', 'MAINT'], HIL_FEATURE)
+            else:
+                state.add_reservation('maint_%d' % i, 'root', res_nodes, t_start, t_end,
+                                      ['MAINT'])
+
+        for i in range(jobs):
+            lo = rng.randint(0, nodes - 1)
+            state.add_job(1000 + i, 'job%d' % i, user.pw_name, 'batch',
+                          names[lo:lo + rng.randint(1, 4)],
+                          rng.choice(['RUNNING', 'PENDING', 'COMPLETED']),
+                          t_now - rng.randint(0, 3600), rng.choice([600, 3600, 86400]))
+        return state
+
+
+def _uid(user):
+    try:
+        return pwd.getpwnam(user).pw_uid
+    except KeyError:
+        return 0
+
+
+def _reservation_line(name, r, t_now):
+    nodes = NodeSet(r['nodes'])
+    t_end = r['t_end']
+    return ' '.join([
+        'ReservationName=%s' % name,
+        'StartTime=%s' % _time_s(r['t_start']),
+        'EndTime=%s' % _time_s(t_end),
+        'Duration=%s' % _duration_s(t_end - r['t_start']),
+        'Nodes=%s' % _null(r['nodes']),
+        'NodeCnt=%d' % len(nodes),
+        'CoreCnt=%d' % len(nodes),
+        'Features=%s' % _null(r['features']),
+        'PartitionName=(null)',
+        'Flags=%s' % _null(','.join(r['flags'])),
+        'TRES=cpu=%d' % len(nodes),
+        'Users=%s' % _null(r['users']),
+        'Accounts=(null)',
+        'Licenses=(null)',
+        'State=%s' % ('ACTIVE' if r['t_start'] <= t_now < t_end else 'INACTIVE'),
+        'BurstBuffer=(null)',
+        'Watts=n/a'])
+
+
+def _job_line(job_id, j, t_now):
+    return ' '.join([
+        'JobId=%s' % job_id,
+        'JobName=%s' % j['name'],
+        'UserId=%s(%d)' % (j['user'], j['uid']),
+        'GroupId=%s(%d)' % (j['user'], j['uid']),
+        'Priority=1',
+        'Account=(null)',
+        'QOS=normal',
+        'JobState=%s' % j['state'],
+        'Reason=None',
+        'TimeLimit=%s' % _duration_s(j['time_limit']),
+        'StartTime=%s' % _time_s(j['t_start']),
+        'EndTime=%s' % _time_s(j['t_end']),
+        'Partition=%s' % j['partition'],
+        'ReqNodeList=(null)',
+        'NodeList=%s' % _null(j['nodes']),
+        'Reservation=%s' % _null(j['reservation'])])
+
+
+def _partition_line(name, p, t_now):
+    nodes = NodeSet(p['nodes'])
+    return ' '.join([
+        'PartitionName=%s' % name,
+        'AllowGroups=ALL',
+        'AllowAccounts=ALL',
+        'Default=%s' % ('YES' if p['default'] else 'NO'),
+        'DefaultTime=%s' % _duration_s(p['default_time']),
+        'DisableRootJobs=NO',
+        'ExclusiveUser=%s' % ('YES' if p['exclusive_user'] else 'NO'),
+        'MaxNodes=UNLIMITED',
+        'MaxTime=%s' % _duration_s(p['max_time']),
+        'MinNodes=1',
+        'Nodes=%s' % _null(p['nodes']),
+        'OverSubscribe=%s' % p['shared'],
+        'State=%s' % p['state'],
+        'TotalCPUs=%d' % len(nodes),
+        'TotalNodes=%d' % len(nodes)])
+
+
+def _reservation_json(name, r, t_now):
+    return {'name': name, 'start_time': int(r['t_start']), 'end_time': int(r['t_end']),
+            'node_list': r['nodes'], 'node_count': len(NodeSet(r['nodes'])),
+            'features': r['features'], 'partition': None, 'flags': r['flags'],
+            'users': r['users'], 'accounts': None}
+
+
+def _job_json(job_id, j, t_now):
+    return {'job_id': int(job_id), 'name': j['name'], 'user_name': j['user'],
+            'user_id': j['uid'], 'job_state': j['state'], 'partition': j['partition'],
+            'resv_name': j['reservation'],
+            'time_limit': (j['time_limit'] / 60) if j['time_limit'] else 0xffffffff,
+            'start_time': int(j['t_start']), 'end_time': int(j['t_end'] or 0),
+            'nodes': j['nodes']}
+
+
+def _partition_json(name, p, t_now):
+    flags = []
+    if p['default']:
+        flags.append('DEFAULT')
+    if p['exclusive_user']:
+        flags.append('EXCLUSIVE_USER')
+    return {'name': name, 'nodes': p['nodes'], 'state': p['state'], 'flags': flags,
+            'maximum_time': (p['max_time'] / 60) if p['max_time'] else 0xffffffff,
+            'maximums': {'oversubscribe': {
+                'jobs': 4 if p['shared'] == 'YES' else 1,
+                'flags': [p['shared']] if p['shared'] in ('FORCE', 'EXCLUSIVE') else []}}}
+
+
+# Per entity: state attribute, -o formatter, JSON formatter, JSON key,
+# 'show' output with no records, error message for an unknown ID
+
+_SHOW = {
+    'reservation': ('reservations', _reservation_line, _reservation_json, 'reservations',
+                    'No reservations in the system', 'Reservation %s not found'),
+    'job': ('jobs', _job_line, _job_json, 'jobs',
+            'No jobs in the system', 'slurm_load_jobs error: Invalid job id specified'),
+    'partition': ('partitions', _partition_line, _partition_json, 'partitions',
+                  'No partitions in the system', 'Partition %s not found'),
+    }
+
+
+def _keyword_args(args):
+    '''
+    Parse keyword=value arguments into an ordered list of (keyword, value),
+    keywords in lower case.  'Flags+=X' and 'Flags-=X' keep the operator.
+    '''
+    kwargs = []
+    for arg in args:
+        k, sep, v = arg.partition('=')
+        if not sep:
+            raise ScontrolError('Invalid input: %s' % arg)
+        kwargs.append((k.lower(), v))
+    return kwargs
+
+
+class FakeScontrol(object):
+    """scontrol commands run against a fake Slurm state file"""
+
+    def __init__(self, path, state=None):
+        self.path = path
+        if state is not None:
+            self.save(state)
+
+    @contextmanager
+    def _locked(self, exclusive):
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return FakeSlurmState.from_dict(json.load(f))
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return FakeSlurmState()
+
+    def save(self, state):
+        with NamedTemporaryFile('w', dir=dirname(realpath(self.path)), prefix='.fake_slurm',
+                                delete=False) as f:
+            json.dump(state.to_dict(), f, separators=(',', ':'))
+        os.rename(f.name, self.path)
+
+    def install(self, bin_dir):
+        '''
+        Write an 'scontrol' executable running this fake scontrol to bin_dir.
+        Returns bin_dir, for use as SLURM_INSTALL_DIR.
+        '''
+        path = join(bin_dir, 'scontrol')
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\nexec %s %s --state %s "$@"\n' %
+                    (sys.executable, realpath(__file__.rstrip('c')), realpath(self.path)))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return bin_dir
+
+    def exec_subprocess_cmd(self, cmd):
+        '''
+        Drop-in replacement for hil_slurm_helpers._exec_subprocess_cmd,
+        running scontrol commands in-process
+        '''
+        if os.path.basename(cmd[0]) != 'scontrol':
+            return None, 'error: Exception on Popen or communicate'
+        stdout_data, stderr_data, status = self.run(cmd[1:])
+        return stdout_data, stderr_data
+
+    def run(self, argv, t_now=None):
+        '''
+        Run an scontrol command line, without the command name.
+        Returns (stdout, stderr, exit status).
+        '''
+        t_now = time() if t_now is None else t_now
+        json_output = '--json' in argv
+        args = [arg for arg in argv if arg not in ('-o', '--oneliner', '--json', '-Q')]
+        if not args:
+            return '', 'scontrol: error: No command given\n', 1
+
+        action, args = args[0].lower(), args[1:]
+        try:
+            if action == 'show':
+                with self._locked(False):
+                    stdout_data = self._show(self.load(), args, json_output, t_now)
+            elif action in ('create', 'update', 'delete'):
+                with self._locked(True):
+                    state = self.load()
+                    stdout_data = getattr(self, '_' + action)(state, args, t_now)
+                    self.save(state)
+            else:
+                raise ScontrolError('Invalid command: %s' % action)
+        except ScontrolError as e:
+            if e.stdout:
+                return str(e) + '\n', '', 1
+            return '', str(e) + '\n', 1
+
+        # State file strings are read back as unicode
+        if isinstance(stdout_data, unicode):
+            stdout_data = stdout_data.encode('utf-8')
+        return stdout_data, '', 0
+
+    def _show(self, state, args, json_output, t_now):
+        if not args or (args[0].lower() not in ENTITY_NAMES):
+            raise ScontrolError('Invalid entity %s for keyword show' %
+                                (args[0] if args else ''))
+        entity = ENTITY_NAMES[args[0].lower()]
+        entity_id = args[1] if len(args) > 1 else None
+        attr, line_fn, json_fn, json_key, none_msg, not_found_fmt = _SHOW[entity]
+        records = getattr(state, attr)
+
+        if entity_id is not None:
+            if entity_id not in records:
+                if json_output:
+                    return json.dumps({json_key: [], 'errors': [
+                        {'error': not_found_fmt.replace(' %s', ''),
+                         'description': not_found_fmt.replace('%s', entity_id)}]})
+                raise ScontrolError(not_found_fmt.replace('%s', entity_id), stdout=True)
+            ids = [entity_id]
+        else:
+            ids = sorted(records)
+
+        if json_output:
+            return json.dumps({json_key: [json_fn(i, records[i], t_now) for i in ids],
+                               'errors': []})
+        if not ids:
+            return none_msg + '\n'
+        return ''.join(line_fn(i, records[i], t_now) + '\n' for i in ids)
+
+    def _reservation_nodes(self, state, nodes_s, features):
+        if nodes_s.upper() == 'ALL':
+            nodes = [node for node, node_features in state.nodes.iteritems()
+                     if _unset(features) or (features in node_features)]
+            if not nodes:
+                raise ScontrolError('Error creating the reservation: '
+                                    'Requested node configuration is not available')
+            return str(NodeSet(nodes))
+
+        nodes = NodeSet(nodes_s)
+        if any(node not in state.nodes for node in nodes):
+            raise ScontrolError('Error creating the reservation: '
+                                'Invalid node name specified')
+        return str(nodes)
+
+    def _check_overlap(self, state, name, r, action):
+        if OVERLAP_FLAGS & set(r['flags']):
+            return
+        nodes = NodeSet(r['nodes'])
+        for other_name, other in state.reservations.iteritems():
+            if (other_name == name) or (OVERLAP_FLAGS & set(other['flags'])):
+                continue
+            if (other['t_start'] < r['t_end']) and (r['t_start'] < other['t_end']) and \
+               not nodes.isdisjoint(NodeSet(other['nodes'])):
+                raise ScontrolError('Error %s the reservation: Requested nodes are busy' %
+                                    action)
+
+    def _apply_times(self, r, kwargs, t_now, action):
+        for k, v in kwargs:
+            if k == 'starttime':
+                r['t_start'] = _parse_time(v, t_now)
+            elif k == 'endtime':
+                r['t_end'] = _parse_time(v, t_now)
+        for k, v in kwargs:
+            if k == 'duration':
+                try:
+                    seconds = parse_slurm_duration(v)
+                except ValueError:
+                    raise ScontrolError('Invalid duration specification: %s' % v)
+                r['t_end'] = r['t_start'] + (seconds if seconds is not None else
+                                             UNLIMITED_SECONDS)
+        if r['t_end'] is None:
+            r['t_end'] = r['t_start'] + UNLIMITED_SECONDS
+        if r['t_end'] <= r['t_start']:
+            raise ScontrolError('Error %s the reservation: Invalid time specification' % action)
+
+    def _create(self, state, args, t_now):
+        if not args or (args[0].lower() not in ('reservation', 'res')):
+            raise ScontrolError('Invalid creation entity: %s' % (args[0] if args else ''))
+        kwargs = _keyword_args(args[1:])
+        d = dict(kwargs)
+
+        name = d.get('reservationname')
+        if _unset(name):
+            raise ScontrolError('Error creating the reservation: Invalid reservation name')
+        if name in state.reservations:
+            raise ScontrolError('Error creating the reservation: Duplicate reservation name')
+
+        users = d.get('users', d.get('user'))
+        if _unset(users):
+            raise ScontrolError('Error creating the reservation: '
+                                'Reservation request must include Users or Accounts')
+        if any(not _uid(user) and user != 'root' for user in users.split(',')):
+            raise ScontrolError('Error creating the reservation: Invalid user id')
+
+        features = None if _unset(d.get('features')) else d['features']
+        flags = [] if _unset(d.get('flags')) else [f.upper() for f in d['flags'].split(',')]
+        r = {'users': users, 'features': features, 'flags': sorted(flags),
+             't_start': t_now, 't_end': None,
+             'nodes': self._reservation_nodes(state, d.get('nodes', 'ALL'), features)}
+        self._apply_times(r, kwargs, t_now, 'creating')
+        self._check_overlap(state, name, r, 'creating')
+
+        state.reservations[name] = r
+        return 'Reservation created: %s\n' % name
+
+    def _named_reservation(self, state, kwargs, action):
+        d = dict(kwargs)
+        name = d.get('reservation', d.get('reservationname'))
+        if name not in state.reservations:
+            raise ScontrolError('Error %s the reservation: Requested reservation is invalid' %
+                                action)
+        return name, state.reservations[name]
+
+    def _update(self, state, args, t_now):
+        kwargs = _keyword_args(args)
+        name, r = self._named_reservation(state, kwargs, 'updating')
+        r = dict(r)
+
+        for k, v in kwargs:
+            if k in ('users', 'user'):
+                r['users'] = v
+            elif k == 'features':
+                r['features'] = None if _unset(v) else v
+            elif k == 'nodes':
+                r['nodes'] = self._reservation_nodes(state, v, r['features'])
+            elif k in ('flags', 'flags+', 'flags-'):
+                flags = set(f.upper() for f in v.split(',') if f)
+                if k == 'flags-':
+                    r['flags'] = sorted(set(r['flags']) - flags)
+                else:
+                    r['flags'] = sorted(set(r['flags']) | flags)
+        self._apply_times(r, kwargs, t_now, 'updating')
+        self._check_overlap(state, name, r, 'updating')
+
+        state.reservations[name] = r
+        return 'Reservation updated.\n'
+
+    def _delete(self, state, args, t_now):
+        name, r = self._named_reservation(state, _keyword_args(args), 'deleting')
+        del state.reservations[name]
+        return ''
+
+
+def main(argv):
+    if argv and (argv[0] == 'generate'):
+        parser = argparse.ArgumentParser(prog='fake_scontrol.py generate',
+                                         description='Generate a synthetic Slurm cluster')
+        parser.add_argument('--state', required=True, help='fake Slurm state file')
+        parser.add_argument('--nodes', type=int, default=1024, help='Number of nodes')
+        parser.add_argument('--reservations', type=int, default=0,
+                            help='Number of reservations (HIL pairs count once)')
+        parser.add_argument('--jobs', type=int, default=0, help='Number of jobs')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        args = parser.parse_args(argv[1:])
+
+        state = FakeSlurmState.generate(args.nodes, args.reservations, args.jobs,
+                                        seed=args.seed)
+        FakeScontrol(args.state, state)
+        print '%s: %d nodes, %d partitions, %d reservations, %d jobs' % (
+            args.state, len(state.nodes), len(state.partitions), len(state.reservations),
+            len(state.jobs))
+        return 0
+
+    state_path = os.environ.get('FAKE_SCONTROL_STATE')
+    if argv[:1] == ['--state'] and len(argv) > 1:
+        state_path, argv = argv[1], argv[2:]
+    if not state_path:
+        sys.stderr.write('fake_scontrol.py: --state or FAKE_SCONTROL_STATE is required\n')
+        return 1
+
+    stdout_data, stderr_data, status = FakeScontrol(state_path).run(argv)
+    sys.stdout.write(stdout_data)
+    sys.stderr.write(stderr_data)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+
+# EOF
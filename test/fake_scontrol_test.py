@@ -0,0 +1,174 @@
+"""
+Slurm helper tests against the fake scontrol
+
+Unlike the other helper tests, these run the 'scontrol show', create,
+update and delete helpers end to end; fake_scontrol.py simulates the Slurm
+controller, in-process or as an 'scontrol' executable.
+
+run the tests like this
+py.test fake_scontrol_test.py
+"""
+
+import inspect
+import os
+import pwd
+import sys
+from os.path import realpath, dirname, join
+from time import time
+
+import pytest
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import hil_slurm_helpers
+from hil_slurm_constants import RES_CREATE_FLAGS, RES_CREATE_HIL_FEATURES
+from hil_slurm_records import format_slurm_time
+from fake_scontrol import FakeScontrol, FakeSlurmState
+
+
+@pytest.fixture
+def state():
+    state = FakeSlurmState()
+    state.add_nodes('server[1-4]', ['HIL'])
+    state.add_nodes('server[5-8]')
+    state.add_partition('HIL_partition', 'server[1-4]', exclusive_user=True)
+    state.add_partition('batch', 'server[1-8]', default=True)
+    state.add_job(1234, 'hil_reserve', pwd.getpwuid(os.getuid()).pw_name, 'HIL_partition',
+                  'server1')
+    return state
+
+
+def _fake_scontrol(tmpdir, state, monkeypatch):
+    monkeypatch.setattr(hil_slurm_helpers, 'SCONTROL_CACHE_ENABLE', False)
+    monkeypatch.setattr(hil_slurm_helpers, '_scontrol_cache', None)
+    scontrol = FakeScontrol(str(tmpdir.join('slurm.json')), state)
+    monkeypatch.setattr(hil_slurm_helpers, '_exec_subprocess_cmd', scontrol.exec_subprocess_cmd)
+    return scontrol
+
+
+@pytest.fixture
+def scontrol(tmpdir, state, monkeypatch):
+    return _fake_scontrol(tmpdir, state, monkeypatch)
+
+
+def _hil_resname(restype='reserve'):
+    user = pwd.getpwuid(os.getuid())
+    return 'flexalloc_MOC_%s_%s_%d_%d' % (restype, user.pw_name, user.pw_uid, int(time()))
+
+
+def _create(resname, nodes=None, duration=3600, flags=RES_CREATE_FLAGS):
+    t_now = time()
+    return hil_slurm_helpers.create_slurm_reservation(
+        resname, pwd.getpwuid(os.getuid()).pw_name, format_slurm_time(t_now),
+        format_slurm_time(t_now + duration), nodes=nodes, flags=flags,
+        features=RES_CREATE_HIL_FEATURES)
+
+
+class TestFakeScontrol:
+    """Tests the Slurm helpers against the in-process fake scontrol"""
+
+    def test_show(self, scontrol):
+        partitions = dict((p.name, p) for p in hil_slurm_helpers.get_partition_data(None))
+        assert sorted(partitions) == ['HIL_partition', 'batch']
+        assert partitions['HIL_partition'].exclusive_user
+        assert partitions['HIL_partition'].max_time == 24 * 60 * 60
+        assert partitions['batch'].default
+
+        job = hil_slurm_helpers.get_job_data('1234')[0]
+        assert (job.name, job.partition, job.nodes, job.time_limit) == \
+            ('hil_reserve', 'HIL_partition', 'server1', 3600)
+
+        assert hil_slurm_helpers.get_hil_reservations() == []
+        dict_list, stdout_data, stderr_data = \
+            hil_slurm_helpers.exec_scontrol_show_cmd('reservation', 'missing')
+        assert (dict_list, stdout_data) == ([], None)
+        assert stderr_data == 'Reservation missing not found\n'
+        dict_list, stdout_data, stderr_data = \
+            hil_slurm_helpers.exec_scontrol_show_cmd('job', '99')
+        assert 'Invalid job id' in stderr_data
+
+    def test_cache_errors(self, scontrol, tmpdir, monkeypatch):
+        monkeypatch.setattr(hil_slurm_helpers, 'SCONTROL_CACHE_ENABLE', True)
+        monkeypatch.setattr(hil_slurm_helpers, 'SCONTROL_CACHE_FILE',
+                            str(tmpdir.join('scontrol_cache.json')))
+        cache = hil_slurm_helpers._get_scontrol_cache()
+
+        # Answers for missing reservations and jobs are not cached, so a
+        # reservation or job created afterwards is found
+        assert hil_slurm_helpers.get_reservation_data('missing') == []
+        assert hil_slurm_helpers.get_job_data('99') == []
+        assert cache.get('reservation', 'missing') is None
+        assert cache.get('job', '99') is None
+
+        assert hil_slurm_helpers.get_job_data('1234')
+        assert cache.get('job', '1234') is not None
+
+    def test_create_update_delete(self, scontrol):
+        resname = _hil_resname()
+        stdout_data, stderr_data = _create(resname)
+        assert (stdout_data, stderr_data) == ('Reservation created: %s\n' % resname, '')
+
+        res = hil_slurm_helpers.get_hil_reservations()[0]
+        assert (res.name, res.nodes, res.features) == (resname, 'server[1-4]', 'HIL')
+        assert set(res.flags.split(',')) == set(RES_CREATE_FLAGS.split(','))
+
+        stdout_data, stderr_data = _create(resname)
+        assert stderr_data == 'Error creating the reservation: Duplicate reservation name\n'
+
+        stdout_data, stderr_data = hil_slurm_helpers.update_slurm_reservation(
+            resname, nodes='server[1-2]')
+        assert (stdout_data, stderr_data) == ('Reservation updated.\n', '')
+        assert hil_slurm_helpers.get_reservation_data(resname)[0].nodes == 'server[1-2]'
+
+        assert hil_slurm_helpers.delete_slurm_reservation(resname) == ('', '')
+        stdout_data, stderr_data = hil_slurm_helpers.delete_slurm_reservation(resname)
+        assert stderr_data == \
+            'Error deleting the reservation: Requested reservation is invalid\n'
+        assert hil_slurm_helpers.get_hil_reservations() == []
+
+    def test_create_errors(self, scontrol):
+        stdout_data, stderr_data = _create('maint', nodes='server[4-5]', flags='IGNORE_JOBS')
+        assert stderr_data == ''
+        stdout_data, stderr_data = _create('overlap', nodes='server5', flags='IGNORE_JOBS')
+        assert stderr_data == 'Error creating the reservation: Requested nodes are busy\n'
+        stdout_data, stderr_data = _create('unknown', nodes='server9')
+        assert stderr_data == 'Error creating the reservation: Invalid node name specified\n'
+        stdout_data, stderr_data = _create('backwards', duration=-60)
+        assert 'Invalid time specification' in stderr_data
+
+    def test_json_backend(self, scontrol, monkeypatch):
+        _create(_hil_resname('reserve'))
+        text = [(r.name, r.nodes, r.t_start, r.t_end)
+                for r in hil_slurm_helpers.get_hil_reservations()]
+        partitions = [(p.name, p.nodes, p.max_time, p.exclusive_user)
+                      for p in hil_slurm_helpers.get_partition_data(None)]
+
+        monkeypatch.setattr(hil_slurm_helpers, 'SCONTROL_SHOW_BACKEND', 'json')
+        assert [(r.name, r.nodes, r.t_start, r.t_end)
+                for r in hil_slurm_helpers.get_hil_reservations()] == text
+        assert [(p.name, p.nodes, p.max_time, p.exclusive_user)
+                for p in hil_slurm_helpers.get_partition_data(None)] == partitions
+        assert hil_slurm_helpers.get_reservation_data('missing') == []
+
+    def test_executable(self, scontrol, tmpdir, monkeypatch):
+        monkeypatch.undo()
+        monkeypatch.setattr(hil_slurm_helpers, 'SCONTROL_CACHE_ENABLE', False)
+        monkeypatch.setattr(hil_slurm_helpers, 'SLURM_INSTALL_DIR',
+                            scontrol.install(str(tmpdir)))
+
+        resname = _hil_resname()
+        assert _create(resname) == ('Reservation created: %s\n' % resname, '')
+        assert [r.name for r in hil_slurm_helpers.get_hil_reservations()] == [resname]
+        assert hil_slurm_helpers.delete_slurm_reservation(resname) == ('', '')
+
+    def test_generate(self, tmpdir, monkeypatch):
+        state = FakeSlurmState.generate(nodes=2000, reservations=400, jobs=100, seed=1)
+        assert len(state.nodes) == 2000
+        _fake_scontrol(tmpdir, state, monkeypatch)
+
+        hil_reservations = hil_slurm_helpers.get_hil_reservations()
+        assert len(hil_reservations) == \
+            len([name for name in state.reservations if name.startswith('flexalloc_MOC_')])
+        assert all(res.nodeset for res in hil_reservations)
+        assert len(hil_slurm_helpers.get_job_data(None)) == 100
@@ -0,0 +1,72 @@
+"""
+HIL client throughput measurement against the fake HIL server
+
+Reserves and releases synthetic nodes through hil_reserve_nodes and
+hil_free_nodes, serially and in parallel, and reports the elapsed time
+and HIL API request rate.
+
+run like this
+python hil_client_bench.py --nodes 64 --latency 0.02
+"""
+
+import argparse
+import inspect
+import sys
+import time
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import hil_slurm_async
+import hil_slurm_client
+from fake_hil_server import FakeHILServer
+
+
+def _measure(label, server, fn):
+    n_requests = server.state.n_requests
+    t_start = time.time()
+    fn()
+    elapsed = time.time() - t_start
+    n_requests = server.state.n_requests - n_requests
+    print '%-28s %8.2f s  %6d requests  %8.1f requests/s' % (label, elapsed, n_requests,
+                                                             n_requests / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=64, help='Number of nodes')
+    parser.add_argument('--latency', type=float, default=0.02, help='Per-request latency (s)')
+    parser.add_argument('--reservations', type=int, default=8,
+                        help='Concurrent reservations for the async run')
+    args = parser.parse_args()
+
+    project = 'slurm'
+    nodelist = ['slurm-compute%d' % (i + 1) for i in range(args.nodes)]
+    server = FakeHILServer(nodelist, project=project, latency=args.latency).start()
+    client = hil_slurm_client._hil_client_connect(server.url, 'admin', 'admin',
+                                                  pool_maxsize=hil_slurm_client.HIL_NODE_CONCURRENCY)
+
+    for concurrency in (1, hil_slurm_client.HIL_NODE_CONCURRENCY):
+        _measure('reserve, concurrency %d' % concurrency, server,
+                 lambda: hil_slurm_client.hil_reserve_nodes(nodelist, project, client,
+                                                            concurrency=concurrency))
+        _measure('release, concurrency %d' % concurrency, server,
+                 lambda: hil_slurm_client.hil_free_nodes(nodelist, project, client,
+                                                         concurrency=concurrency))
+
+    n = args.reservations
+    groups = dict((i, nodelist[i::n]) for i in range(n))
+
+    def _async_reserve():
+        hil_slurm_async.wait_all(dict((i, hil_slurm_async.hil_reserve_nodes_async(g, project, client))
+                                      for i, g in groups.iteritems()))
+
+    _measure('reserve, %d async' % n, server, _async_reserve)
+
+    server.stop()
+    hil_slurm_async.shutdown()
+
+
+if __name__ == '__main__':
+    main()
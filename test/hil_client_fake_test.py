@@ -0,0 +1,120 @@
+"""
+HIL client tests against a local fake HIL server
+
+Covers the parallel, journalled and asynchronous client paths; the basic
+reserve and release cases are in hil_client_test.py, whose fake_hil
+fixture these tests share.  The HIL client package must be installed.
+
+run the tests like this
+py.test hil_client_fake_test.py
+"""
+
+import inspect
+import sys
+import pytest
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+pytest.importorskip('hil')
+
+import hil_slurm_async
+import hil_slurm_client
+import hil_slurm_journal
+from hil_client_test import fake_hil
+
+
+project = from_project = 'slurm'
+nodelist = ['slurm-compute%d' % (i + 1) for i in range(8)]
+
+
+class TestFakeHILReserveRelease:
+    """Tests hil_reserve_nodes and hil_free_nodes against the fake server"""
+
+    def test_serial_matches_parallel(self, fake_hil):
+        hil_slurm_client.hil_reserve_nodes(nodelist, project, fake_hil.client, concurrency=1)
+        hil_slurm_client.hil_free_nodes(nodelist, project, fake_hil.client, concurrency=1)
+        for node in nodelist:
+            assert fake_hil.state.nodes[node]['project'] == project
+
+    def test_node_info_requests(self, fake_hil):
+        # The pre-check's node information serves the network removal, so
+        # the only other show is the first poll for the removed networks
+        fake_hil.state.revert_delay = 0
+        hil_slurm_client.hil_reserve_nodes(nodelist, project, fake_hil.client)
+        assert fake_hil.state.n_calls['node_show'] == 2 * len(nodelist)
+        assert fake_hil.state.n_calls['node_power_off'] == len(nodelist)
+
+    def test_wait_for_no_networks(self, fake_hil):
+        outcomes = hil_slurm_client._wait_for_no_networks(fake_hil.client, nodelist, timeout=2)
+        assert all(isinstance(outcomes[node], hil_slurm_client.HILClientFailure)
+                   for node in nodelist)
+
+    def test_node_states(self, fake_hil):
+        node_info, failures = hil_slurm_client.hil_node_states(nodelist + ['no-such-node'],
+                                                               fake_hil.client)
+        assert sorted(node_info) == sorted(nodelist)
+        assert all(info['project'] == project for info in node_info.itervalues())
+        assert list(failures) == ['no-such-node']
+
+    def test_journal_resume(self, fake_hil, tmpdir):
+        journal = hil_slurm_journal.ReservationJournal(str(tmpdir.join('journal.db')))
+        transition = journal.transition('flexalloc_MOC_reserve_centos_1000_1498512332')
+
+        # Nodes recorded as detached by an earlier attempt are not touched
+        transition.record(nodelist[:4], hil_slurm_journal.NODE_DETACHED)
+        hil_slurm_client.hil_reserve_nodes(nodelist, project, fake_hil.client,
+                                           journal=transition)
+        for node in nodelist[:4]:
+            assert fake_hil.state.nodes[node]['project'] == project
+        for node in nodelist[4:]:
+            assert fake_hil.state.nodes[node]['project'] is None
+        assert transition.done(hil_slurm_journal.NODE_DETACHED) == set(nodelist)
+
+        n_requests = fake_hil.state.n_requests
+        hil_slurm_client.hil_reserve_nodes(nodelist, project, fake_hil.client,
+                                           journal=transition)
+        assert fake_hil.state.n_requests == n_requests
+
+
+class TestFakeHILAsync:
+    """Tests the asynchronous client interface"""
+
+    def test_async_reserve_release(self, fake_hil):
+        show_results = dict((node, hil_slurm_async.show_node_async(fake_hil.client, node))
+                            for node in nodelist)
+        results, failures = hil_slurm_async.wait_all(show_results, timeout=10)
+        assert not failures
+        assert all(results[node]['project'] == project for node in nodelist)
+
+        halves = {'a': nodelist[:4], 'b': nodelist[4:]}
+        reserve_results = dict((k, hil_slurm_async.hil_reserve_nodes_async(v, project,
+                                                                           fake_hil.client))
+                               for k, v in halves.iteritems())
+        results, failures = hil_slurm_async.wait_all(reserve_results, timeout=30)
+        assert not failures
+        assert all(fake_hil.state.nodes[node]['project'] is None for node in nodelist)
+
+        result = hil_slurm_async.hil_free_nodes_async(nodelist, project, fake_hil.client)
+        result.get(30)
+        assert all(fake_hil.state.nodes[node]['project'] == project for node in nodelist)
+
+    def test_async_shared_workers(self, fake_hil, monkeypatch):
+        # Node phases of asynchronous reserves and releases run on the
+        # shared worker pool, not on pools of their own
+        hil_slurm_async._get_async_pool()
+        hil_slurm_async._get_coordinator_pool()
+        n_pools = []
+        thread_pool = hil_slurm_client.ThreadPool
+        monkeypatch.setattr(hil_slurm_client, 'ThreadPool',
+                            lambda *args: n_pools.append(args) or thread_pool(*args))
+
+        halves = {'a': nodelist[:4], 'b': nodelist[4:]}
+        results, failures = hil_slurm_async.wait_all(
+            dict((k, hil_slurm_async.hil_reserve_nodes_async(v, project, fake_hil.client))
+                 for k, v in halves.iteritems()), timeout=30)
+        assert not failures
+        hil_slurm_async.hil_free_nodes_async(nodelist, project, fake_hil.client).get(30)
+        assert all(fake_hil.state.nodes[node]['project'] == project for node in nodelist)
+        assert n_pools == []
@@ -0,0 +1,107 @@
+"""
+Tests for the process-wide HIL client pool
+
+The pool's connections are replaced by plain objects, so no HIL server
+is needed.  The HIL client package must be installed.
+
+run the tests like this
+py.test hil_client_pool_test.py
+"""
+
+import inspect
+import sys
+import threading
+import pytest
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+pytest.importorskip('hil')
+
+import hil_slurm_client
+
+
+class _Pool(hil_slurm_client.HILClientPool):
+    """A client pool whose clients are plain objects, healthy on request"""
+
+    def __init__(self, size):
+        self.healthy = True
+        self.n_connects = 0
+        self.n_checks = 0
+        super(_Pool, self).__init__('http://hil.example', 'admin', 'admin', size)
+
+    def _connect(self):
+        self.n_connects += 1
+        return object()
+
+    def _healthy(self, hil_client):
+        self.n_checks += 1
+        return self.healthy
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = _Pool(2)
+    monkeypatch.setattr(hil_slurm_client, '_hil_client_pool', pool)
+    return pool
+
+
+class TestHILClientPool:
+    """Tests sharing, health checking and reconnecting pooled clients"""
+
+    def test_shared(self, pool):
+        clients = [pool.client() for i in range(4)]
+        assert clients[0] is clients[2] and clients[1] is clients[3]
+        assert clients[0] is not clients[1]
+        assert pool.owns(clients[0])
+
+        # Node operations share pooled clients rather than waiting for one
+        # to be free, so more operations than clients run at the same time
+        started = []
+        release = threading.Event()
+
+        def _operation(c, node):
+            started.append(node)
+            release.wait(5)
+            return c
+
+        phase_fn = hil_slurm_client._client_phase(clients[0], _operation)
+        threads = [threading.Thread(target=phase_fn, args=('node%d' % i,)) for i in range(6)]
+        for t in threads:
+            t.start()
+        while len(started) < 6 and any(t.is_alive() for t in threads):
+            threading.Event().wait(0.01)
+        assert len(started) == 6
+        release.set()
+        for t in threads:
+            t.join()
+
+        # A client from outside the pool is used as is
+        other = object()
+        assert hil_slurm_client._node_client(other) is other
+
+    def test_health_check(self, pool, monkeypatch):
+        assert pool.n_connects == 2
+        assert pool.check()
+        assert pool.n_connects == 2
+
+        # Not yet due
+        pool.client()
+        assert pool.n_checks == 2
+
+        monkeypatch.setattr(hil_slurm_client, 'HIL_CLIENT_HEALTH_CHECK_INTERVAL', -1)
+        pool.client()
+        assert pool.n_checks == 3
+        assert pool.n_connects == 2
+
+    def test_reconnect(self, pool):
+        clients = [pool.client() for i in range(2)]
+        pool.healthy = False
+        assert not pool.check()
+        assert pool.n_connects == 4
+        assert not any(pool.owns(c) for c in clients)
+
+        pool.healthy = True
+        assert pool.check()
+        assert pool.n_connects == 4
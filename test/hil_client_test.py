@@ -1,10 +1,10 @@
 """
 General info about these tests
 
-The tests assusme that the nodes are in the <from_project> which is set to be the
-"slurm" project, since that is what we are testing here.
-
-If all tests pass successfully, then nodes are back in their original state.
+The tests run against a local fake HIL server (fake_hil_server.py), whose
+nodes start out in the <from_project>, which is set to be the "slurm"
+project, since that is what we are testing here.  The HIL client package
+must be installed.
 
 Class TestHILReserve moves nodes out of the slurm project and into the free pool;
 and TestHILRelease puts nodes back into the slurm project from the free pool
@@ -24,23 +24,38 @@ import uuid
 libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
 sys.path.append(libdir)
 
+pytest.importorskip('hil')
+
 import hil_slurm_client
+from fake_hil_server import FakeHILServer
 
 
 # Some constants useful for tests
 nodelist = ['slurm-compute1', 'slurm-compute2', 'slurm-compute3']
-hil_client = hil_slurm_client.hil_init()
 to_project = 'slurm'
 from_project = 'slurm'
 
-bad_hil_client = hil_slurm_client.hil_client_connect('http://127.3.2.1',
-                                                     'baduser', 'badpassword')
+
+@pytest.fixture
+def fake_hil(request):
+    # Serves the nodes of the requesting test module, in its <from_project>
+    server = FakeHILServer(request.module.nodelist, project=request.module.from_project,
+                           revert_delay=0.1).start()
+    server.client = hil_slurm_client._hil_client_connect(server.url, 'admin', 'admin')
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def bad_hil_client():
+    return hil_slurm_client._hil_client_connect('http://127.3.2.1', 'baduser', 'badpassword')
 
 
 class TestHILReserve:
     """Tests various hil_reserve cases"""
 
-    def test_hil_reserve_success(self):
+    def test_hil_reserve_success(self, fake_hil, bad_hil_client):
+        hil_client = fake_hil.client
         """test the regular success scenario"""
 
         # should raise an error if <from_project> doesn't add up.
@@ -54,17 +69,24 @@ class TestHILReserve:
         # should raise error if a bad hil_client is passed
         with pytest.raises(requests.ConnectionError):
             hil_slurm_client.hil_reserve_nodes(nodelist, from_project, bad_hil_client)
+        for node in nodelist:
+            assert fake_hil.state.nodes[node]['project'] is None
 
 
 class TestHILRelease:
     """Test various hil_release cases"""
-    def test_hil_release(self):
+    def test_hil_release(self, fake_hil, bad_hil_client):
+        hil_client = fake_hil.client
+        hil_slurm_client.hil_reserve_nodes(nodelist, from_project, hil_client)
+
         # should raise error if a bad hil_client is passed
         with pytest.raises(requests.ConnectionError):
             hil_slurm_client.hil_free_nodes(nodelist, to_project, bad_hil_client)
 
         # calling it with a functioning hil_client should work
         hil_slurm_client.hil_free_nodes(nodelist, to_project, hil_client)
+        for node in nodelist:
+            assert fake_hil.state.nodes[node]['project'] == to_project
 
         # At this point, nodes are already owned by the <to_project>
         # calling it again should have no affect.
@@ -0,0 +1,163 @@
+"""
+Tests for the HIL / Slurm consistency audit diff engine and snapshot
+
+run the tests like this
+py.test hil_slurm_audit_test.py
+"""
+
+import inspect
+import json
+import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_records import SlurmReservation, SlurmPartition
+from hil_slurm_audit import (node_state, hil_partition_nodes, audit_nodes, audit_diff, audit_report,
+                             write_audit_report, reservation_memberships, AuditSnapshot,
+                             AUDIT_FREE_WITHOUT_RELEASE,
+                             AUDIT_FREE_WITH_NETWORKS, AUDIT_SLURM_UNDER_RELEASE,
+                             AUDIT_FOREIGN_PROJECT, AUDIT_ORPHAN_RESERVE,
+                             AUDIT_EXPIRED_RELEASE, AUDIT_NODE_UNAVAILABLE)
+
+T_NOW = 1500000000
+GRACE = 300
+
+
+def _res(restype, user, time_s, nodes, t_start, t_end):
+    return SlurmReservation('flexalloc_MOC_%s_%s_1000_%s' % (restype, user, time_s),
+                            nodes=nodes, t_start=t_start, t_end=t_end)
+
+
+def _state(project, networks=()):
+    return {'project': project, 'networks': list(networks)}
+
+
+RESERVATIONS = [
+    # alice's nodes are reserved in HIL
+    _res('reserve', 'alice', 1, 'server[1-2]', T_NOW - 3600, T_NOW + 3600),
+    _res('release', 'alice', 1, 'server[1-2]', T_NOW - 3500, T_NOW + 3600),
+    # bob's reserve has not been processed by the monitor
+    _res('reserve', 'bob', 2, 'server3', T_NOW - 1000, T_NOW + 3600),
+    # carol's release has not been processed, long past its end time
+    _res('release', 'carol', 3, 'server4', T_NOW - 9000, T_NOW - 1000),
+]
+
+
+class TestAudit:
+    """Tests comparing HIL reservations with HIL node states"""
+
+    def test_node_state(self):
+        info = {'name': 'server1', 'project': 'slurm', 'metadata': {},
+                'nics': [{'label': 'eth0', 'macaddr': '00:00:00:00:00:01',
+                          'networks': {'vlan/native': 'slurm-net'}},
+                         {'label': 'eth1', 'macaddr': '00:00:00:00:00:02', 'networks': {}}]}
+        assert node_state(info) == _state('slurm', ['eth0:vlan/native=slurm-net'])
+
+    def test_audit_nodes(self):
+        assert audit_nodes(RESERVATIONS, ['server9', 'server1']) == \
+            ['server1', 'server2', 'server3', 'server4', 'server9']
+
+    def test_partition_nodes(self):
+        partitions = [SlurmPartition('HIL_partition1', nodes='server[1-6]'),
+                      SlurmPartition('batch', nodes='server[1-16]'),
+                      SlurmPartition('HIL_partition2', nodes=None)]
+        nodes = audit_nodes(RESERVATIONS, hil_partition_nodes(partitions))
+        assert nodes == ['server1', 'server2', 'server3', 'server4', 'server5', 'server6']
+
+        # Nodes left in the free pool or a user project after their
+        # reservations were deleted are found
+        node_states = dict((node, _state('slurm')) for node in nodes)
+        node_states['server5'] = _state(None)
+        node_states['server6'] = _state('mallory-project')
+        findings = audit_diff([], node_states, 'slurm', T_NOW, GRACE)
+        assert [(f['check'], f['node']) for f in findings] == \
+            [(AUDIT_FOREIGN_PROJECT, 'server6'), (AUDIT_FREE_WITHOUT_RELEASE, 'server5')]
+
+    def test_paired_reservation(self):
+        node_states = {'server1': _state(None), 'server2': _state('alice-project', ['x']),
+                       'server3': _state('slurm', ['eth0:vlan/native=slurm-net']),
+                       'server4': _state(None)}
+        findings = audit_diff(RESERVATIONS[:2], node_states, 'slurm', T_NOW, GRACE)
+        assert [f for f in findings if f['check'] != AUDIT_FREE_WITHOUT_RELEASE] == []
+        assert [f['node'] for f in findings] == ['server4']
+
+    def test_findings(self):
+        node_states = {'server1': _state('slurm'),
+                       'server2': _state(None, ['eth0:vlan/native=slurm-net']),
+                       'server3': _state(None),
+                       'server4': None,
+                       'server5': _state('mallory-project'),
+                       'server6': _state('slurm')}
+        findings = audit_diff(RESERVATIONS, node_states, 'slurm', T_NOW, GRACE)
+        assert [(f['check'], f['node'], f['reservation']) for f in findings] == [
+            (AUDIT_EXPIRED_RELEASE, None, 'flexalloc_MOC_release_carol_1000_3'),
+            (AUDIT_FOREIGN_PROJECT, 'server5', None),
+            (AUDIT_FREE_WITH_NETWORKS, 'server2', 'flexalloc_MOC_release_alice_1000_1'),
+            (AUDIT_FREE_WITHOUT_RELEASE, 'server3', None),
+            (AUDIT_NODE_UNAVAILABLE, 'server4', 'flexalloc_MOC_release_carol_1000_3'),
+            (AUDIT_ORPHAN_RESERVE, None, 'flexalloc_MOC_reserve_bob_1000_2'),
+            (AUDIT_SLURM_UNDER_RELEASE, 'server1', 'flexalloc_MOC_release_alice_1000_1')]
+
+        # Within the grace period, bob's reserve is not yet orphaned
+        findings = audit_diff(RESERVATIONS, node_states, 'slurm', T_NOW, 2000)
+        assert AUDIT_ORPHAN_RESERVE not in [f['check'] for f in findings]
+
+    def test_report(self, tmpdir):
+        node_states = {'server1': _state('slurm'), 'server2': _state(None)}
+        findings = audit_diff(RESERVATIONS[:2], node_states, 'slurm', T_NOW, GRACE)
+        report = audit_report(RESERVATIONS[:2], node_states, findings, T_NOW, 0.5)
+
+        path = str(tmpdir.join('audit_report.json'))
+        assert write_audit_report(path, report)
+        with open(path) as f:
+            written = json.load(f)
+        assert written['nodes'] == 2
+        assert written['counts'][AUDIT_SLURM_UNDER_RELEASE] == 1
+        assert written['counts'][AUDIT_ORPHAN_RESERVE] == 0
+        assert written['findings'] == findings
+        assert not write_audit_report(str(tmpdir.join('missing', 'report.json')), report)
+
+
+class TestAuditSnapshot:
+    """Tests choosing the nodes an incremental audit queries"""
+
+    def test_incremental(self, tmpdir):
+        path = str(tmpdir.join('audit_snapshot.json'))
+        nodes = audit_nodes(RESERVATIONS, ['server5'])
+        memberships = reservation_memberships(RESERVATIONS, nodes)
+        assert memberships['server1'] == memberships['server2']
+        assert memberships['server1'] != memberships['server5']
+
+        snapshot = AuditSnapshot.load(path)
+        assert snapshot.full_sweep_due(T_NOW, 86400)
+        assert snapshot.stale_nodes(memberships, T_NOW, 3600) == nodes
+
+        for node in nodes:
+            assert snapshot.update(node, None if node == 'server4' else _state('slurm'),
+                                   memberships[node], T_NOW)
+        snapshot.t_full = T_NOW
+        assert snapshot.save(path)
+
+        # Only the node whose last query failed is stale
+        snapshot = AuditSnapshot.load(path)
+        assert not snapshot.full_sweep_due(T_NOW + 60, 86400)
+        assert snapshot.stale_nodes(memberships, T_NOW + 60, 3600) == ['server4']
+        assert not snapshot.update('server1', _state('slurm'), memberships['server1'], T_NOW)
+        assert snapshot.node_states()['server1'] == _state('slurm')
+
+        # A node whose reservations changed, and nodes past the staleness bound
+        memberships = reservation_memberships(RESERVATIONS[2:], nodes)
+        assert snapshot.stale_nodes(memberships, T_NOW + 60, 3600) == \
+            ['server1', 'server2', 'server4']
+        assert snapshot.stale_nodes(memberships, T_NOW + 7200, 3600) == nodes
+
+        assert snapshot.update('server2', _state(None), memberships['server2'], T_NOW + 60)
+        snapshot.retain(['server1', 'server2'])
+        assert sorted(snapshot.node_states()) == ['server1', 'server2']
+
+    def test_corrupt(self, tmpdir):
+        path = tmpdir.join('audit_snapshot.json')
+        path.write('{not json')
+        assert AuditSnapshot.load(str(path)).nodes == {}
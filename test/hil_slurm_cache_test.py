@@ -0,0 +1,95 @@
+"""
+Tests for the 'scontrol show' query cache
+
+These tests need no Slurm installation; the cache store is created in a
+pytest temporary directory.
+
+run the tests like this
+py.test hil_slurm_cache_test.py
+"""
+
+import inspect
+import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import hil_slurm_cache
+
+
+RES_STDOUT = 'ReservationName=flexalloc_MOC_reserve_centos_1000_1498512332 Nodes=server1\n'
+
+
+def _cache(tmpdir, ttl=60, max_entries=4):
+    return hil_slurm_cache.ScontrolShowCache(str(tmpdir.join('cache.json')), ttl, max_entries)
+
+
+class TestScontrolShowCache:
+    """Tests TTL, eviction and invalidation behavior"""
+
+    def test_get_put(self, tmpdir):
+        cache = _cache(tmpdir)
+        assert cache.get('reservation', None) is None
+
+        cache.put('reservation', None, RES_STDOUT, '')
+        assert cache.get('reservation', None) == (RES_STDOUT, '')
+
+        # A second instance (e.g. another process) sees the same entries
+        assert _cache(tmpdir).get('reservation', None) == (RES_STDOUT, '')
+
+    def test_ttl_expiry(self, tmpdir):
+        cache = _cache(tmpdir, ttl=-1)
+        cache.put('partition', 'debug', 'PartitionName=debug\n', '')
+        assert cache.get('partition', 'debug') is None
+
+    def test_eviction(self, tmpdir):
+        cache = _cache(tmpdir, max_entries=2)
+        cache.put('job', '1', 'JobId=1\n', '')
+        cache.put('job', '2', 'JobId=2\n', '')
+        cache.put('job', '1', 'JobId=1\n', '')
+        cache.put('job', '3', 'JobId=3\n', '')
+
+        # Storing an entry again makes it the newest
+        assert cache.get('job', '1') is not None
+        assert cache.get('job', '2') is None
+        assert cache.get('job', '3') is not None
+
+    def test_get_does_not_write(self, tmpdir):
+        cache = _cache(tmpdir)
+        cache.put('reservation', None, RES_STDOUT, '')
+        store = tmpdir.join('cache.json')
+        mtime, content = store.mtime(), store.read()
+
+        assert cache.get('reservation', None) == (RES_STDOUT, '')
+        assert cache.get('reservation', 'missing') is None
+        assert (store.mtime(), store.read()) == (mtime, content)
+
+    def test_invalidate(self, tmpdir):
+        cache = _cache(tmpdir)
+        cache.put('reservation', None, RES_STDOUT, '')
+        cache.put('reservation', 'res1', RES_STDOUT, '')
+        cache.put('reservation', 'res2', RES_STDOUT, '')
+        cache.put('partition', 'debug', 'PartitionName=debug\n', '')
+
+        cache.invalidate('reservation', 'res1')
+        assert cache.get('reservation', None) is None
+        assert cache.get('reservation', 'res1') is None
+        assert cache.get('reservation', 'res2') is not None
+
+        cache.invalidate('reservation')
+        assert cache.get('reservation', 'res2') is None
+        assert cache.get('partition', 'debug') is not None
+
+    def test_corrupt_store(self, tmpdir):
+        cache = _cache(tmpdir)
+        tmpdir.join('cache.json').write('{not json')
+        assert cache.get('reservation', None) is None
+
+        cache.put('reservation', None, RES_STDOUT, '')
+        assert cache.get('reservation', None) == (RES_STDOUT, '')
+
+    def test_missing_directory(self, tmpdir):
+        cache = hil_slurm_cache.ScontrolShowCache(str(tmpdir.join('nodir', 'cache.json')), 60, 4)
+        cache.put('reservation', None, RES_STDOUT, '')
+        assert cache.get('reservation', None) is None
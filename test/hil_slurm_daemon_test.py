@@ -0,0 +1,70 @@
+"""
+Tests for the monitor daemon lock and wakeup socket
+
+These tests need no Slurm installation; the lock file and socket are
+created in a pytest temporary directory.
+
+run the tests like this
+py.test hil_slurm_daemon_test.py
+"""
+
+import inspect
+import os
+import pytest
+import subprocess
+import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import hil_slurm_daemon
+
+
+class TestSingleInstanceLock:
+    """Tests the monitor single-instance lock"""
+
+    def test_lock_held(self, tmpdir):
+        path = str(tmpdir.join('monitor.lock'))
+        with hil_slurm_daemon.SingleInstanceLock(path):
+            assert open(path).read().strip() == str(os.getpid())
+
+            # flock(2) locks conflict between open file descriptions, so a
+            # second lock in another process is refused
+            code = ('import sys; sys.path.append(%r); import hil_slurm_daemon\n'
+                    'try:\n'
+                    '    hil_slurm_daemon.SingleInstanceLock(%r).acquire()\n'
+                    'except hil_slurm_daemon.MonitorLockHeld:\n'
+                    '    sys.exit(3)\n' % (libdir, path))
+            assert subprocess.call([sys.executable, '-c', code]) == 3
+
+        # Released on exit
+        hil_slurm_daemon.SingleInstanceLock(path).acquire().release()
+
+
+class TestWakeupSocket:
+    """Tests monitor wakeups"""
+
+    def test_wakeup(self, tmpdir):
+        path = str(tmpdir.join('monitor.sock'))
+
+        # No daemon listening
+        assert not hil_slurm_daemon.notify_monitor(path)
+
+        with hil_slurm_daemon.WakeupSocket(path) as wakeup:
+            assert wakeup.wait(0) == 0
+            assert hil_slurm_daemon.notify_monitor(path)
+            assert hil_slurm_daemon.notify_monitor(path)
+
+            # Queued wakeups are coalesced into one
+            assert wakeup.wait(1) == 2
+            assert wakeup.wait(0) == 0
+
+        assert not os.path.exists(path)
+
+    def test_stale_socket(self, tmpdir):
+        path = str(tmpdir.join('monitor.sock'))
+        hil_slurm_daemon.WakeupSocket(path).open()
+        with hil_slurm_daemon.WakeupSocket(path) as wakeup:
+            assert hil_slurm_daemon.notify_monitor(path)
+            assert wakeup.wait(1) == 1
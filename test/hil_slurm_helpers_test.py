@@ -0,0 +1,47 @@
+"""
+Tests for the Slurm helpers which do not need a running Slurm controller
+
+run the tests like this
+py.test hil_slurm_helpers_test.py
+"""
+
+import inspect
+import os
+import pwd
+import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import hil_slurm_helpers
+
+
+class TestIsHILReservation:
+    """Tests HIL reservation name validation"""
+
+    def setup_method(self, method):
+        pwdbe = pwd.getpwuid(os.getuid())
+        self.user = pwdbe.pw_name
+        self.uid = str(pwdbe.pw_uid)
+
+    def test_valid_names(self):
+        resname = 'flexalloc_MOC_reserve_%s_%s_1498512332' % (self.user, self.uid)
+        assert hil_slurm_helpers.is_hil_reservation(resname, None)
+        assert hil_slurm_helpers.is_hil_reservation(resname, 'reserve')
+        assert not hil_slurm_helpers.is_hil_reservation(resname, 'release')
+
+    def test_invalid_names(self):
+        for resname in ['maint_window',
+                        'flexalloc_MOC_reserve_%s_99999_1498512332' % self.user,
+                        'flexalloc_MOC_reserve_%s_notanumber_1498512332' % self.user,
+                        'flexalloc_MOC_reserve_%s' % self.user]:
+            assert not hil_slurm_helpers.is_hil_reservation(resname, None)
+
+    def test_passwd_cache_bounded(self, monkeypatch):
+        monkeypatch.setattr(hil_slurm_helpers, 'PASSWD_CACHE_MAX_ENTRIES', 2)
+        hil_slurm_helpers._passwd_cache.clear()
+        for uid in range(5):
+            hil_slurm_helpers._passwd_user_uid_match(self.user, str(uid))
+        assert len(hil_slurm_helpers._passwd_cache) == 2
+        assert (self.user, '4') in hil_slurm_helpers._passwd_cache
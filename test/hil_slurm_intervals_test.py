@@ -0,0 +1,86 @@
+"""
+Tests for the reservation interval index
+
+run the tests like this
+py.test hil_slurm_intervals_test.py
+"""
+
+import inspect
+import random
+import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_records import SlurmReservation
+from hil_slurm_intervals import ReservationIntervalIndex
+
+
+def _res(name, nodes, t_start, t_end):
+    return SlurmReservation(name, nodes=nodes, t_start=t_start, t_end=t_end)
+
+
+def _names(reservations):
+    return sorted(res.name for res in reservations)
+
+
+class TestReservationIntervalIndex:
+    """Tests time and node overlap queries"""
+
+    reservations = [_res('a', 'server[1-4]', 100, 200),
+                    _res('b', 'server[3-6]', 150, 300),
+                    _res('c', 'server[7-8]', 180, 250),
+                    _res('d', 'server1', 300, 400),
+                    _res('e', 'server[1-8]', None, None)]
+
+    def test_overlapping(self):
+        index = ReservationIntervalIndex(self.reservations)
+        assert len(index) == 5
+        assert _names(index.overlapping(0, 100)) == ['e']
+        assert _names(index.overlapping(190, 210)) == ['a', 'b', 'c', 'e']
+        assert _names(index.overlapping(200, 300)) == ['b', 'c', 'e']
+        assert _names(index.active(300)) == ['d', 'e']
+
+    def test_covering(self):
+        index = ReservationIntervalIndex(self.reservations)
+        assert _names(index.covering('server3', 160)) == ['a', 'b', 'e']
+        assert _names(index.covering('server7', 160)) == ['e']
+        assert _names(index.covering('server9', 160)) == []
+
+    def test_conflicts(self):
+        index = ReservationIntervalIndex(self.reservations)
+        assert _names(index.conflicts('server[5-7]', 190, 260, ignore=('e',))) == ['b', 'c']
+        assert _names(index.conflicts(['server1'], 250, 350, ignore=('e',))) == ['d']
+        assert _names(index.conflicts('server9', 0, 1000)) == []
+
+    def test_sweep(self):
+        index = ReservationIntervalIndex(self.reservations[:4])
+        conflicts, ended = index.sweep(260)
+        assert sorted((a.name, b.name) for a, b in conflicts) == [('a', 'b')]
+        assert _names(ended) == ['a', 'c']
+
+    def test_random(self):
+        rng = random.Random(1)
+        reservations = []
+        for i in range(300):
+            t_start = rng.randint(0, 10000)
+            lo = rng.randint(1, 50)
+            reservations.append(_res('r%d' % i, 'n[%d-%d]' % (lo, lo + rng.randint(0, 5)),
+                                     t_start, t_start + rng.randint(1, 500)))
+        index = ReservationIntervalIndex(reservations)
+
+        for _ in range(100):
+            t0 = rng.randint(0, 10000)
+            t1 = t0 + rng.randint(1, 1000)
+            expected = [res.name for res in reservations
+                        if res.t_start < t1 and res.t_end > t0]
+            assert _names(index.overlapping(t0, t1)) == sorted(expected)
+
+        conflicts, ended = index.sweep(0)
+        expected = set(frozenset((a.name, b.name)) for a in reservations for b in reservations
+                       if (a is not b) and a.t_start < b.t_end and b.t_start < a.t_end and
+                       not a.nodeset.isdisjoint(b.nodeset))
+        assert set(frozenset((a.name, b.name)) for a, b in conflicts) == expected
+        assert len(conflicts) == len(expected)
+        assert all(a.t_start <= b.t_start for a, b in conflicts)
@@ -0,0 +1,67 @@
+"""
+Tests for the HIL reservation transition journal
+
+These tests need no Slurm or HIL installation; the journal database is
+created in a pytest temporary directory.
+
+run the tests like this
+py.test hil_slurm_journal_test.py
+"""
+
+import inspect
+import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import hil_slurm_journal
+from hil_slurm_journal import (NODE_POWERED_OFF, NODE_DETACHED, SLURM_CREATE_RELEASE,
+                               SLURM_OP_DONE, SLURM_OP_FAILED)
+
+
+RESNAME = 'flexalloc_MOC_reserve_centos_1000_1498512332'
+RESNAME2 = 'flexalloc_MOC_release_centos_1000_1498512332'
+
+
+def _journal(tmpdir):
+    return hil_slurm_journal.ReservationJournal(str(tmpdir.join('journal.db')))
+
+
+class TestReservationJournal:
+    """Tests recording and resuming reservation transitions"""
+
+    def test_node_phases(self, tmpdir):
+        transition = _journal(tmpdir).transition(RESNAME)
+        assert transition.done(NODE_POWERED_OFF) == set()
+
+        transition.record(['server1', 'server2'], NODE_POWERED_OFF)
+        transition.record(['server1'], NODE_DETACHED)
+        transition.record([], NODE_DETACHED)
+
+        # A later process (e.g. the next monitor run) sees the same entries
+        transition = _journal(tmpdir).transition(RESNAME)
+        assert transition.done(NODE_POWERED_OFF) == set(['server1', 'server2'])
+        assert transition.done(NODE_DETACHED) == set(['server1'])
+
+    def test_slurm_ops(self, tmpdir):
+        transition = _journal(tmpdir).transition(RESNAME)
+        assert transition.slurm_op_outcome(SLURM_CREATE_RELEASE) is None
+
+        transition.record_slurm_op(SLURM_CREATE_RELEASE, 'error: Duplicate reservation name')
+        assert transition.slurm_op_outcome(SLURM_CREATE_RELEASE) == SLURM_OP_FAILED
+
+        transition.record_slurm_op(SLURM_CREATE_RELEASE, '')
+        assert transition.slurm_op_outcome(SLURM_CREATE_RELEASE) == SLURM_OP_DONE
+
+    def test_forget_and_prune(self, tmpdir):
+        journal = _journal(tmpdir)
+        journal.transition(RESNAME).record(['server1'], NODE_POWERED_OFF)
+        journal.transition(RESNAME2).record_slurm_op(SLURM_CREATE_RELEASE, '')
+        assert journal.reservations() == set([RESNAME, RESNAME2])
+
+        assert journal.prune([RESNAME]) == set([RESNAME2])
+        assert journal.reservations() == set([RESNAME])
+
+        journal.transition(RESNAME).forget()
+        assert journal.reservations() == set()
@@ -0,0 +1,150 @@
+"""
+Tests for the 'scontrol --json show' output decoder
+
+run the tests like this
+py.test hil_slurm_json_test.py
+"""
+
+import inspect
+import json
+import sys
+import time
+from os.path import realpath, dirname, join
+from time import mktime, strptime
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_constants import SHOW_OBJ_TIME_FMT
+from hil_slurm_json import scontrol_show_json_to_dict_list
+from hil_slurm_records import SlurmJob, SlurmPartition, SlurmReservation
+
+
+T_START_S = '2017-06-26T21:25:32'
+T_END_S = '2017-06-27T21:25:32'
+T_START = int(mktime(strptime(T_START_S, SHOW_OBJ_TIME_FMT)))
+T_END = int(mktime(strptime(T_END_S, SHOW_OBJ_TIME_FMT)))
+
+RESNAME = 'flexalloc_MOC_reserve_centos_1000_1498512332'
+
+
+class TestReservationJSON:
+    """Tests reservation decoding, old and new numeric field forms"""
+
+    def test_flat_schema(self):
+        doc = {'reservations': [{'name': RESNAME, 'node_list': 'server[1-2]',
+                                 'start_time': T_START, 'end_time': T_END,
+                                 'users': 'centos', 'flags': ['MAINT', 'IGNORE_JOBS'],
+                                 'features': 'HIL', 'node_count': 2}],
+               'errors': []}
+        dict_list, error_s = scontrol_show_json_to_dict_list('reservation', None, json.dumps(doc))
+        assert error_s == ''
+        assert dict_list[0]['ReservationName'] == RESNAME
+        assert dict_list[0]['Nodes'] == 'server[1-2]'
+        assert dict_list[0]['StartTime'] == T_START
+        assert dict_list[0]['EndTime'] == T_END
+        assert dict_list[0]['Flags'] == 'MAINT,IGNORE_JOBS'
+        assert dict_list[0]['Users'] == 'centos'
+
+    def test_number_objects(self):
+        doc = {'reservations': [{'name': RESNAME, 'node_list': 'server1',
+                                 'start_time': {'set': True, 'infinite': False,
+                                                'number': T_START},
+                                 'end_time': {'set': True, 'infinite': True, 'number': 0},
+                                 'users': 'centos', 'flags': []}]}
+        dict_list, _ = scontrol_show_json_to_dict_list('reservation', None, json.dumps(doc))
+        assert dict_list[0]['StartTime'] == T_START
+        assert dict_list[0]['EndTime'] is None
+        assert dict_list[0]['Flags'] == '(null)'
+
+    def test_exact_times(self, monkeypatch):
+        # 01:30 EST on the US fall-back day, in the repeated hour: a local
+        # time string would be read back as 01:30 EDT, an hour early
+        monkeypatch.setenv('TZ', 'America/New_York')
+        time.tzset()
+        try:
+            t_start = 1509863400
+            doc = {'reservations': [{'name': RESNAME, 'node_list': 'server1',
+                                     'start_time': t_start, 'end_time': t_start + 3600,
+                                     'users': 'centos'}]}
+            dict_list, _ = scontrol_show_json_to_dict_list('reservation', None,
+                                                           json.dumps(doc))
+            res = SlurmReservation.from_scontrol(dict_list[0])
+            assert (res.t_start, res.t_end) == (t_start, t_start + 3600)
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+    def test_values_with_spaces(self):
+        doc = {'reservations': [{'name': RESNAME, 'node_list': 'server1',
+                                 'features': 'HIL&fast net', 'users': 'centos'}]}
+        dict_list, _ = scontrol_show_json_to_dict_list('reservation', None, json.dumps(doc))
+        assert dict_list[0]['Features'] == 'HIL&fast net'
+
+    def test_not_found(self):
+        doc = {'reservations': [], 'errors': []}
+        dict_list, error_s = scontrol_show_json_to_dict_list('reservation', RESNAME,
+                                                             json.dumps(doc))
+        assert dict_list == []
+        assert 'not found' in error_s
+
+    def test_errors_and_bad_output(self):
+        doc = {'reservations': [], 'errors': [{'error': 'Unable to contact slurm controller'}]}
+        _, error_s = scontrol_show_json_to_dict_list('reservation', None, json.dumps(doc))
+        assert 'Unable to contact' in error_s
+
+        _, error_s = scontrol_show_json_to_dict_list('reservation', None, 'garbage')
+        assert error_s.startswith('error:')
+
+
+class TestJobPartitionJSON:
+    """Tests job and partition decoding"""
+
+    def test_job(self):
+        doc = {'jobs': [{'job_id': 12, 'name': 'hil_reserve', 'user_name': 'centos',
+                         'user_id': 1000, 'partition': 'HIL_partition1',
+                         'job_state': ['RUNNING'], 'start_time': T_START, 'end_time': 0,
+                         'time_limit': {'set': False, 'infinite': True, 'number': 0},
+                         'resv_name': RESNAME}]}
+        dict_list, _ = scontrol_show_json_to_dict_list('job', '12', json.dumps(doc))
+        job = dict_list[0]
+        assert job['JobId'] == '12'
+        assert job['JobName'] == 'hil_reserve'
+        assert job['UserId'] == 'centos(1000)'
+        assert job['JobState'] == 'RUNNING'
+        assert job['EndTime'] is None
+        assert job['TimeLimit'] is None
+        assert job['Reservation'] == RESNAME
+
+        job = SlurmJob.from_scontrol(job)
+        assert (job.t_start, job.t_end, job.time_limit) == (T_START, None, None)
+
+    def test_job_not_found(self):
+        _, error_s = scontrol_show_json_to_dict_list('job', '99', json.dumps({'jobs': []}))
+        assert 'Invalid job id' in error_s
+
+    def test_partition(self):
+        doc = {'partitions': [{'name': 'HIL_partition1',
+                               'nodes': {'configured': 'server[1-3]'},
+                               'partition': {'state': ['UP']},
+                               'flags': ['default'],
+                               'maximums': {'time': {'set': True, 'infinite': False,
+                                                     'number': 36 * 60 + 30},
+                                            'oversubscribe': {'jobs': 1, 'flags': []}}}]}
+        dict_list, _ = scontrol_show_json_to_dict_list('partition', None, json.dumps(doc))
+        partition = dict_list[0]
+        assert partition['PartitionName'] == 'HIL_partition1'
+        assert partition['Nodes'] == 'server[1-3]'
+        assert partition['State'] == 'UP'
+        assert partition['Default'] == 'YES'
+        assert partition['Shared'] == 'NO'
+        assert partition['ExclusiveUser'] == 'NO'
+        assert partition['MaxTime'] == (36 * 60 + 30) * 60
+        assert SlurmPartition.from_scontrol(partition).max_time == (36 * 60 + 30) * 60
+
+    def test_partition_flat_schema(self):
+        doc = {'partitions': [{'name': 'debug', 'nodes': 'server1', 'state': 'UP',
+                               'flags': ['exclusive_user'], 'maximum_time': 0xffffffff}]}
+        dict_list, _ = scontrol_show_json_to_dict_list('partition', None, json.dumps(doc))
+        assert dict_list[0]['ExclusiveUser'] == 'YES'
+        assert dict_list[0]['MaxTime'] is None
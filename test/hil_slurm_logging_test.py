@@ -0,0 +1,99 @@
+"""
+Tests for queued, lazily formatted logging
+
+run the tests like this
+py.test hil_slurm_logging_test.py
+"""
+
+import inspect
+import json
+import logging
+import sys
+from os.path import realpath, dirname, join
+
+import pytest
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_logging import (log_init, log_shutdown, log_debug, log_info, log_error,
+                               info_debug_sep)
+
+
+class _Counted(object):
+    '''
+    A log argument counting how often it is formatted
+    '''
+    def __init__(self):
+        self.n = 0
+
+    def __str__(self):
+        self.n += 1
+        return 'counted'
+
+
+@pytest.fixture
+def logfile(tmpdir):
+    level = logging.root.level
+    path = tmpdir.join('ulsr.log')
+    yield path
+    log_shutdown()
+    logging.root.setLevel(level)
+
+
+class TestLogging:
+    """Tests log levels, formats and the queue listener"""
+
+    def test_queued(self, logfile):
+        log_init('test', str(logfile), logging.DEBUG, log_format='text', queued=True)
+        log_info('Header', separator=True)
+        log_debug('Command `%s` returned %d', 'scontrol show partition', 0)
+        log_info('Literal 100%')
+        log_shutdown()
+
+        lines = logfile.read().splitlines()
+        assert len(lines) == 4
+        assert lines[0].endswith(info_debug_sep)
+        assert lines[2].endswith('DEBUG   Command `scontrol show partition` returned 0')
+        assert lines[3].endswith('INFO    Literal 100%')
+
+    def test_lazy_formatting(self, logfile):
+        log_init('test', str(logfile), logging.INFO, log_format='text', queued=True)
+        arg = _Counted()
+        log_debug('Not logged: %s', arg)
+        assert arg.n == 0
+        log_info('Logged: %s', arg)
+        log_shutdown()
+        assert logfile.read().count('Logged: counted') == 1
+
+    def test_exception(self, logfile):
+        log_init('test', str(logfile), logging.INFO, log_format='text', queued=False)
+        log_error('No exception active')
+        try:
+            raise ValueError('bad value')
+        except ValueError:
+            log_error('Exception active')
+        log_shutdown()
+
+        text = logfile.read()
+        assert text.count(' Exception: ') == 1
+        assert ' Exception: bad value' in text
+        assert text.count(' Traceback: ') == 1
+        assert 'test_exception' in text
+
+    def test_json_lines(self, logfile):
+        log_init('test', str(logfile), logging.DEBUG, log_format='json', queued=True)
+        log_info('Created reservation `%s`', 'flexalloc_MOC_reserve_centos_1000_1498512332')
+        try:
+            raise ValueError('bad value')
+        except ValueError:
+            log_error('Failed', separator=False)
+        log_shutdown()
+
+        records = [json.loads(line) for line in logfile.read().splitlines()]
+        assert [r['level'] for r in records] == ['INFO', 'ERROR', 'ERROR', 'ERROR']
+        assert records[0]['message'] == \
+            'Created reservation `flexalloc_MOC_reserve_centos_1000_1498512332`'
+        assert records[2]['message'] == ' Exception: bad value'
+        assert 'test_json_lines' in records[3]['message']
+        assert all(isinstance(r['pid'], int) for r in records)
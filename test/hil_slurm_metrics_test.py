@@ -0,0 +1,91 @@
+"""
+Tests for the ULSR metrics registry, textfile output and HTTP endpoint
+
+run the tests like this
+py.test hil_slurm_metrics_test.py
+"""
+
+import inspect
+import sys
+import urllib2
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import pytest
+
+import hil_slurm_metrics
+from hil_slurm_metrics import MetricsRegistry, parse_samples
+
+
+def _registry():
+    registry = MetricsRegistry()
+    calls = registry.counter('test_calls_total', 'Calls', ('entity',))
+    latency = registry.histogram('test_call_seconds', 'Latency', ('entity',), buckets=(0.1, 1))
+    return registry, calls, latency
+
+
+class TestMetrics:
+    """Tests counters, histograms and the exposition format"""
+
+    def test_render(self):
+        registry, calls, latency = _registry()
+        assert registry.render() == ''
+
+        calls.inc(entity='job')
+        calls.inc(2, entity='job')
+        latency.observe(0.05, entity='job')
+        latency.observe(0.5, entity='job')
+        latency.observe(5, entity='job')
+
+        samples = parse_samples(registry.render())
+        assert samples['test_calls_total{entity="job"}'] == 3
+        assert samples['test_call_seconds_bucket{entity="job",le="0.1"}'] == 1
+        assert samples['test_call_seconds_bucket{entity="job",le="1"}'] == 2
+        assert samples['test_call_seconds_bucket{entity="job",le="+Inf"}'] == 3
+        assert samples['test_call_seconds_count{entity="job"}'] == 3
+        assert samples['test_call_seconds_sum{entity="job"}'] == 5.55
+
+        text = registry.render()
+        assert '# TYPE test_calls_total counter' in text
+        assert '# TYPE test_call_seconds histogram' in text
+
+        with pytest.raises(ValueError):
+            calls.inc(user='alice')
+
+    def test_time(self):
+        registry, calls, latency = _registry()
+        with pytest.raises(KeyError):
+            with latency.time(entity='job'):
+                raise KeyError()
+        assert latency.count(entity='job') == 1
+
+    def test_textfile_accumulates(self, tmpdir):
+        path = str(tmpdir.join('ulsr_prolog.prom'))
+
+        # Two short-lived processes
+        for entity in ('job', 'partition'):
+            registry, calls, latency = _registry()
+            calls.inc(entity='job')
+            latency.observe(0.5, entity=entity)
+            hil_slurm_metrics.write_textfile(path, registry)
+
+        samples = parse_samples(open(path).read())
+        assert samples['test_calls_total{entity="job"}'] == 2
+        assert samples['test_call_seconds_count{entity="job"}'] == 1
+        assert samples['test_call_seconds_count{entity="partition"}'] == 1
+        assert open(path).read().count('# TYPE test_calls_total') == 1
+
+    def test_http(self):
+        registry, calls, latency = _registry()
+        calls.inc(entity='reservation')
+        httpd = hil_slurm_metrics.start_http_server(0, registry=registry)
+        try:
+            url = 'http://127.0.0.1:%d' % httpd.server_address[1]
+            text = urllib2.urlopen(url + '/metrics').read()
+            assert parse_samples(text)['test_calls_total{entity="reservation"}'] == 1
+            with pytest.raises(urllib2.HTTPError):
+                urllib2.urlopen(url + '/')
+        finally:
+            httpd.shutdown()
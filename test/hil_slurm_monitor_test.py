@@ -0,0 +1,145 @@
+"""
+Reservation monitor tests against the fake HIL server and fake scontrol
+
+The monitor's reserve and release processing runs end to end, with HIL
+provided by fake_hil_server.py and Slurm by fake_scontrol.py.  The HIL
+client package must be installed.
+
+run the tests like this
+py.test hil_slurm_monitor_test.py
+"""
+
+import inspect
+import os
+import pwd
+import sys
+from os.path import realpath, dirname, join
+from time import time
+
+import pytest
+
+testdir = realpath(dirname(inspect.getfile(inspect.currentframe())))
+sys.path.append(join(testdir, '../common'))
+sys.path.append(join(testdir, '../commands'))
+
+pytest.importorskip('hil')
+
+import hil_slurm_client
+import hil_slurm_helpers
+import hil_slurm_monitor
+import hil_slurm_queue
+import ulsr_ib
+from hil_slurm_constants import HIL_RESERVE, HIL_RELEASE, RES_CREATE_FLAGS, RES_CREATE_HIL_FEATURES
+from hil_slurm_metrics import RESERVATION_FAILURES, RESERVATION_NODES
+from hil_slurm_records import format_slurm_time
+from fake_hil_server import FakeHILServer
+from fake_scontrol import FakeScontrol, FakeSlurmState
+
+
+project = 'slurm'
+nodelist = ['slurm-compute%d' % (i + 1) for i in range(4)]
+user = pwd.getpwuid(os.getuid())
+
+
+@pytest.fixture
+def fake_hil():
+    server = FakeHILServer(nodelist, project=project, revert_delay=0.1).start()
+    server.client = hil_slurm_client._hil_client_connect(server.url, 'admin', 'admin')
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def scontrol(tmpdir, monkeypatch):
+    state = FakeSlurmState()
+    state.add_nodes(nodelist, ['HIL'])
+    state.add_partition('HIL_partition', nodelist, exclusive_user=True)
+    scontrol = FakeScontrol(str(tmpdir.join('slurm.json')), state)
+    monkeypatch.setattr(hil_slurm_helpers, 'SCONTROL_CACHE_ENABLE', False)
+    monkeypatch.setattr(hil_slurm_helpers, '_scontrol_cache', None)
+    monkeypatch.setattr(hil_slurm_helpers, '_exec_subprocess_cmd', scontrol.exec_subprocess_cmd)
+
+    # A normal install, with no IB fabric dump
+    monkeypatch.setattr(ulsr_ib, 'DISABLE_IB_LINKS', True)
+    monkeypatch.setattr(ulsr_ib, 'ULSR_IB_LINKINFO_FILE', str(tmpdir.join('iblinkinfo.out')))
+    monkeypatch.setattr(ulsr_ib, 'ULSR_IB_INDEX_CACHE', str(tmpdir.join('ib_index.json')))
+    return scontrol
+
+
+def _create_reservation(restype, t_now):
+    resname = 'flexalloc_MOC_%s_%s_%d_%d' % (restype, user.pw_name, user.pw_uid, t_now)
+    hil_slurm_helpers.create_slurm_reservation(resname, user.pw_name, format_slurm_time(t_now),
+                                               format_slurm_time(t_now + 3600),
+                                               nodes=','.join(nodelist),
+                                               flags=RES_CREATE_FLAGS,
+                                               features=RES_CREATE_HIL_FEATURES)
+    return resname
+
+
+def _singletons(restype):
+    return hil_slurm_helpers.get_hil_reservation_index().singletons(restype)
+
+
+class TestMonitorReserveRelease:
+    """Tests reserve and release processing by the monitor"""
+
+    def test_no_fabric_dump(self, fake_hil, scontrol):
+        reserve_resname = _create_reservation(HIL_RESERVE, int(time()))
+
+        assert hil_slurm_monitor._process_reserve_reservations(
+            fake_hil.client, _singletons(HIL_RESERVE)) == 1
+        assert all(fake_hil.state.nodes[node]['project'] is None for node in nodelist)
+        release_resname = reserve_resname.replace(HIL_RESERVE, HIL_RELEASE, 1)
+        assert hil_slurm_helpers.get_reservation_data(release_resname)
+
+        hil_slurm_helpers.delete_slurm_reservation(reserve_resname)
+        assert hil_slurm_monitor._process_release_reservations(
+            fake_hil.client, _singletons(HIL_RELEASE)) == 1
+        assert all(fake_hil.state.nodes[node]['project'] == project for node in nodelist)
+        assert hil_slurm_helpers.get_hil_reservations() == []
+
+
+    def test_release_create_failure(self, fake_hil, scontrol):
+        t_now = int(time())
+        _create_reservation(HIL_RESERVE, t_now)
+        reserve_res_list = _singletons(HIL_RESERVE)
+        n_failures = RESERVATION_FAILURES.get(operation=HIL_RESERVE)
+        n_observed = RESERVATION_NODES.count(operation=HIL_RESERVE)
+
+        # The release reservation appears after the pass started, so
+        # creating it fails
+        _create_reservation(HIL_RELEASE, t_now)
+        assert hil_slurm_monitor._process_reserve_reservations(
+            fake_hil.client, reserve_res_list) == 0
+        assert RESERVATION_FAILURES.get(operation=HIL_RESERVE) == n_failures + 1
+        assert RESERVATION_NODES.count(operation=HIL_RESERVE) == n_observed
+
+
+class TestMonitorQueue:
+    """Tests queued requests which scontrol rejects"""
+
+    def test_failing_requests(self, scontrol, tmpdir, monkeypatch):
+        monkeypatch.setattr(hil_slurm_monitor, 'ULSR_QUEUE_MAX_ATTEMPTS', 3)
+        queue = hil_slurm_queue.RequestQueue(str(tmpdir.join('queue')))
+        t_now = int(time())
+
+        # A request whose user Slurm does not know, one which ended while
+        # the monitor was down, and one which succeeds
+        for t, username, t_end in ((t_now - 2, 'no-such-user', t_now + 3600),
+                                   (t_now - 1, user.pw_name, t_now - 60),
+                                   (t_now, user.pw_name, t_now + 3600)):
+            queue.put(hil_slurm_queue.QUEUE_CREATE_RESERVATION,
+                      resname='flexalloc_MOC_reserve_%s_%d_%d' % (user.pw_name, user.pw_uid, t),
+                      user=username, t_start_s=format_slurm_time(t),
+                      t_end_s=format_slurm_time(t_end))
+
+        assert hil_slurm_monitor._process_queued_requests(queue) == 1
+        assert [r.attempts for r in queue.get_all()] == [1]
+        assert len(tmpdir.join('queue', 'failed').listdir()) == 1
+
+        assert hil_slurm_monitor._process_queued_requests(queue) == 0
+        assert hil_slurm_monitor._process_queued_requests(queue) == 0
+        assert len(queue) == 0
+        assert len(tmpdir.join('queue', 'failed').listdir()) == 2
+        assert [res.name for res in hil_slurm_helpers.get_hil_reservations()] == \
+            ['flexalloc_MOC_reserve_%s_%d_%d' % (user.pw_name, user.pw_uid, t_now)]
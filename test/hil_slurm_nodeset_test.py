@@ -0,0 +1,86 @@
+"""
+Tests for compact node sets
+
+run the tests like this
+py.test hil_slurm_nodeset_test.py
+"""
+
+import inspect
+import sys
+from os.path import realpath, dirname, join
+
+import hostlist
+import pytest
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_nodeset import NodeSet
+
+
+class TestNodeSet:
+    """Tests node set operations and hostlist conversion"""
+
+    @pytest.mark.parametrize('hostlist_s', [
+        'server1',
+        'server[1-3]',
+        'server[1-3,5,7-9]',
+        'server[08-12]',
+        'node[001-100],gpu[1-4]',
+        'login,server[1-2]',
+        'rack[1-2]node[1-3]',
+        'node1[0-3]',
+        'n[1-2]-ib',
+    ])
+    def test_hostlist_round_trip(self, hostlist_s):
+        nodeset = NodeSet(hostlist_s)
+        names = hostlist.expand_hostlist(hostlist_s)
+        assert sorted(nodeset) == sorted(names)
+        assert len(nodeset) == len(names)
+        assert NodeSet(str(nodeset)) == nodeset
+        assert all(name in nodeset for name in names)
+
+    def test_compact(self):
+        nodeset = NodeSet('server[1-100000]')
+        assert len(nodeset) == 100000
+        assert str(nodeset) == 'server[1-100000]'
+        assert 'server99999' in nodeset
+        assert 'server0' not in nodeset
+        assert 'server099' not in nodeset
+        assert 'other1' not in nodeset
+
+        nodeset.discard('server500')
+        assert str(nodeset) == 'server[1-499,501-100000]'
+        nodeset.add('server500')
+        assert str(nodeset) == 'server[1-100000]'
+
+    def test_from_names(self):
+        nodeset = NodeSet(['server3', 'server1', 'server2', 'server1', 'login'])
+        assert list(nodeset) == ['login', 'server1', 'server2', 'server3']
+        assert str(nodeset) == 'login,server[1-3]'
+        assert NodeSet(nodeset) == nodeset
+        assert not NodeSet()
+        assert not NodeSet('')
+
+    def test_set_operations(self):
+        a = NodeSet('server[1-10],gpu[1-2]')
+        b = NodeSet('server[5-15]')
+        assert str(a | b) == 'gpu[1-2],server[1-15]'
+        assert str(a & b) == 'server[5-10]'
+        assert str(a - b) == 'gpu[1-2],server[1-4]'
+        assert str(b - a) == 'server[11-15]'
+        assert str(a - NodeSet('server[2-3,6]')) == 'gpu[1-2],server[1,4-5,7-10]'
+        assert not a.isdisjoint(b)
+        assert NodeSet('server[11-12]').isdisjoint(a)
+        assert NodeSet('server[2-4]').issubset(a)
+        assert set(a & b) == set(a) & set(b)
+
+        c = NodeSet(a)
+        c |= b
+        c -= ['gpu1']
+        assert str(c) == 'gpu2,server[1-15]'
+        assert str(a) == 'gpu[1-2],server[1-10]'
+
+    def test_bad_range(self):
+        with pytest.raises(ValueError):
+            NodeSet('server[5-1]')
@@ -0,0 +1,88 @@
+"""
+Tests for the partition snapshot
+
+These tests need no Slurm installation; the snapshot is written to a
+pytest temporary directory.
+
+run the tests like this
+py.test hil_slurm_partitions_test.py
+"""
+
+import inspect
+import os
+import sys
+from os.path import realpath, dirname, join
+from time import time
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_records import SlurmPartition
+from hil_slurm_partitions import (hil_partition_problems, update_partition_snapshot,
+                                  load_partition_snapshot)
+from hil_slurm_settings import HIL_PARTITION_PREFIX
+
+
+HIL_PARTITION = HIL_PARTITION_PREFIX + '1'
+
+
+def _partitions(max_time='1-12:30:00'):
+    return [SlurmPartition.from_scontrol({'PartitionName': HIL_PARTITION, 'State': 'UP',
+                                          'Default': 'NO', 'Shared': 'NO',
+                                          'ExclusiveUser': 'YES', 'MaxTime': max_time,
+                                          'Nodes': 'server[1-3]'}),
+            SlurmPartition.from_scontrol({'PartitionName': 'debug', 'State': 'DOWN',
+                                          'Default': 'YES', 'MaxTime': 'UNLIMITED'})]
+
+
+class TestPartitionSnapshot:
+    """Tests writing and loading the partition snapshot"""
+
+    def test_problems(self):
+        hil_partition, debug_partition = _partitions()
+        assert hil_partition_problems(hil_partition) == []
+        problems = hil_partition_problems(debug_partition)
+        assert any('does not match' in p for p in problems)
+        assert any('is not UP' in p for p in problems)
+
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join('partitions.json'))
+        assert update_partition_snapshot(path, _partitions())
+
+        snapshot = load_partition_snapshot(path, 60)
+        assert sorted(snapshot) == sorted(['debug', HIL_PARTITION])
+
+        partition, problems = snapshot[HIL_PARTITION]
+        assert problems == []
+        assert partition.name == HIL_PARTITION
+        assert partition.state == 'UP'
+        assert partition.exclusive_user and not partition.default
+        assert partition.max_time == ((1 * 24 + 12) * 60 + 30) * 60
+        assert partition.nodes == 'server[1-3]'
+        assert isinstance(partition.state, str)
+
+        partition, problems = snapshot['debug']
+        assert partition.max_time is None
+        assert problems == hil_partition_problems(partition)
+
+    def test_rewritten_on_change(self, tmpdir):
+        path = str(tmpdir.join('partitions.json'))
+        assert update_partition_snapshot(path, _partitions())
+
+        # Unchanged partition data only marks the snapshot current
+        os.utime(path, (time() - 120, time() - 120))
+        assert load_partition_snapshot(path, 60) is None
+        assert not update_partition_snapshot(path, _partitions())
+        assert load_partition_snapshot(path, 60) is not None
+
+        assert update_partition_snapshot(path, _partitions(max_time='2-00'))
+        partition, problems = load_partition_snapshot(path, 60)[HIL_PARTITION]
+        assert partition.max_time == 2 * 24 * 60 * 60
+
+    def test_missing_or_corrupt(self, tmpdir):
+        path = tmpdir.join('partitions.json')
+        assert load_partition_snapshot(str(path), 60) is None
+        path.write('{"version": ')
+        assert load_partition_snapshot(str(path), 60) is None
+        assert update_partition_snapshot(str(path), _partitions())
+        assert load_partition_snapshot(str(path), 60) is not None
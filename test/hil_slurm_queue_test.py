@@ -0,0 +1,102 @@
+"""
+Tests for the HIL reservation request queue
+
+These tests need no Slurm or HIL installation; the queue is created in a
+pytest temporary directory.
+
+run the tests like this
+py.test hil_slurm_queue_test.py
+"""
+
+import inspect
+import os
+import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_queue import RequestQueue, QUEUE_CREATE_RESERVATION, QUEUE_DELETE_RESERVATION
+
+
+RESNAME = 'flexalloc_MOC_reserve_centos_1000_1498512332'
+RESNAME2 = 'flexalloc_MOC_reserve_centos_1000_1498512399'
+
+
+def _queue(tmpdir):
+    return RequestQueue(str(tmpdir.join('queue')))
+
+
+class TestRequestQueue:
+    """Tests queueing and draining reservation requests"""
+
+    def test_empty(self, tmpdir):
+        queue = _queue(tmpdir)
+        assert len(queue) == 0
+        assert queue.get_all() == []
+
+    def test_put_get(self, tmpdir):
+        _queue(tmpdir).put(QUEUE_CREATE_RESERVATION, resname=RESNAME, user='centos',
+                           t_start_s='2017-06-26T16:38:52', t_end_s='2017-06-26T17:38:52')
+
+        # A later process (e.g. the monitor) sees the request
+        queue = _queue(tmpdir)
+        assert len(queue) == 1
+        requests = queue.get_all()
+        assert len(requests) == 1
+        request = requests[0]
+        assert request.op == QUEUE_CREATE_RESERVATION
+        assert request.args['resname'] == RESNAME
+        assert request.args['t_end_s'] == '2017-06-26T17:38:52'
+        assert isinstance(request.args['user'], str)
+
+        # Requests stay queued until done
+        assert len(queue.get_all()) == 1
+        request.done()
+        assert len(queue) == 0
+        assert os.listdir(str(tmpdir.join('queue', 'tmp'))) == []
+
+    def test_arrival_order(self, tmpdir):
+        queue = _queue(tmpdir)
+        queue.put(QUEUE_CREATE_RESERVATION, resname=RESNAME)
+        queue.put(QUEUE_DELETE_RESERVATION, resname=RESNAME)
+        queue.put(QUEUE_CREATE_RESERVATION, resname=RESNAME2)
+
+        assert [(r.op, r.args['resname']) for r in queue.get_all()] == \
+            [(QUEUE_CREATE_RESERVATION, RESNAME), (QUEUE_DELETE_RESERVATION, RESNAME),
+             (QUEUE_CREATE_RESERVATION, RESNAME2)]
+
+    def test_undecodable(self, tmpdir):
+        queue = _queue(tmpdir)
+        queue.put(QUEUE_CREATE_RESERVATION, resname=RESNAME)
+        tmpdir.join('queue', 'new', '0000000000.000000_1_00000000.json').write('{"op": ')
+
+        requests = queue.get_all()
+        assert [r.args['resname'] for r in requests] == [RESNAME]
+        assert len(queue) == 1
+        assert os.listdir(str(tmpdir.join('queue', 'failed'))) == \
+            ['0000000000.000000_1_00000000.json']
+
+    def test_fail(self, tmpdir):
+        queue = _queue(tmpdir)
+        queue.put('unknown_op', resname=RESNAME)
+
+        queue.get_all()[0].fail()
+        assert len(queue) == 0
+        assert len(os.listdir(str(tmpdir.join('queue', 'failed')))) == 1
+
+    def test_retry(self, tmpdir):
+        queue = _queue(tmpdir)
+        queue.put(QUEUE_CREATE_RESERVATION, resname=RESNAME)
+        queue.put(QUEUE_CREATE_RESERVATION, resname=RESNAME2)
+
+        request = queue.get_all()[0]
+        assert request.attempts == 0
+        assert request.retry() == 1
+        assert request.retry() == 2
+
+        # The attempt count is kept, in the request's place in arrival order
+        requests = queue.get_all()
+        assert [(r.args['resname'], r.attempts) for r in requests] == [(RESNAME, 2), (RESNAME2, 0)]
+        assert requests[0].t_queued <= requests[1].t_queued
+        assert os.listdir(str(tmpdir.join('queue', 'tmp'))) == []
@@ -0,0 +1,121 @@
+"""
+Tests for the Slurm reservation, job, and partition records
+
+run the tests like this
+py.test hil_slurm_records_test.py
+"""
+
+import inspect
+import sys
+import pytest
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_records import (SlurmReservation, SlurmJob, SlurmPartition, HILReservationIndex,
+                               parse_slurm_duration, parse_slurm_time, format_slurm_time)
+
+
+RESNAME = 'flexalloc_MOC_reserve_centos_1000_1498512332'
+
+
+class TestParsers:
+    """Tests time and duration parsing"""
+
+    @pytest.mark.parametrize('duration_s, seconds', [
+        ('UNLIMITED', None),
+        ('(null)', None),
+        ('30', 30 * 60),
+        ('30:15', 30 * 60 + 15),
+        ('06:00:00', 6 * 3600),
+        ('2-12', 2 * 86400 + 12 * 3600),
+        ('2-12:30', 2 * 86400 + 12 * 3600 + 30 * 60),
+        ('1-00:00:00', 86400),
+        ('10-01:02:03', 10 * 86400 + 3600 + 2 * 60 + 3),
+        ])
+    def test_duration(self, duration_s, seconds):
+        assert parse_slurm_duration(duration_s) == seconds
+
+    def test_bad_duration(self):
+        with pytest.raises(ValueError):
+            parse_slurm_duration('1:2:3:4')
+        with pytest.raises(ValueError):
+            parse_slurm_duration('one day')
+
+    def test_time_round_trip(self):
+        assert parse_slurm_time('Unknown') is None
+        t = parse_slurm_time('2017-06-26T21:25:32')
+        assert format_slurm_time(t) == '2017-06-26T21:25:32'
+
+
+class TestRecords:
+    """Tests records built from 'scontrol show' data"""
+
+    def test_reservation(self):
+        res = SlurmReservation.from_scontrol({'ReservationName': RESNAME,
+                                              'StartTime': '2017-06-26T21:25:32',
+                                              'EndTime': '2017-06-27T21:25:32',
+                                              'Nodes': 'server[1-3]', 'Users': 'centos',
+                                              'Features': '(null)'})
+        assert list(res.nodeset) == ['server1', 'server2', 'server3']
+        assert res.t_end - res.t_start == 86400
+        assert (res.restype, res.user, res.uid, res.time_s) == ('reserve', 'centos',
+                                                                '1000', '1498512332')
+        assert res.features is None
+        assert not hasattr(res, '__dict__')
+
+    def test_non_hil_reservation(self):
+        res = SlurmReservation.from_scontrol({'ReservationName': 'maint_window',
+                                              'Nodes': '(null)'})
+        assert res.prefix is None
+        assert not res.nodeset
+
+    def test_job(self):
+        job = SlurmJob.from_scontrol({'JobId': '12', 'JobName': 'hil_release',
+                                      'UserId': 'centos(1000)', 'Reservation': '(null)',
+                                      'StartTime': '2017-06-26T21:25:32',
+                                      'EndTime': 'Unknown', 'TimeLimit': '1-00:00:00'})
+        assert job.user == 'centos'
+        assert job.reservation is None
+        assert job.t_end is None
+        assert job.time_limit == 86400
+
+    def test_partition(self):
+        partition = SlurmPartition.from_scontrol({'PartitionName': 'HIL_partition1',
+                                                  'State': 'UP', 'Default': 'NO',
+                                                  'OverSubscribe': 'NO',
+                                                  'ExclusiveUser': 'YES',
+                                                  'MaxTime': '2-00:00:00'})
+        assert partition.shared == 'NO'
+        assert partition.exclusive_user
+        assert not partition.default
+        assert partition.max_time == 2 * 86400
+
+
+def _hil_res(restype, time_s, user='centos', uid='1000'):
+    name = 'flexalloc_MOC_%s_%s_%s_%s' % (restype, user, uid, time_s)
+    return SlurmReservation(name, users=user, nodes='server1')
+
+
+class TestHILReservationIndex:
+    """Tests reserve / release pairing through the name component index"""
+
+    def test_singletons(self):
+        reserved = _hil_res('reserve', '100')
+        released = _hil_res('release', '100')
+        new_reserve = _hil_res('reserve', '200')
+        orphan_release = _hil_res('release', '300')
+        other_user = _hil_res('release', '200', user='alice', uid='1001')
+
+        index = HILReservationIndex([reserved, released, new_reserve,
+                                     orphan_release, other_user])
+        assert len(index) == 5
+        assert index.pair(reserved) is released
+        assert index.pair(released) is reserved
+        assert index.pair(new_reserve) is None
+        assert index.get(orphan_release.name) is orphan_release
+
+        assert index.singletons('reserve') == [new_reserve]
+        assert sorted(index.singletons('release'), key=lambda r: r.name) == \
+            sorted([orphan_release, other_user], key=lambda r: r.name)
@@ -0,0 +1,107 @@
+"""
+Tests for the HIL reservation scheduler
+
+run the tests like this
+py.test hil_slurm_scheduler_test.py
+"""
+
+import inspect
+import sys
+import threading
+import time
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+from hil_slurm_scheduler import ReservationScheduler, ReservationTask
+
+
+class _Recorder(object):
+    """Records task start / end order and the peak number of running tasks"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.running = {}
+        self.peak = 0
+        self.peak_by_user = {}
+
+    def task(self, name, user, nodes, priority, delay=0.05, error=None):
+        def fn():
+            with self.lock:
+                self.events.append(('start', name))
+                self.running[name] = user
+                self.peak = max(self.peak, len(self.running))
+                n_user = sum(1 for u in self.running.itervalues() if u == user)
+                self.peak_by_user[user] = max(self.peak_by_user.get(user, 0), n_user)
+            time.sleep(delay)
+            with self.lock:
+                self.events.append(('end', name))
+                del self.running[name]
+            if error:
+                raise error
+            return 1
+        return ReservationTask(name, user, nodes, priority, fn)
+
+    def index(self, event, name):
+        return self.events.index((event, name))
+
+
+class TestReservationScheduler:
+    """Tests caps, node conflicts and priority order"""
+
+    def test_caps(self):
+        r = _Recorder()
+        tasks = [r.task('res%d' % i, 'user%d' % (i % 2), ['server%d' % i], (1, i))
+                 for i in range(8)]
+        results, failures = ReservationScheduler(3, max_per_user=1).run(tasks)
+        assert not failures
+        assert sorted(results) == sorted(task.name for task in tasks)
+        assert r.peak == 2
+        assert max(r.peak_by_user.values()) == 1
+
+        r = _Recorder()
+        tasks = [r.task('res%d' % i, 'user%d' % i, ['server%d' % i], (1, i)) for i in range(8)]
+        ReservationScheduler(3).run(tasks)
+        assert r.peak == 3
+
+    def test_node_conflicts(self):
+        r = _Recorder()
+        tasks = [r.task('reserve1', 'alice', ['server1', 'server2'], (1, 10)),
+                 r.task('release1', 'bob', ['server2'], (0, 0)),
+                 r.task('reserve2', 'carol', ['server3'], (1, 20))]
+        ReservationScheduler(4).run(tasks)
+
+        # The release runs first, and the reserve sharing its node waits for
+        # it to finish; the unrelated reserve runs alongside
+        assert r.index('end', 'release1') < r.index('start', 'reserve1')
+        assert r.index('start', 'reserve2') < r.index('end', 'release1')
+
+    def test_priority_order(self):
+        r = _Recorder()
+        tasks = [r.task('reserve_late', 'alice', ['server1'], (1, 20)),
+                 r.task('reserve_early', 'alice', ['server2'], (1, 10)),
+                 r.task('release', 'alice', ['server3'], (0, 30))]
+        ReservationScheduler(1).run(tasks)
+        assert [name for event, name in r.events if event == 'start'] == \
+            ['release', 'reserve_early', 'reserve_late']
+
+    def test_passed_over_nodes_are_claimed(self):
+        # The release is held back by the per-user cap; the reserve of the
+        # same node must not overtake it
+        r = _Recorder()
+        tasks = [r.task('release_a', 'alice', ['server1'], (0, 0)),
+                 r.task('release_b', 'alice', ['server2'], (0, 1)),
+                 r.task('reserve', 'bob', ['server2'], (1, 0))]
+        ReservationScheduler(4, max_per_user=1).run(tasks)
+        assert r.index('end', 'release_b') < r.index('start', 'reserve')
+
+    def test_failures(self):
+        r = _Recorder()
+        tasks = [r.task('ok', 'alice', ['server1'], (1, 0)),
+                 r.task('bad', 'bob', ['server2'], (1, 1), error=ValueError('stuck'))]
+        results, failures = ReservationScheduler(2).run(tasks)
+        assert results == {'ok': 1}
+        assert isinstance(failures['bad'], ValueError)
+        assert ReservationScheduler(2).run([]) == ({}, {})
@@ -0,0 +1,110 @@
+"""
+Tests for reservation tracing spans, export and critical path analysis
+
+run the tests like this
+py.test hil_slurm_trace_test.py
+"""
+
+import inspect
+import sys
+from multiprocessing.pool import ThreadPool
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import pytest
+
+import hil_slurm_trace
+from hil_slurm_trace import (trace, span, traced, propagate, set_trace_id, load_spans,
+                             critical_path, reservation_trace_id)
+
+
+RESERVE_RESNAME = 'flexalloc_MOC_reserve_centos_1000_1498512332'
+RELEASE_RESNAME = 'flexalloc_MOC_release_centos_1000_1498512332'
+
+
+@pytest.fixture
+def trace_file(tmpdir, monkeypatch):
+    path = str(tmpdir.join('trace.jsonl'))
+    monkeypatch.setattr(hil_slurm_trace, 'ULSR_TRACE_FILE', path)
+    return path
+
+
+@traced('test.show_node', attrs=('node',))
+def _show_node(hil_client, node):
+    return node
+
+
+class TestSpans:
+    """Tests span recording, propagation and export"""
+
+    def test_trace_id(self):
+        assert reservation_trace_id(RELEASE_RESNAME) == RESERVE_RESNAME
+        assert reservation_trace_id(RESERVE_RESNAME) == RESERVE_RESNAME
+
+    def test_untraced(self, trace_file):
+        with span('outside') as s:
+            s.set(ignored=True)
+        assert _show_node(None, 'server1') == 'server1'
+        with trace():
+            with span('unnamed'):
+                pass
+        with pytest.raises(IOError):
+            load_spans(trace_file)
+
+    def test_export(self, trace_file):
+        with trace():
+            with span('prolog', job_id='12'):
+                _show_node(None, node='server1')
+                set_trace_id(RESERVE_RESNAME)
+            with pytest.raises(ValueError):
+                with span('failing'):
+                    raise ValueError('bad')
+
+        with trace(RELEASE_RESNAME):
+            with span('monitor.release'):
+                pool = ThreadPool(2)
+                pool.map(propagate(lambda node: _show_node(None, node)), ['server1', 'server2'])
+                pool.close()
+
+        spans = load_spans(trace_file, RESERVE_RESNAME)
+        by_name = dict((s['name'], s) for s in spans)
+        assert len(spans) == 6
+        assert set(s['trace_id'] for s in spans) == set([RESERVE_RESNAME])
+
+        prolog = by_name['prolog']
+        assert prolog['parent_id'] is None
+        assert prolog['attrs'] == {'job_id': '12'}
+        assert by_name['failing']['error'] == 'ValueError: bad'
+
+        show_spans = [s for s in spans if s['name'] == 'test.show_node']
+        release_id = by_name['monitor.release']['span_id']
+        assert sorted(s['parent_id'] for s in show_spans) == \
+            sorted([prolog['span_id'], release_id, release_id])
+        assert set(s['attrs']['node'] for s in show_spans) == set(['server1', 'server2'])
+
+
+def _span(span_id, parent_id, start, end):
+    return {'span_id': span_id, 'parent_id': parent_id, 'name': span_id,
+            'start': start, 'end': end, 'duration': end - start, 'attrs': {}}
+
+
+class TestCriticalPath:
+    """Tests critical path attribution"""
+
+    def test_critical_path(self):
+        spans = [_span('prolog', None, 0, 1),
+                 _span('scontrol', 'prolog', 0.2, 0.8),
+                 _span('monitor', None, 10, 20),
+                 _span('power_off', 'monitor', 10, 12),
+                 _span('detach_a', 'monitor', 12, 15),
+                 _span('detach_b', 'monitor', 12, 18),
+                 _span('scontrol2', 'monitor', 18.5, 19.5)]
+        path = [(s['span_id'] if s else None, t_start, t_end)
+                for s, t_start, t_end in critical_path(spans)]
+        assert path == [('prolog', 0, 0.2), ('scontrol', 0.2, 0.8), ('prolog', 0.8, 1),
+                        (None, 1, 10),
+                        ('power_off', 10, 12), ('detach_b', 12, 18), ('monitor', 18, 18.5),
+                        ('scontrol2', 18.5, 19.5), ('monitor', 19.5, 20)]
+        assert critical_path([]) == []
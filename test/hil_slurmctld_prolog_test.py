@@ -0,0 +1,85 @@
+"""
+Tests for the slurmctld prolog / epilog fast path
+
+Non-HIL jobs must be rejected from the environment alone, without running
+scontrol or importing the HIL support modules.
+
+run the tests like this
+py.test hil_slurmctld_prolog_test.py
+"""
+
+import inspect
+import os
+import pwd
+import subprocess
+import sys
+import time
+from os.path import realpath, dirname, join
+
+testdir = realpath(dirname(inspect.getfile(inspect.currentframe())))
+prolog = join(testdir, '../commands/hil_slurmctld_prolog.py')
+
+# Run the prolog as __main__, then report whether the helpers were imported
+RUN_PROLOG = ('import runpy, sys\n'
+              'sys.argv = [%r, %%r]\n'
+              'try:\n'
+              '    runpy.run_path(%r, run_name="__main__")\n'
+              'except SystemExit as e:\n'
+              '    print e.code\n'
+              'print "hil_slurm_helpers" in sys.modules\n' % (prolog, prolog))
+
+
+def _run_prolog(flag, jobname, partition):
+    env = dict(os.environ, SLURM_JOB_NAME=jobname, SLURM_JOB_PARTITION=partition)
+    output = subprocess.check_output([sys.executable, '-c', RUN_PROLOG % flag], env=env)
+    return output.split()
+
+
+class TestPrologFastPath:
+    """Tests rejection of non-HIL jobs before any HIL module is imported"""
+
+    def test_non_hil_jobs(self):
+        assert _run_prolog('--hil_prolog', 'simulation', 'HIL_partition1') == ['0', 'False']
+        assert _run_prolog('--hil_epilog', 'simulation', 'HIL_partition1') == ['0', 'False']
+        assert _run_prolog('--hil_prolog', 'hil_reserve', 'batch') == ['0', 'False']
+
+    def test_command_phase(self):
+        # hil_release is acted on only by the epilog, hil_reserve by the prolog
+        assert _run_prolog('--hil_prolog', 'hil_release', 'HIL_partition1') == ['0', 'False']
+        assert _run_prolog('--hil_epilog', 'hil_reserve', 'HIL_partition1') == ['0', 'False']
+
+
+class TestOverlapCheck:
+    """Tests the reserve overlap check against the fake scontrol"""
+
+    def test_job_nodes(self, tmpdir, monkeypatch):
+        sys.path.append(join(testdir, '../common'))
+        sys.path.append(join(testdir, '../commands'))
+        import hil_slurm_helpers
+        import hil_slurmctld_prolog
+        from hil_slurm_records import SlurmJob, format_slurm_time
+        from fake_scontrol import FakeScontrol, FakeSlurmState
+
+        user = pwd.getpwuid(os.getuid())
+        t_now = int(time.time())
+        state = FakeSlurmState()
+        state.add_nodes('server[1-4]', ['HIL'])
+        state.add_partition('HIL_partition', 'server[1-4]', exclusive_user=True)
+        for restype in ('reserve', 'release'):
+            state.add_reservation('flexalloc_MOC_%s_%s_%d_%d' % (restype, user.pw_name,
+                                                                 user.pw_uid, t_now - 60),
+                                  user.pw_name, 'server[1-2]', t_now - 60, t_now + 3600,
+                                  ['IGNORE_JOBS', 'MAINT'], 'HIL')
+        scontrol = FakeScontrol(str(tmpdir.join('slurm.json')), state)
+        monkeypatch.setattr(hil_slurm_helpers, 'SCONTROL_CACHE_ENABLE', False)
+        monkeypatch.setattr(hil_slurm_helpers, '_exec_subprocess_cmd',
+                            scontrol.exec_subprocess_cmd)
+
+        resname = 'flexalloc_MOC_reserve_%s_%d_%d' % (user.pw_name, user.pw_uid, t_now)
+        t_start_s, t_end_s = format_slurm_time(t_now), format_slurm_time(t_now + 600)
+
+        # A HIL reservation elsewhere in the partition does not conflict
+        job = SlurmJob(1, name='hil_reserve', partition='HIL_partition', nodes='server[3-4]')
+        assert hil_slurmctld_prolog._check_hil_overlap(resname, job, t_start_s, t_end_s)
+        job.nodes = 'server[2-3]'
+        assert not hil_slurmctld_prolog._check_hil_overlap(resname, job, t_start_s, t_end_s)
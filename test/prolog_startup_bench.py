@@ -0,0 +1,55 @@
+"""
+Slurm control daemon prolog / epilog startup time measurement
+
+Runs hil_slurmctld_prolog.py as slurmctld does, with the environment of a
+job which is not a HIL reservation command, and reports the mean wall
+clock time per run.  For comparison, the bare interpreter startup time and
+the time to import the modules loaded for HIL reservation commands are
+also reported.
+
+run like this
+python prolog_startup_bench.py --runs 50
+"""
+
+import argparse
+import inspect
+import os
+import subprocess
+import sys
+import time
+from os.path import realpath, dirname, join
+
+testdir = realpath(dirname(inspect.getfile(inspect.currentframe())))
+prolog = join(testdir, '../commands/hil_slurmctld_prolog.py')
+libdir = join(testdir, '../common')
+
+NON_HIL_ENV = {'SLURM_JOB_NAME': 'simulation', 'SLURM_JOB_PARTITION': 'batch',
+               'SLURM_JOB_ID': '1234', 'SLURM_JOB_USER': 'centos'}
+
+FULL_IMPORT = ('import sys; sys.path.append(%r); import argparse, logging; '
+               'import hil_slurm_helpers, hil_slurm_records, hil_slurm_daemon, '
+               'hil_slurm_metrics, hil_slurm_trace' % libdir)
+
+
+def _measure(label, cmd, env, runs):
+    t_start = time.time()
+    for i in range(runs):
+        subprocess.check_call(cmd, env=env)
+    elapsed = (time.time() - t_start) / runs
+    print '%-40s %8.1f ms' % (label, elapsed * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20, help='Runs per measurement')
+    args = parser.parse_args()
+
+    env = dict(os.environ, **NON_HIL_ENV)
+    _measure('Interpreter startup', [sys.executable, '-c', 'pass'], env, args.runs)
+    _measure('Prolog, non-HIL job', [sys.executable, prolog, '--hil_prolog'], env, args.runs)
+    _measure('Epilog, non-HIL job', [sys.executable, prolog, '--hil_epilog'], env, args.runs)
+    _measure('HIL command module imports', [sys.executable, '-c', FULL_IMPORT], env, args.runs)
+
+
+if __name__ == '__main__':
+    main()
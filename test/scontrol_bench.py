@@ -0,0 +1,86 @@
+"""
+Slurm helper throughput measurement against the fake scontrol
+
+Generates a synthetic cluster, then times the 'scontrol show' parsing and
+HIL reservation filtering of the Slurm helpers, and the Slurm side of a
+monitor pass (reservation index, singletons and the conflict sweep), for
+the text and JSON show backends.  The fake scontrol runs in-process, or
+as an executable with --exec, which includes the process start time.
+
+run like this
+python scontrol_bench.py --nodes 4096 --reservations 2000
+"""
+
+import argparse
+import inspect
+import shutil
+import sys
+import tempfile
+import time
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import hil_slurm_helpers
+from hil_slurm_constants import HIL_RESERVE, HIL_RELEASE
+from hil_slurm_intervals import ReservationIntervalIndex
+from fake_scontrol import FakeScontrol, FakeSlurmState
+
+
+def _measure(label, fn, repeat):
+    t_start = time.time()
+    for i in range(repeat):
+        n = fn()
+    elapsed = (time.time() - t_start) / repeat
+    print '%-36s %8.1f ms  %6d records' % (label, elapsed * 1000, n)
+
+
+def _monitor_pass():
+    index = hil_slurm_helpers.get_hil_reservation_index()
+    singletons = index.singletons(HIL_RESERVE) + index.singletons(HIL_RELEASE)
+    ReservationIntervalIndex(index).sweep(time.time())
+    return len(singletons)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=4096, help='Number of nodes')
+    parser.add_argument('--reservations', type=int, default=2000,
+                        help='Number of reservations generated')
+    parser.add_argument('--jobs', type=int, default=1000, help='Number of jobs')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    parser.add_argument('--exec', dest='executable', action='store_true', default=False,
+                        help='Run the fake scontrol as an executable')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    state = FakeSlurmState.generate(args.nodes, args.reservations, args.jobs)
+    scontrol = FakeScontrol(join(tmpdir, 'slurm.json'), state)
+    print '%d nodes, %d reservations, %d jobs' % (len(state.nodes), len(state.reservations),
+                                                  len(state.jobs))
+
+    hil_slurm_helpers.SCONTROL_CACHE_ENABLE = False
+    if args.executable:
+        hil_slurm_helpers.SLURM_INSTALL_DIR = scontrol.install(tmpdir)
+    else:
+        hil_slurm_helpers._exec_subprocess_cmd = scontrol.exec_subprocess_cmd
+
+    for backend in ('text', 'json'):
+        hil_slurm_helpers.SCONTROL_SHOW_BACKEND = backend
+        _measure('show reservation, %s' % backend,
+                 lambda: len(hil_slurm_helpers.exec_scontrol_show_cmd('reservation', None)[0]),
+                 args.repeat)
+        _measure('get_hil_reservations, %s' % backend,
+                 lambda: len(hil_slurm_helpers.get_hil_reservations()), args.repeat)
+        _measure('get_partition_data, %s' % backend,
+                 lambda: len(hil_slurm_helpers.get_partition_data(None)), args.repeat)
+        _measure('get_job_data, %s' % backend,
+                 lambda: len(hil_slurm_helpers.get_job_data(None)), args.repeat)
+        _measure('monitor pass, %s' % backend, _monitor_pass, args.repeat)
+
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
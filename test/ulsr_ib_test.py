@@ -0,0 +1,152 @@
+"""
+Tests for the Infiniband fabric index and link engine
+
+These tests need no Infiniband fabric; the fabric dump and index cache
+are written to a pytest temporary directory, and the link engine runs the
+stand-in commands in fake_ib_fabric.py.
+
+run the tests like this
+py.test ulsr_ib_test.py
+"""
+
+import inspect
+import json
+import os
+import sys
+from os.path import realpath, dirname, join
+
+libdir = realpath(join(dirname(inspect.getfile(inspect.currentframe())), '../common'))
+sys.path.append(libdir)
+
+import ulsr_ib
+from fake_ib_fabric import write_fabric, read_fabric, command
+from ulsr_ib import (parse_iblinkinfo_line, IBFabricIndex, load_fabric_index, IBLinkEngine,
+                     IB_LINK_DISABLE, IB_LINK_ENABLE, update_infiniband,
+                     exec_subprocess_cmd)
+
+
+LEAF = '0xf4521403007cbfd0'
+SPINE = '0xf4521403007c0001'
+
+IBLINKINFO = '''\
+%(leaf)s "SwitchIB Mellanox Technologies" 3 11[  ] ==( 4X 25.78125 Gbps Active/  LinkUp)==>  0xf4521403007cc065 14 1[  ] "node065 HCA-1" ( )
+%(leaf)s "SwitchIB Mellanox Technologies" 3 12[  ] ==( 4X 25.78125 Gbps Active/  LinkUp)==>  0xf4521403007cc066 15 1[  ] "node066 HCA-1" ( )
+%(leaf)s "SwitchIB Mellanox Technologies" 3 13[  ] ==(  Down/ Polling)==>             [  ] "" ( )
+%(leaf)s "SwitchIB Mellanox Technologies" 3 36[  ] ==( 4X 25.78125 Gbps Active/  LinkUp)==>  %(spine)s 1 1[  ] "SwitchIB Spine" ( )
+%(spine)s "SwitchIB Spine" 1 1[  ] ==( 4X 25.78125 Gbps Active/  LinkUp)==>  %(leaf)s 3 36[  ] "SwitchIB Mellanox Technologies" ( )
+%(spine)s "SwitchIB Spine" 1 2[  ] ==( 4X 25.78125 Gbps Active/  LinkUp)==>  0xf4521403007cc067 16 1[  ] "node067 mlx5_0" ( )
+''' % {'leaf': LEAF, 'spine': SPINE}
+
+
+def _dump(tmpdir, text=IBLINKINFO):
+    path = tmpdir.join('iblinkinfo.out')
+    path.write(text)
+    return str(path), str(tmpdir.join('ib_fabric_index.json'))
+
+
+class TestFabricIndex:
+    """Tests parsing the fabric dump and caching its index"""
+
+    def test_parse_line(self):
+        lines = IBLINKINFO.splitlines()
+        assert parse_iblinkinfo_line(lines[0]) == (LEAF, 11, '0xf4521403007cc065', 'node065')
+        assert parse_iblinkinfo_line(lines[2]) is None
+        assert parse_iblinkinfo_line('node065: ' + lines[1]) == \
+            (LEAF, 12, '0xf4521403007cc066', 'node066')
+        assert parse_iblinkinfo_line('Switch: 0xf4521403007cbfd0 SwitchIB') is None
+
+    def test_index(self):
+        index = IBFabricIndex.from_lines(iter(IBLINKINFO.splitlines()))
+        assert index.ports == {'node065': (LEAF, 11), 'node066': (LEAF, 12),
+                               'node067': (SPINE, 2)}
+
+        found, missing = index.lookup(['node065', 'node067', 'node099'])
+        assert found == {'node065': (LEAF, 11), 'node067': (SPINE, 2)}
+        assert missing == ['node099']
+        assert index.by_switch(['node066', 'node065', 'node067']) == {LEAF: [11, 12],
+                                                                     SPINE: [2]}
+
+    def test_cache(self, tmpdir):
+        dump_path, cache_path = _dump(tmpdir)
+        assert len(load_fabric_index(dump_path, cache_path)) == 3
+
+        # While the dump is unchanged, the cached index is used
+        with open(cache_path) as f:
+            cache = json.load(f)
+        cache['ports']['cached'] = [LEAF, 1]
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f)
+        assert 'cached' in load_fabric_index(dump_path, cache_path).ports
+
+        # A touched but unchanged dump is not parsed again
+        st = os.stat(dump_path)
+        os.utime(dump_path, (st.st_atime, st.st_mtime + 10))
+        assert 'cached' in load_fabric_index(dump_path, cache_path).ports
+
+        # A changed dump is
+        _dump(tmpdir, IBLINKINFO.replace('node066', 'node166'))
+        os.utime(dump_path, (st.st_atime, st.st_mtime + 20))
+        index = load_fabric_index(dump_path, cache_path)
+        assert 'cached' not in index.ports
+        assert sorted(index.ports) == ['node065', 'node067', 'node166']
+
+
+def _fabric(tmpdir, n_switches=4, n_ports=6, **kwargs):
+    switches = dict(('0xf45214030000%04x' % s,
+                     dict((p, 'node%02d%02d' % (s, p)) for p in range(1, n_ports + 1)))
+                    for s in range(n_switches))
+    state = write_fabric(str(tmpdir.join('fabric.json')), switches, **kwargs)
+    engine = IBLinkEngine(iblinkinfo_cmd=command(state, 'iblinkinfo'),
+                          ibportstate_cmd=command(state, 'ibportstate'),
+                          concurrency=3, verify_timeout=0)
+    return state, engine
+
+
+def _enabled(state):
+    return sorted(port['node'] for ports in read_fabric(state).itervalues()
+                  for port in ports.itervalues() if port['enabled'])
+
+
+class TestIBLinkEngine:
+    """Tests disabling and enabling links with stand-in IB commands"""
+
+    def test_disable_enable(self, tmpdir):
+        state, engine = _fabric(tmpdir)
+        stdout_data, stderr_data = exec_subprocess_cmd(engine.iblinkinfo_cmd + ['-l'])
+        index = IBFabricIndex.from_lines(iter(stdout_data.splitlines()))
+        assert len(index) == 24
+
+        nodes = ['node0001', 'node0002', 'node0105', 'node0303', 'node9999']
+        assert update_infiniband(nodes, IB_LINK_DISABLE, engine=engine, index=index) == {}
+        assert len(_enabled(state)) == 20
+        assert not set(nodes) & set(_enabled(state))
+
+        states = engine.link_states()
+        assert states[('0xf452140300000000', 1)] is False
+        assert states[('0xf452140300000000', 3)] is True
+
+        assert update_infiniband(nodes, IB_LINK_ENABLE, engine=engine, index=index) == {}
+        assert len(_enabled(state)) == 24
+
+    def test_no_fabric_dump(self, tmpdir, monkeypatch):
+        state, engine = _fabric(tmpdir)
+        monkeypatch.setattr(ulsr_ib, 'DISABLE_IB_LINKS', True)
+        monkeypatch.setattr(ulsr_ib, 'ULSR_IB_LINKINFO_FILE', str(tmpdir.join('missing.out')))
+        monkeypatch.setattr(ulsr_ib, 'ULSR_IB_INDEX_CACHE', str(tmpdir.join('missing.json')))
+
+        # Links are not managed, rather than failed
+        assert update_infiniband(['node0001', 'node0002'], IB_LINK_DISABLE, engine=engine) == {}
+        assert len(_enabled(state)) == 24
+
+    def test_failures(self, tmpdir):
+        state, engine = _fabric(tmpdir, failing=[('0xf452140300000001', 2)],
+                                stuck=[('0xf452140300000002', 4)])
+        failures = engine.set_links({'0xf452140300000001': [1, 2],
+                                     '0xf452140300000002': [3, 4]}, IB_LINK_DISABLE)
+        assert sorted(failures) == [('0xf452140300000001', 2), ('0xf452140300000002', 4)]
+        assert 'query failed' in failures[('0xf452140300000001', 2)]
+        assert failures[('0xf452140300000002', 4)] == 'link not down'
+        assert _enabled(state) == sorted(set('node%02d%02d' % (s, p) for s in range(4)
+                                             for p in range(1, 7)) -
+                                         set(['node0101', 'node0203']))
+